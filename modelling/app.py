@@ -3,30 +3,47 @@ import cv2
 import time
 import base64
 from flask import Flask, render_template_string, request, jsonify
-from ultralytics import YOLO
-import supervision as sv
 import os
-import json, joblib, pandas as pd
-from PIL import Image
-import io, base64
-import numpy as np
-from flask import request, jsonify
-from datetime import datetime
+import json, joblib
+import hmac, queue, struct, threading
+from inference_scheduler import InferenceScheduler
+from model_registry import ModelRegistry, ModelNotReady
+from latency_controller import SLO_IMGSZ_STEPS
+from camera_sessions import SessionRegistry
+from door_roi import DOOR_ROI_BAND, DoorROI
+from tiling import TILED_INFERENCE, Tiler
+from frame_gate import FrameGate, FrameDropped
+from metrics import LatencyMetrics, PROMETHEUS_CONTENT_TYPE, StageTimer, metric_lines
+from forecasting import DEFAULT_CAPACITY, ForecastCache, Forecaster
+from priors_index import PriorsIndex, artifact_version
+from feature_builder import FeatureBuilder
+from forecast_tables import FORECAST_TABLES, ForecastTables
+from forecast_state import BusForecasts
+
+# WebSocket frame channel (opsional); tanpa flask-sock halaman kamera fallback ke HTTP /process
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 6 * 1024 * 1024  # 6MB per request
+sock = Sock(app) if Sock is not None else None
 
 
-# Initialize YOLO model and tracker
-print("🚀 Loading YOLO model...")
-model = YOLO("yolov8n.pt")
-print("✅ YOLO model loaded successfully!")
+# YOLO model: dimuat sekali di background + warm-up, /api/ready 503 sampai siap
+best_weight = os.environ.get("DETECTOR_WEIGHTS", "best_tj_crowd_model.pt")  # ganti ke path best.pt kamu kalau berbeda
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # /admin/* butuh header X-Admin-Token; tanpa token /admin/* ditutup (403)
+MODEL_DIR = os.environ.get("MODEL_DIR")  # reload hanya menerima weights di folder ini (default: folder best_weight)
+model_registry = ModelRegistry(best_weight, fallback="yolov8n.pt", warmup_imgsz=SLO_IMGSZ_STEPS, model_dir=MODEL_DIR)
+model_registry.start()
 
-print("🚀 Loading YOLO model...")
-import os
-best_weight = "best_tj_crowd_model.pt"  # ganti ke path best.pt kamu kalau berbeda
-model = YOLO(best_weight if os.path.exists(best_weight) else "yolov8n.pt")
-print("✅ YOLO model loaded successfully!")
+# Semua request /process berbagi satu scheduler: frame dari banyak kamera digabung jadi satu batch;
+# tiap batch memakai detector yang aktif saat itu (hot swap tanpa menjatuhkan request)
+inference_scheduler = InferenceScheduler(model_registry.predict)
+print(f"✅ Inference scheduler ready (max batch {inference_scheduler.max_batch_size}, "
+      f"window {inference_scheduler.max_wait * 1000:.0f} ms)")
 
 
 
@@ -36,78 +53,172 @@ FEATURES_PATH       = "features.json"          # daftar kolom fitur
 PRIORS_PATH         = "priors_lookup.csv"      # opsional
 STOPS_NB_PATH       = "stops_nb.csv"           # opsional
 STOPS_SB_PATH       = "stops_sb.csv"           # opsional
+DWELL_H_PATH        = "dwell_lookup_h.csv"     # opsional, dwell per (arah, halte, jam)
+DWELL_WE_PATH       = "dwell_lookup_we.csv"    # opsional, dwell per (arah, halte, weekend)
+DWELL_SX_PATH       = "dwell_lookup_sx.csv"    # opsional, dwell per (arah, halte)
+PRIORS_INDEX_PATH   = "priors_index.npz"       # cache hasil kompilasi CSV di atas (dibuat otomatis)
 
-forecast_model = None
-forecast_features = None
-priors_df = None
-stops_nb = None
-stops_sb = None
+FORECAST_ARTIFACT_PATHS = (FORECAST_MODEL_PATH, FEATURES_PATH, PRIORS_PATH, STOPS_NB_PATH, STOPS_SB_PATH,
+                           DWELL_H_PATH, DWELL_WE_PATH, DWELL_SX_PATH)
+FORECAST_ARTIFACT_CHECK_S = float(os.environ.get("FORECAST_ARTIFACT_CHECK_S", "5"))  # cek mtime artefak
+FORECAST_BATCH_MAX = int(os.environ.get("FORECAST_BATCH_MAX", "1000"))  # bus per POST /forecast/batch
 
-try:
-    if os.path.exists(FORECAST_MODEL_PATH):
-        forecast_model = joblib.load(FORECAST_MODEL_PATH)
-    if os.path.exists(FEATURES_PATH):
-        with open(FEATURES_PATH, "r") as f:
-            forecast_features = json.load(f)  # list of column names
-    if os.path.exists(PRIORS_PATH):
-        priors_df = pd.read_csv(PRIORS_PATH)
-    if os.path.exists(STOPS_NB_PATH):
-        stops_nb = pd.read_csv(STOPS_NB_PATH)
-    if os.path.exists(STOPS_SB_PATH):
-        stops_sb = pd.read_csv(STOPS_SB_PATH)
+def load_forecast_artifacts():
+    """
+    Load the forecast.ipynb artifacts into a new Forecaster; returns None if the model or
+    features.json is missing. Everything is loaded and validated into locals first, so a
+    failed (re)load raises and leaves the running Forecaster untouched. Raises ValueError
+    if features.json does not match the model (no silent garbage forecasts).
+    """
+    version = artifact_version(FORECAST_ARTIFACT_PATHS)
+    if not os.path.exists(FORECAST_MODEL_PATH) or not os.path.exists(FEATURES_PATH):
+        print(f"⚠️ Forecast model or {FEATURES_PATH} not found, /forecast disabled")
+        return None
+    model = joblib.load(FORECAST_MODEL_PATH)
+    # priors + urutan halte + dwell sebagai array NumPy
+    index = PriorsIndex.load(PRIORS_PATH, STOPS_NB_PATH, STOPS_SB_PATH,
+                             DWELL_H_PATH, DWELL_WE_PATH, DWELL_SX_PATH, cache_path=PRIORS_INDEX_PATH)
+    # kolom features.json -> matriks NumPy, divalidasi terhadap model
+    builder = FeatureBuilder.from_json(FEATURES_PATH)
+    loaded = Forecaster.from_artifacts(model, builder, index, version=version)
+    if artifact_version(FORECAST_ARTIFACT_PATHS) != version:
+        # artefak ditulis ulang di tengah load: versi tidak cocok dengan isi, coba lagi di cek berikutnya
+        raise RuntimeError("forecast artifacts changed while loading")
     print("✅ Forecast artifacts loaded.")
+    return loaded
+
+
+try:
+    forecaster = load_forecast_artifacts()
 except Exception as e:
     print(f"⚠️ cannot load artifacts: {e}")
+    forecaster = None
+forecast_cache = ForecastCache()
+_forecast_checked_at = time.monotonic()
+_forecast_rejected_version = None  # artefak yang gagal load/validasi, tidak dicoba ulang sampai berubah lagi
+_forecast_reload_lock = threading.Lock()
+
 
+def current_forecaster():
+    """Forecaster for this request; reloads it and drops the cache when an artifact changed on disk."""
+    global forecaster, _forecast_checked_at, _forecast_rejected_version
+    if time.monotonic() - _forecast_checked_at < FORECAST_ARTIFACT_CHECK_S:
+        return forecaster
+    if not _forecast_reload_lock.acquire(blocking=False):
+        return forecaster  # request lain sedang mengecek / reload
+    try:
+        _forecast_checked_at = time.monotonic()
+        version = artifact_version(FORECAST_ARTIFACT_PATHS)
+        if version != _forecast_rejected_version and (forecaster is None or version != forecaster.version):
+            if forecaster is not None:
+                print("👀 Forecast artifacts changed on disk, reloading")
+            try:
+                reloaded = load_forecast_artifacts()
+            except Exception as e:
+                print(f"❌ Keeping the current forecast model: {e}")
+                _forecast_rejected_version = version
+                reloaded = None
+            if reloaded is not None:
+                # model, fitur, index dan versi diganti bersamaan lewat satu referensi
+                forecaster = reloaded
+                forecast_cache.clear()
+                forecast_tables.wake()
+    finally:
+        _forecast_reload_lock.release()
+    return forecaster
+
+
+# Tabel forecast jam ini + jam berikutnya dihitung di background; /forecast cukup membaca array
+forecast_tables = ForecastTables(current_forecaster)
+if FORECAST_TABLES:
+    forecast_tables.start()
+# State per bus (bus_id) supaya commit di halte berikutnya hanya menghitung ulang sisa rute
+bus_forecasts = BusForecasts()
 
-# Line crossing counter variables
-cnt_up = 0  # People going up (entering)
-cnt_down = 0  # People going down (exiting)
+
+# Line crossing settings (counter dan tracker disimpan per kamera di camera_sessions)
 line_position = 0.5  # Line position as fraction of frame height (0.5 = middle)
 line_thickness = 3
 line_color = (0, 255, 255)  # Yellow line
 
-# Person tracking for line crossing
-class PersonTracker:
-    def __init__(self, person_id, x, y, max_age=30):
-        self.id = person_id
-        self.positions = [(x, y)]
-        self.age = 0
-        self.max_age = max_age
-        self.crossed = False
-        self.direction = None
-    
-    def update_position(self, x, y):
-        self.positions.append((x, y))
-        self.age = 0
-        # Keep only recent positions
-        if len(self.positions) > 10:
-            self.positions.pop(0)
-    
-    def age_increment(self):
-        self.age += 1
-        return self.age <= self.max_age
-    
-    def check_line_crossing(self, line_y):
-        if len(self.positions) >= 2 and not self.crossed:
-            prev_y = self.positions[-2][1]
-            curr_y = self.positions[-1][1]
-            
-            # Check if crossed the line
-            if prev_y < line_y and curr_y >= line_y:
-                self.direction = "down"  # Going down (entering)
-                self.crossed = True
-                return "down"
-            elif prev_y > line_y and curr_y <= line_y:
-                self.direction = "up"  # Going up (exiting)
-                self.crossed = True
-                return "up"
+# Backpressure: per kamera hanya frame terbaru yang diproses, frame basi ditolak
+frame_gate = FrameGate()
+
+# State per kamera/bus (ByteTrack, PersonTracker, counter) dengan lock masing-masing;
+# slot frame_gate kamera ikut dibuang saat session-nya idle
+sessions = SessionRegistry(on_evict=frame_gate.forget)
+stage_metrics = LatencyMetrics()
+
+# ===== Frame ingestion =====
+# Body biner (image/jpeg) dan multipart lebih hemat ~33% dibanding base64-in-JSON,
+# dan tidak perlu split/b64decode di server. JSON base64 tetap diterima untuk klien lama.
+BINARY_FRAME_TYPES = ("image/jpeg", "image/jpg", "image/png", "application/octet-stream")
+DEFAULT_CAMERA_ID = "default"
+
+# nama field (form/JSON) -> nama header
+FRAME_META_FIELDS = {
+    "camera_id": "X-Camera-Id",
+    "seq": "X-Frame-Seq",
+    "capture_ts": "X-Capture-Ts",
+}
+
+def read_frame_meta(fields=None):
+    """Ambil camera_id, seq, dan capture_ts dari field form/JSON, fallback ke header."""
+    fields = fields or {}
+    raw = {}
+    for name, header in FRAME_META_FIELDS.items():
+        value = fields.get(name)
+        if value is None or value == "":
+            value = request.headers.get(header)
+        raw[name] = value
+
+    meta = {"camera_id": str(raw["camera_id"] or DEFAULT_CAMERA_ID), "seq": None, "capture_ts": None}
+    try:
+        if raw["seq"] not in (None, ""):
+            meta["seq"] = int(raw["seq"])
+        if raw["capture_ts"] not in (None, ""):
+            meta["capture_ts"] = float(raw["capture_ts"])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid seq or capture_ts")
+    return meta
+
+def decode_frame_bytes(raw):
+    """Decode JPEG/PNG bytes ke frame BGR OpenCV (tanpa salinan tambahan)."""
+    if not raw:
         return None
+    return cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+
+def read_frame_request(timer):
+    """
+    Baca frame dari request /process. Format yang didukung:
+    - body biner `Content-Type: image/jpeg`, metadata lewat header X-Camera-Id/X-Frame-Seq/X-Capture-Ts
+    - multipart/form-data dengan file `frame` dan field camera_id/seq/capture_ts
+    - JSON {"frame": "data:image/jpeg;base64,..."} (fallback klien lama)
+    Return (frame, meta); frame None jika gagal decode. Waktu dicatat ke timer (parse, decode).
+    """
+    mimetype = (request.mimetype or "").lower()
+    encoded_data = None
 
-# Global variables for tracking
-person_trackers = {}
-next_person_id = 1
-frames_processed = 0
+    with timer.stage("parse"):
+        if mimetype in BINARY_FRAME_TYPES:
+            meta = read_frame_meta()
+            raw = request.get_data(cache=False)
+        elif mimetype == "multipart/form-data":
+            meta = read_frame_meta(request.form)
+            upload = request.files.get("frame")
+            raw = upload.read() if upload else None
+        else:
+            data = request.get_json(silent=True) or {}
+            meta = read_frame_meta(data)
+            frame_data = data.get("frame")
+            if not frame_data:
+                return None, meta
+            encoded_data = frame_data.split(",", 1)[1] if "," in frame_data else frame_data
+
+    with timer.stage("decode"):
+        if encoded_data is not None:
+            raw = base64.b64decode(encoded_data)
+        return decode_frame_bytes(raw), meta
 
 # Endpoint untuk halaman web
 @app.route('/')
@@ -192,6 +303,12 @@ def index():
             let isRunning = false;
             let framesSent = 0;
             let lastFrameTime = Date.now();
+            const cameraId = new URLSearchParams(location.search).get('camera') || 'default';
+            const MAX_IN_FLIGHT = 3;          // frames allowed in flight on the WebSocket
+            const CAPTURE_INTERVAL_MS = 100;  // upper bound ~10 FPS when the server keeps up
+            let ws = null;
+            let inFlight = 0;
+            let frameSeq = 0;
 
             function updateStatus(message, isActive = false) {
                 statusDiv.textContent = message;
@@ -242,7 +359,7 @@ def index():
                         updateStatus('📷 Camera: Active | 🔍 Detection: Running', true);
                         
                         // Start sending frames for processing
-                        setTimeout(processFrame, 1000); // Wait 1 second before starting processing
+                        setTimeout(startStreaming, 1000); // Wait 1 second before starting processing
                     };
                     
                 } catch (err) {
@@ -303,7 +420,7 @@ def index():
                             isRunning = true;
                             updateStatus('📷 Camera: Active (Legacy) | 🔍 Detection: Running', true);
                             
-                            processFrame();
+                            startStreaming();
                         };
                     },
                     function(err) {
@@ -315,6 +432,12 @@ def index():
 
             function stopCamera() {
                 isRunning = false;
+
+                if (ws) {
+                    ws.onclose = null;
+                    ws.close();
+                    ws = null;
+                }
                 
                 if (stream) {
                     stream.getTracks().forEach(track => track.stop());
@@ -336,71 +459,148 @@ def index():
                 ctx.fillText('Detection Stopped', canvas.width/2, canvas.height/2);
             }
 
+            // Capture current video frame as a JPEG blob
+            function captureFrameBlob() {
+                const tempCanvas = document.createElement('canvas');
+                tempCanvas.width = video.videoWidth;
+                tempCanvas.height = video.videoHeight;
+                const tempCtx = tempCanvas.getContext('2d');
+                tempCtx.drawImage(video, 0, 0, tempCanvas.width, tempCanvas.height);
+                return new Promise(resolve => tempCanvas.toBlob(resolve, 'image/jpeg', 0.8));
+            }
+
+            function handleResult(result) {
+                // Update line crossing counts
+                document.getElementById('countUp').textContent = result.count_up || 0;
+                document.getElementById('countDown').textContent = result.count_down || 0;
+                document.getElementById('totalCurrent').textContent = result.current_inside || 0;
+                
+                // Display processed image with green boxes and yellow line
+                if (result.processed_image) {
+                    const img = new Image();
+                    img.onload = function() {
+                        ctx.clearRect(0, 0, canvas.width, canvas.height);
+                        ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+                    };
+                    img.src = 'data:image/jpeg;base64,' + result.processed_image;
+                }
+                
+                // Update stats
+                framesSent++;
+                document.getElementById('framesSent').textContent = framesSent;
+                
+                const now = Date.now();
+                const fps = (1000 / (now - lastFrameTime)).toFixed(1);
+                lastFrameTime = now;
+                
+                const totalDetected = result.people_detected || 0;
+                const currentInside = result.current_inside || 0;
+                updateStatus(`📷 Camera: Active | 🔍 Detection: ${totalDetected} detected | 🏢 Inside: ${currentInside} | ${fps} FPS`, true);
+            }
+
+            // Persistent WebSocket channel: frames go up as binary messages
+            // (12-byte header: uint32 seq + float64 capture time, big-endian, then JPEG),
+            // results come back asynchronously tagged with seq. Falls back to HTTP /process.
+            function startStreaming() {
+                if (!('WebSocket' in window)) {
+                    processFrame();
+                    return;
+                }
+
+                const protocol = location.protocol === 'https:' ? 'wss://' : 'ws://';
+                ws = new WebSocket(protocol + location.host + '/ws');
+                ws.binaryType = 'arraybuffer';
+
+                ws.onopen = function() {
+                    console.log('WebSocket frame channel open');
+                    ws.send(JSON.stringify({ camera_id: cameraId, mode: 'full', render_every: 1 }));
+                    inFlight = 0;
+                    streamLoop();
+                };
+
+                ws.onmessage = function(event) {
+                    const result = JSON.parse(event.data);
+                    if (result.seq !== undefined && result.seq !== null) {
+                        inFlight = Math.max(0, inFlight - 1);
+                    }
+                    if (result.type === 'error') {
+                        console.error('Processing error:', result.error);
+                        return;
+                    }
+                    if (result.type === 'dropped') {
+                        console.log(`Frame ${result.seq} dropped by server (${result.reason})`);
+                        return;
+                    }
+                    if (result.type === 'result') {
+                        handleResult(result);
+                    }
+                };
+
+                ws.onclose = function() {
+                    ws = null;
+                    if (isRunning) {
+                        console.log('WebSocket unavailable, falling back to HTTP /process');
+                        processFrame();
+                    }
+                };
+            }
+
+            async function streamLoop() {
+                if (!isRunning || !ws || ws.readyState !== WebSocket.OPEN) {
+                    return;
+                }
+
+                if (inFlight < MAX_IN_FLIGHT && video.readyState >= 2 && video.videoWidth) {
+                    const frameBlob = await captureFrameBlob();
+                    if (frameBlob && ws && ws.readyState === WebSocket.OPEN) {
+                        frameSeq++;
+                        const header = new DataView(new ArrayBuffer(12));
+                        header.setUint32(0, frameSeq);
+                        header.setFloat64(4, Date.now() / 1000);
+                        ws.send(new Blob([header.buffer, frameBlob]));
+                        inFlight++;
+                    }
+                }
+
+                setTimeout(streamLoop, CAPTURE_INTERVAL_MS);
+            }
+
+            // HTTP fallback: one request per frame, ~2 FPS
             async function processFrame() {
                 if (!isRunning || !video.videoWidth || !video.videoHeight) {
                     console.log('Waiting for video...', {isRunning, videoWidth: video.videoWidth, videoHeight: video.videoHeight});
-                    setTimeout(processFrame, 500);
+                    if (isRunning) {
+                        setTimeout(processFrame, 500);
+                    }
                     return;
                 }
 
                 try {
-                    console.log('Processing frame...', video.videoWidth, 'x', video.videoHeight);
-                    
-                    // Draw video frame to a temporary canvas
-                    const tempCanvas = document.createElement('canvas');
-                    tempCanvas.width = video.videoWidth;
-                    tempCanvas.height = video.videoHeight;
-                    const tempCtx = tempCanvas.getContext('2d');
-                    
                     // Make sure we can draw the video
-                    if (video.readyState >= 2) {
-                        tempCtx.drawImage(video, 0, 0, tempCanvas.width, tempCanvas.height);
-                        console.log('Frame captured successfully');
-                    } else {
+                    if (video.readyState < 2) {
                         console.log('Video not ready, skipping frame');
                         setTimeout(processFrame, 500);
                         return;
                     }
                     
-                    // Get frame data
-                    const frameData = tempCanvas.toDataURL('image/jpeg', 0.8);
+                    // Get frame data as raw JPEG (no base64/JSON overhead)
+                    const frameBlob = await captureFrameBlob();
+                    frameSeq++;
 
                     // Send to server for YOLO processing
                     const response = await fetch('/process', {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ frame: frameData })
+                    headers: {
+                        'Content-Type': 'image/jpeg',
+                        'X-Camera-Id': cameraId,
+                        'X-Frame-Seq': String(frameSeq),
+                        'X-Capture-Ts': String(Date.now() / 1000)
+                    },
+                    body: frameBlob
                     });
 
                     if (response.ok) {
-                        const result = await response.json();
-                        
-                        // Update line crossing counts
-                        document.getElementById('countUp').textContent = result.count_up || 0;
-                        document.getElementById('countDown').textContent = result.count_down || 0;
-                        document.getElementById('totalCurrent').textContent = result.current_inside || 0;
-                        
-                        // Display processed image with green boxes and yellow line
-                        if (result.processed_image) {
-                            const img = new Image();
-                            img.onload = function() {
-                                ctx.clearRect(0, 0, canvas.width, canvas.height);
-                                ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-                            };
-                            img.src = 'data:image/jpeg;base64,' + result.processed_image;
-                        }
-                        
-                        // Update stats
-                        framesSent++;
-                        document.getElementById('framesSent').textContent = framesSent;
-                        
-                        const now = Date.now();
-                        const fps = (1000 / (now - lastFrameTime)).toFixed(1);
-                        lastFrameTime = now;
-                        
-                        const totalDetected = result.people_detected || 0;
-                        const currentInside = result.current_inside || 0;
-                        updateStatus(`📷 Camera: Active | 🔍 Detection: ${totalDetected} detected | 🏢 Inside: ${currentInside}`, true);
+                        handleResult(await response.json());
                     }
                     
                 } catch (error) {
@@ -453,186 +653,629 @@ def index():
     </html>
     """)
 
+# ===== Response modes =====
+# full       : selalu kirim processed_image (perilaku lama, untuk halaman kamera)
+# detections : hanya deteksi ringkas (box, track id, event crossing, counts) tanpa render/encode
+# Opsi render: render_every=N (gambar hanya tiap frame ke-N), render_scale (0.1-1.0), render_quality (JPEG 10-95)
+RESPONSE_MODES = ("full", "detections")
+DEFAULT_RENDER_QUALITY = 95  # default cv2.imencode
+
+def read_response_options(params, mode_override=None):
+    """Baca mode respons dari query string / pesan config WebSocket (params) atau header X-Response-Mode."""
+    mode = str(params.get("mode") or mode_override or "full").lower()
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {', '.join(RESPONSE_MODES)}")
+    try:
+        render_every = max(1, int(params.get("render_every", 1)))
+        render_scale = min(1.0, max(0.1, float(params.get("render_scale", 1.0))))
+        render_quality = min(95, max(10, int(params.get("render_quality", DEFAULT_RENDER_QUALITY))))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid render_every, render_scale or render_quality")
+    return {
+        "mode": mode,
+        "render_every": render_every,
+        "render_scale": render_scale,
+        "render_quality": render_quality,
+    }
+
+def compact_detections(detections):
+    """Deteksi dalam bentuk ringkas untuk klien headless."""
+    out = []
+    tracker_ids = detections.tracker_id if detections.tracker_id is not None else [None] * len(detections)
+    confidences = detections.confidence if detections.confidence is not None else [None] * len(detections)
+    for bbox, tracker_id, conf in zip(detections.xyxy, tracker_ids, confidences):
+        out.append({
+            "box": [int(v) for v in bbox],
+            "track_id": int(tracker_id) if tracker_id is not None else None,
+            "conf": round(float(conf), 3) if conf is not None else None,
+        })
+    return out
+
+def render_annotated_frame(frame, detections, events, line_y, stats, scale=1.0, roi_outline=None):
+    """Gambar box, garis hitung, panah crossing, dan overlay statistik di salinan frame."""
+    frame_height, frame_width = frame.shape[:2]
+    annotated_frame = frame.copy()
+
+    # Area pintu yang dikirim ke detector (jika ROI kamera diatur)
+    if roi_outline is not None:
+        cv2.polylines(annotated_frame, [roi_outline.reshape(-1, 1, 2)], True, (255, 128, 0), 1)
+
+    # Manually draw green bounding boxes
+    for i, bbox in enumerate(detections.xyxy):
+        x1, y1, x2, y2 = map(int, bbox)
+        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+        # Draw confidence if available
+        if detections.confidence is not None:
+            conf = detections.confidence[i]
+            cv2.putText(annotated_frame, f'{conf:.2f}', (x1, y1-10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+    # Draw the counting line (YELLOW line across the frame)
+    cv2.line(annotated_frame, (0, line_y), (frame_width, line_y), line_color, line_thickness)
+
+    # Add line label
+    cv2.putText(annotated_frame, 'COUNTING LINE', (frame_width//2 - 80, line_y - 10), 
+            cv2.FONT_HERSHEY_SIMPLEX, 0.7, line_color, 2, cv2.LINE_AA)
+
+    for event in events:
+        center_x, center_y = event["center"]
+        if event["direction"] == "down":
+            # Draw green arrow for entering
+            cv2.arrowedLine(annotated_frame, (center_x, center_y - 20), (center_x, center_y + 20), 
+                        (0, 255, 0), 3, tipLength=0.3)
+            cv2.putText(annotated_frame, 'ENTER', (center_x - 25, center_y - 30), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        else:
+            # Draw red arrow for exiting
+            cv2.arrowedLine(annotated_frame, (center_x, center_y + 20), (center_x, center_y - 20), 
+                        (0, 0, 255), 3, tipLength=0.3)
+            cv2.putText(annotated_frame, 'EXIT', (center_x - 20, center_y + 40), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+
+    # Draw person ID and position
+    if detections.tracker_id is not None:
+        for bbox, tracker_id in zip(detections.xyxy, detections.tracker_id):
+            center_x = int((bbox[0] + bbox[2]) / 2)
+            center_y = int((bbox[1] + bbox[3]) / 2)
+            cv2.putText(annotated_frame, f'ID:{tracker_id}', (center_x - 20, center_y), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+    # Add text overlays with statistics
+    cv2.putText(annotated_frame, f'Detected: {stats["people_detected"]}', 
+            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+
+    cv2.putText(annotated_frame, f'Entered: {stats["count_down"]}', 
+            (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+
+    cv2.putText(annotated_frame, f'Exited: {stats["count_up"]}', 
+            (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2, cv2.LINE_AA)
+
+    cv2.putText(annotated_frame, f'Inside: {stats["current_inside"]}', 
+            (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 255), 2, cv2.LINE_AA)
+
+    cv2.putText(annotated_frame, f'Frame: {stats["frame_number"]}', 
+            (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+
+    # Add timestamp
+    timestamp = time.strftime("%H:%M:%S")
+    cv2.putText(annotated_frame, f'Time: {timestamp}', 
+            (10, frame_height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+
+    if scale < 1.0:
+        annotated_frame = cv2.resize(annotated_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return annotated_frame
+
+def encode_frame_b64(frame, quality=DEFAULT_RENDER_QUALITY):
+    """Encode frame ke JPEG base64 untuk ditampilkan di web."""
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return base64.b64encode(buffer).decode('utf-8')
+
+def adaptation_payload(state, change):
+    """Current imgsz/stride of the camera's latency controller (+ the change made on this frame)."""
+    return {
+        "imgsz": state["imgsz"],
+        "stride": state["stride"],
+        "tiling": state["tiling"],
+        "p95_ms": state["p95_ms"],
+        "target_p95_ms": state["target_p95_ms"],
+        "changed": change,
+    }
+
+def skipped_frame_response(session, meta, options, reason):
+    """Response for a frame without detection (latency-controller stride or motion gate): last known counts."""
+    adaptation = session.controller.state()
+    response = {
+        "people_detected": session.people_detected,
+        "count_up": session.cnt_up,
+        "count_down": session.cnt_down,
+        "current_inside": session.current_inside(),
+        "frames_processed": session.frames_processed,
+        "camera_id": meta["camera_id"],
+        "seq": meta["seq"],
+        "capture_ts": meta["capture_ts"],
+        "next_frame_in_ms": frame_gate.next_frame_in_ms(session.camera_id),
+        "skipped": True,
+        "skip_reason": reason,
+        "adaptation": adaptation_payload(adaptation, None),
+        "timestamp": time.time()
+    }
+    if options["mode"] == "detections":
+        response["detections"] = []
+        response["events"] = []
+    return response
+
 # Endpoint untuk menerima dan memproses gambar dengan YOLO dan line crossing
+def run_frame_pipeline(frame, meta, options, timer):
+    """Deteksi YOLO + tracking + line crossing untuk satu frame pada session kameranya."""
+    started = time.perf_counter()
+    session = sessions.get(meta["camera_id"])
+    controller = session.controller
+    frame_height, frame_width = frame.shape[:2]
+    line_y = int(frame_height * line_position)
+
+    # Gate per kamera: frame yang tertimpa frame lebih baru / sudah basi tidak diproses (FrameDropped).
+    # Lock per kamera: frame dari kamera yang sama diproses berurutan,
+    # kamera lain tetap bisa masuk batch inference yang sama
+    with frame_gate.admit(session.camera_id, meta["capture_ts"]), session.lock:
+        # Stride dari latency controller: saat overload hanya tiap N frame yang dideteksi
+        if not controller.should_process():
+            session.frames_skipped += 1
+            return skipped_frame_response(session, meta, options, "stride")
+
+        # Run YOLO detection (batched bersama request lain lewat scheduler, per imgsz);
+        # detector sudah memfilter orang saja (class_id == 0 for person in COCO dataset).
+        # Saat overload controller mematikan tiling dulu sebelum menurunkan imgsz
+        imgsz = controller.imgsz if controller.enabled else None
+        result = session.detect_and_count(
+            frame, line_y, lambda crops: inference_scheduler.submit_many(crops, imgsz=imgsz),
+            tiling=controller.tiling, timer=timer)
+        if result is None:
+            return skipped_frame_response(session, meta, options, "no_motion")
+        detections, events = result
+        print(f"🔍 [{session.camera_id}] Processed frame {session.frames_processed}: {frame.shape}")
+
+        frame_number = session.frames_processed
+        cnt_up, cnt_down = session.cnt_up, session.cnt_down
+        roi = session.roi  # dibaca di bawah lock bersama count (bisa diganti lewat /config)
+
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        change = controller.observe(latency_ms, inference_scheduler.queue_depth(), tiled=session.tiler is not None)
+        adaptation = controller.state()
+    
+    if change:
+        print(f"⚙️ [{session.camera_id}] SLO {change['reason']}: imgsz {change['from']['imgsz']}→{change['to']['imgsz']}, "
+              f"stride {change['from']['stride']}→{change['to']['stride']}, "
+              f"tiling {change['from']['tiling']}→{change['to']['tiling']} (p95 {change['p95_ms']:.0f} ms)")
+
+    # Calculate current people inside
+    current_inside = max(0, cnt_down - cnt_up)
+    people_detected = len(detections)
+    
+    print(f"✅ [{session.camera_id}] Frame {frame_number}: {people_detected} detected, {current_inside} inside")
+    
+    response = {
+        "people_detected": people_detected,
+        "count_up": cnt_up,
+        "count_down": cnt_down,
+        "current_inside": current_inside,
+        "frames_processed": frame_number,
+        "camera_id": meta["camera_id"],
+        "seq": meta["seq"],
+        "capture_ts": meta["capture_ts"],
+        "next_frame_in_ms": frame_gate.next_frame_in_ms(session.camera_id),
+        "skipped": False,
+        "adaptation": adaptation_payload(adaptation, change),
+        "timestamp": time.time()
+    }
+
+    if options["mode"] == "detections":
+        response["detections"] = compact_detections(detections)
+        response["events"] = [{"track_id": e["track_id"], "direction": e["direction"]} for e in events]
+
+    # Render + encode hanya jika diminta (mode full) dan sesuai render_every
+    if options["mode"] == "full" and frame_number % options["render_every"] == 0:
+        with timer.stage("render"):
+            annotated_frame = render_annotated_frame(
+                frame, detections, events, line_y,
+                {"people_detected": people_detected, "count_up": cnt_up, "count_down": cnt_down,
+                 "current_inside": current_inside, "frame_number": frame_number},
+                scale=options["render_scale"],
+                roi_outline=roi.outline(frame.shape, line_y),
+            )
+        with timer.stage("encode"):
+            response["processed_image"] = encode_frame_b64(annotated_frame, options["render_quality"])
+    
+    return response
+
 @app.route('/process', methods=['POST'])
 def process_frame():
-    global frames_processed, cnt_up, cnt_down, person_trackers, next_person_id
-    
+    if not model_registry.ready():
+        # Model masih dimuat / warm-up: klien coba lagi sebentar lagi
+        return jsonify({"error": "Model is still loading", "last_error": model_registry.last_error}), 503, {"Retry-After": "1"}
+    timer = StageTimer()
     try:
-        frame_data = request.json['frame']
-        
-        # Konversi data base64 ke format gambar OpenCV
-        encoded_data = frame_data.split(',')[1]
-        nparr = np.frombuffer(base64.b64decode(encoded_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        try:
+            frame, meta = read_frame_request(timer)
+            options = read_response_options(request.args, request.headers.get("X-Response-Mode"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         if frame is None:
                 return jsonify({"error": "Failed to decode frame"}), 400
-            
-        frame_height, frame_width = frame.shape[:2]
-        line_y = int(frame_height * line_position)
-            
-        print(f"🔍 Processing frame {frames_processed + 1}: {frame.shape}")
-        
-        # Run YOLO detection
-        results = model(frame)[0]
-        detections = sv.Detections.from_ultralytics(results)
-        
-        # Filter for people only (class_id == 0 for person in COCO dataset)
-        detections = detections[detections.class_id == 0]
-        
-        # Update tracker for better consistency
-        detections = byte_tracker.update_with_detections(detections)
-        
-        # Create annotated frame 
-        annotated_frame = frame.copy()
-        
-        # Manually draw green bounding boxes
-        if len(detections) > 0:
-            for i, bbox in enumerate(detections.xyxy):
-                x1, y1, x2, y2 = map(int, bbox)
-                # Draw green rectangle
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Draw confidence if available
-                if hasattr(detections, 'confidence') and detections.confidence is not None:
-                    conf = detections.confidence[i]
-                    cv2.putText(annotated_frame, f'{conf:.2f}', (x1, y1-10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-        
-        # Draw the counting line (YELLOW line across the frame)
-        cv2.line(annotated_frame, (0, line_y), (frame_width, line_y), line_color, line_thickness)
-        
-        # Add line label
-        cv2.putText(annotated_frame, 'COUNTING LINE', (frame_width//2 - 80, line_y - 10), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, line_color, 2, cv2.LINE_AA)
-        
-        # Process each detection for line crossing
-        current_detections = []
-        if hasattr(detections, 'tracker_id') and detections.tracker_id is not None:
-            for i, tracker_id in enumerate(detections.tracker_id):
-                if tracker_id is not None:
-                    # Get bounding box center
-                    bbox = detections.xyxy[i]
-                    center_x = int((bbox[0] + bbox[2]) / 2)
-                    center_y = int((bbox[1] + bbox[3]) / 2)
-                    
-                    current_detections.append(tracker_id)
-                    
-                    # Update or create person tracker
-                    if tracker_id not in person_trackers:
-                        person_trackers[tracker_id] = PersonTracker(tracker_id, center_x, center_y)
-                    else:
-                        person_trackers[tracker_id].update_position(center_x, center_y)
-                    
-                    # Check for line crossing
-                    crossing = person_trackers[tracker_id].check_line_crossing(line_y)
-                    if crossing == "down":
-                        cnt_down += 1
-                        print(f"👤 Person {tracker_id} ENTERED (going down). Total entered: {cnt_down}")
-                        # Draw green arrow for entering
-                        cv2.arrowedLine(annotated_frame, (center_x, center_y - 20), (center_x, center_y + 20), 
-                                    (0, 255, 0), 3, tipLength=0.3)
-                        cv2.putText(annotated_frame, 'ENTER', (center_x - 25, center_y - 30), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    elif crossing == "up":
-                        cnt_up += 1
-                        print(f"👤 Person {tracker_id} EXITED (going up). Total exited: {cnt_up}")
-                        # Draw red arrow for exiting
-                        cv2.arrowedLine(annotated_frame, (center_x, center_y + 20), (center_x, center_y - 20), 
-                                    (0, 0, 255), 3, tipLength=0.3)
-                        cv2.putText(annotated_frame, 'EXIT', (center_x - 20, center_y + 40), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                    
-                    # Draw person ID and position
-                    cv2.putText(annotated_frame, f'ID:{tracker_id}', (center_x - 20, center_y), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        
-        # Age and remove old trackers
-        trackers_to_remove = []
-        for tracker_id, tracker in person_trackers.items():
-            if tracker_id not in current_detections:
-                if not tracker.age_increment():
-                    trackers_to_remove.append(tracker_id)
-        
-        for tracker_id in trackers_to_remove:
-            del person_trackers[tracker_id]
-        
-        # Calculate current people inside
-        current_inside = max(0, cnt_down - cnt_up)
-        people_detected = len(detections)
-        
-        # Add text overlays with statistics
-        cv2.putText(annotated_frame, f'Detected: {people_detected}', 
-                (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
-        
-        cv2.putText(annotated_frame, f'Entered: {cnt_down}', 
-                (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
-        
-        cv2.putText(annotated_frame, f'Exited: {cnt_up}', 
-                (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2, cv2.LINE_AA)
-        
-        cv2.putText(annotated_frame, f'Inside: {current_inside}', 
-                (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 255), 2, cv2.LINE_AA)
-        
-        cv2.putText(annotated_frame, f'Frame: {frames_processed + 1}', 
-                (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
-        
-        # Add timestamp
-        timestamp = time.strftime("%H:%M:%S")
-        cv2.putText(annotated_frame, f'Time: {timestamp}', 
-                (10, frame_height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
-        
-        # Convert processed frame back to base64 for web display
-        _, buffer = cv2.imencode('.jpg', annotated_frame)
-        processed_image_b64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Update statistics
-        frames_processed += 1
-        
-        print(f"✅ Frame {frames_processed}: {people_detected} detected, {current_inside} inside")
-        
-        return jsonify({
-            "people_detected": people_detected,
-            "count_up": cnt_up,
-            "count_down": cnt_down,
-            "current_inside": current_inside,
-            "processed_image": processed_image_b64,
-            "frames_processed": frames_processed,
-            "timestamp": time.time()
-        })
+
+        result = run_frame_pipeline(frame, meta, options, timer)
+        with timer.stage("response"):
+            response = jsonify(result)
+        stage_metrics.record(meta["camera_id"], timer.durations)
+        return response
+
+    except FrameDropped as dropped:
+        # 429 + Retry-After: klien sebaiknya kirim frame berikutnya setelah hint ini
+        return jsonify({**dropped.to_dict(), "seq": meta["seq"]}), 429, {"Retry-After": dropped.retry_after_header()}
         
     except Exception as e:
         print(f"❌ Error processing frame: {e}")
         return jsonify({"error": str(e)}), 500
 
+# ===== WebSocket frame channel =====
+# Pesan biner : header 12 byte (seq uint32 + capture_ts float64, big-endian) lalu byte JPEG.
+# Pesan teks  : JSON config {"camera_id", "mode", "render_every", "render_scale", "render_quality"}.
+# Hasil dikirim balik secara asinkron sebagai JSON {"type": "result", "seq": ..., ...},
+# jadi klien bisa punya beberapa frame in-flight tanpa overhead HTTP per frame.
+WS_FRAME_HEADER = struct.Struct(">Id")
+WS_MAX_PENDING = 4  # frame yang boleh antre per koneksi sebelum receive ikut menunggu
+
+def frame_channel(ws):
+    config = {"camera_id": DEFAULT_CAMERA_ID, "mode": "full"}
+    options = read_response_options(config)
+    pending = queue.Queue(maxsize=WS_MAX_PENDING)
+    closed = threading.Event()
+    send_lock = threading.Lock()
+
+    def send(payload):
+        with send_lock:
+            ws.send(json.dumps(payload))
+
+    def worker():
+        # Satu worker per koneksi supaya urutan frame (dan tracking) tetap terjaga
+        while not closed.is_set():
+            try:
+                raw, meta, frame_options = pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            # Latest frame wins: frame lama yang masih antre digantikan frame terbaru
+            while True:
+                try:
+                    newer = pending.get_nowait()
+                except queue.Empty:
+                    break
+                dropped = frame_gate.record_drop(meta["camera_id"], "superseded")
+                try:
+                    send({"type": "dropped", "seq": meta["seq"], **dropped.to_dict()})
+                except ConnectionClosed:
+                    return
+                raw, meta, frame_options = newer
+
+            timer = StageTimer()
+            try:
+                with timer.stage("decode"):
+                    frame = decode_frame_bytes(raw)
+                if frame is None:
+                    result = {"type": "error", "seq": meta["seq"], "error": "Failed to decode frame"}
+                else:
+                    result = run_frame_pipeline(frame, meta, frame_options, timer)
+                    result["type"] = "result"
+            except FrameDropped as dropped:
+                result = {"type": "dropped", "seq": meta["seq"], **dropped.to_dict()}
+            except ModelNotReady as e:
+                result = {"type": "error", "seq": meta["seq"], "error": str(e), "retry_after_ms": 1000}
+            except Exception as e:
+                print(f"❌ Error processing frame: {e}")
+                result = {"type": "error", "seq": meta["seq"], "error": str(e)}
+            try:
+                with timer.stage("response"):
+                    send(result)
+            except ConnectionClosed:
+                break
+            if result["type"] == "result":
+                stage_metrics.record(meta["camera_id"], timer.durations)
+
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        while True:
+            message = ws.receive()
+            if isinstance(message, str):
+                try:
+                    config.update(json.loads(message))
+                    options = read_response_options(config)
+                    send({"type": "config", "camera_id": str(config.get("camera_id") or DEFAULT_CAMERA_ID), **options})
+                except ValueError as e:
+                    send({"type": "error", "error": str(e)})
+                continue
+
+            if message is None or len(message) <= WS_FRAME_HEADER.size:
+                send({"type": "error", "error": "Frame message too short"})
+                continue
+            seq, capture_ts = WS_FRAME_HEADER.unpack_from(message)
+            meta = {
+                "camera_id": str(config.get("camera_id") or DEFAULT_CAMERA_ID),
+                "seq": seq,
+                "capture_ts": capture_ts or None,
+            }
+            pending.put((memoryview(message)[WS_FRAME_HEADER.size:], meta, options))
+    except ConnectionClosed:
+        pass
+    finally:
+        closed.set()
+
+if sock is not None:
+    sock.route('/ws')(frame_channel)
+else:
+    print("⚠️ flask-sock not installed, WebSocket /ws disabled (HTTP /process only)")
+
 # API endpoint to get current occupancy count for bus integration
 @app.route('/api/occupancy', methods=['GET'])
 def get_current_occupancy():
     """
     Get current occupancy count for bus system integration
-    Returns the number of people currently inside based on YOLO detection
+    Returns the number of people currently inside based on YOLO detection,
+    summed over all camera sessions (use /api/occupancy/<camera_id> per bus)
     """
-    global cnt_up, cnt_down, frames_processed
-    
-    current_inside = max(0, cnt_down - cnt_up)
+    camera_sessions = sessions.sessions()
+    total_entered = sum(s.cnt_down for s in camera_sessions)
+    total_exited = sum(s.cnt_up for s in camera_sessions)
+    frames_processed = sum(s.frames_processed for s in camera_sessions)
     
     return jsonify({
-        "current_inside": current_inside,
-        "total_entered": cnt_down,
-        "total_exited": cnt_up,
+        "current_inside": sum(s.current_inside() for s in camera_sessions),
+        "total_entered": total_entered,
+        "total_exited": total_exited,
         "frames_processed": frames_processed,
+        "cameras": sorted(s.camera_id for s in camera_sessions),
         "timestamp": time.time(),
         "status": "active" if frames_processed > 0 else "inactive"
     })
 
+@app.route('/api/occupancy/<camera_id>', methods=['GET'])
+def get_camera_occupancy(camera_id):
+    """Current occupancy of a single camera/bus session"""
+    session = sessions.find(camera_id)
+    if session is None:
+        return jsonify({"error": f"Unknown camera '{camera_id}'"}), 404
+    return jsonify(session.occupancy())
+
+# Prometheus scrape endpoint: latensi per tahap per kamera + antrean, frame drop, model aktif
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    scheduler = inference_scheduler.stats()
+    ingress = frame_gate.stats()["cameras"]
+    active = sessions.sessions()
+    lines = stage_metrics.prometheus_lines()
+    lines += metric_lines("crowd_inference_queue_depth", "gauge", "Frames waiting for batched inference.",
+                          [({}, scheduler["queue_depth"])])
+    lines += metric_lines("crowd_inference_batches_total", "counter", "Batched inference calls.",
+                          [({}, scheduler["batches"])])
+    lines += metric_lines("crowd_inference_frames_total", "counter", "Frames run through the detector.",
+                          [({}, scheduler["frames"])])
+    lines += metric_lines("crowd_inference_errors_total", "counter", "Failed batched inference calls.",
+                          [({}, scheduler["errors"])])
+    lines += metric_lines("crowd_frames_dropped_total", "counter", "Frames dropped before processing.",
+                          [({"camera": camera_id, "reason": reason}, stats[f"dropped_{reason}"])
+                           for camera_id, stats in sorted(ingress.items()) for reason in ("superseded", "stale")])
+    lines += metric_lines("crowd_frames_processed_total", "counter", "Frames run through detection and tracking.",
+                          [({"camera": session.camera_id}, session.frames_processed) for session in active])
+    lines += metric_lines("crowd_frames_skipped_total", "counter", "Frames answered without detection.",
+                          [({"camera": session.camera_id, "reason": "stride"}, session.frames_skipped) for session in active]
+                          + [({"camera": session.camera_id, "reason": "no_motion"}, session.motion_gate.skipped)
+                             for session in active])
+    lines += metric_lines("crowd_people_inside", "gauge", "Current people inside per camera.",
+                          [({"camera": session.camera_id}, session.current_inside()) for session in active])
+    lines += metric_lines("crowd_model_ready", "gauge", "1 when the detector is loaded and warmed up.",
+                          [({}, int(model_registry.ready()))])
+    lines += metric_lines("crowd_model_info", "gauge", "Active detector model.",
+                          [({"model": model_registry.model_id or "", "generation": model_registry.generation}, 1)])
+    cache = forecast_cache.stats()
+    lines += metric_lines("crowd_forecast_cache_requests_total", "counter", "Forecast cache lookups.",
+                          [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])])
+    lines += metric_lines("crowd_forecast_cache_evictions_total", "counter", "Forecast cache entries dropped.",
+                          [({"reason": "lru"}, cache["evictions"]), ({"reason": "ttl"}, cache["expired"])])
+    lines += metric_lines("crowd_forecast_cache_invalidations_total", "counter",
+                          "Forecast cache flushes after a model artifact change.", [({}, cache["invalidations"])])
+    lines += metric_lines("crowd_forecast_cache_entries", "gauge", "Forecast cache size.", [({}, cache["entries"])])
+    tables = forecast_tables.stats()
+    lines += metric_lines("crowd_forecast_table_requests_total", "counter", "Forecast precomputed table lookups.",
+                          [({"result": "hit"}, tables["hits"]), ({"result": "miss"}, tables["misses"])])
+    lines += metric_lines("crowd_forecast_table_build_seconds", "gauge", "Time to build each forecast table.",
+                          [({"dow": t["dow"], "hour": t["hour"]}, t["build_ms"] / 1000.0) for t in tables["buckets"]])
+    buses = bus_forecasts.stats()
+    lines += metric_lines("crowd_forecast_bus_states", "gauge", "Buses with incremental forecast state.",
+                          [({}, buses["active_buses"])])
+    lines += metric_lines("crowd_forecast_bus_requests_total", "counter", "Per-bus forecasts by how the rows were obtained.",
+                          [({"rows": "built"}, buses["built"]), ({"rows": "reused"}, buses["reused"])])
+    if forecaster is not None:
+        lines += metric_lines("crowd_forecast_predict_calls_total", "counter", "Forecast model.predict calls.",
+                              [({}, forecaster.predict_calls)])
+        lines += metric_lines("crowd_forecast_predicted_rows_total", "counter", "Stop rows scored by the forecast model.",
+                              [({}, forecaster.predicted_rows)])
+    return "\n".join(lines) + "\n", 200, {"Content-Type": PROMETHEUS_CONTENT_TYPE}
+
+# Inference scheduler metrics (batch size, queue wait)
+@app.route('/api/inference', methods=['GET'])
+def inference_stats():
+    """Batching statistics of the shared inference scheduler, dropped/stale frame counts and per-camera SLO / motion-gate state"""
+    return jsonify({
+        **inference_scheduler.stats(),
+        "ingress": frame_gate.stats(),
+        "slo": {session.camera_id: {**session.controller.state(), "frames_skipped": session.frames_skipped}
+                for session in sessions.sessions()},
+        "motion_gate": {session.camera_id: session.motion_gate.stats() for session in sessions.sessions()},
+        "stages": stage_metrics.summary(),
+        "timestamp": time.time()
+    })
+
+# Konfigurasi per kamera, mis. ROI pintu:
+#   {"roi": {"band": 0.25}}                              -> pita 25% tinggi frame di atas & bawah garis
+#   {"roi": {"polygon": [[0.2,0.3],[0.8,0.3],[0.8,0.9],[0.2,0.9]]}}  -> koordinat ternormalisasi
+#   {"roi": null}                                        -> seluruh frame
+#   {"tiling": {"grid": "2x2", "overlap": 0.2, "max_tiles": 6}} / {"tiling": true} -> inference per tile
+#   {"tiling": null}                                     -> inference satu frame
+@app.route('/api/cameras/<camera_id>/config', methods=['GET', 'POST'])
+def camera_config(camera_id):
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        settings = {}
+        try:
+            if "roi" in data:
+                settings["roi"] = DoorROI.from_config(data["roi"])
+            if "tiling" in data:
+                settings["tiler"] = Tiler.from_config(data["tiling"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        sessions.configure(camera_id, **settings)
+
+    session = sessions.find(camera_id)
+    if session is not None:
+        roi, tiler = session.roi, session.tiler
+    else:
+        config = sessions.config(camera_id)
+        roi = config.get("roi", DoorROI(band=DOOR_ROI_BAND))
+        tiler = config.get("tiler", Tiler() if TILED_INFERENCE else None)
+    return jsonify({"camera_id": camera_id, "roi": roi.to_dict(),
+                    "tiling": tiler.to_dict() if tiler is not None else None})
+
+@app.route('/forecast', methods=['GET'])
+def forecast():
+    """
+    Downstream load forecast, dipanggil LoadTracker.commit_and_forecast() saat bus berangkat.
+    Query: origin_stop (nama halte atau stop_seq), direction, current_load, cap, bus_id (opsional).
+    Dengan bus_id, baris fitur trip bus itu dipakai ulang di halte-halte berikutnya
+    (state per bus); tanpa bus_id jawaban diambil dari tabel precompute / cache.
+    """
+    active_forecaster = current_forecaster()
+    if active_forecaster is None:
+        return jsonify({"error": "Forecast model not loaded"}), 503
+    args = request.args
+    if not args.get("origin_stop") or not args.get("direction"):
+        return jsonify({"error": "origin_stop and direction are required"}), 400
+    try:
+        if args.get("bus_id"):
+            result = bus_forecasts.forecast(
+                active_forecaster,
+                args["bus_id"],
+                args["origin_stop"],
+                args["direction"],
+                float(args.get("current_load", 0)),
+                float(args.get("cap", DEFAULT_CAPACITY)),
+            )
+        else:
+            result = active_forecaster.forecast(
+                args["origin_stop"],
+                args["direction"],
+                float(args.get("current_load", 0)),
+                float(args.get("cap", DEFAULT_CAPACITY)),
+                cache=forecast_cache,
+                tables=forecast_tables,
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@app.route('/forecast/batch', methods=['POST'])
+def forecast_batch():
+    """
+    Forecast untuk banyak bus sekaligus (dashboard depot): satu request, satu model.predict.
+    Body: {"buses": [{"bus_id", "origin_stop", "direction", "current_load", "cap"}, ...]} atau langsung list-nya.
+    """
+    active_forecaster = current_forecaster()
+    if active_forecaster is None:
+        return jsonify({"error": "Forecast model not loaded"}), 503
+    data = request.get_json(silent=True)
+    buses = data.get("buses") if isinstance(data, dict) else data
+    if not isinstance(buses, list):
+        return jsonify({"error": "Expected a list of buses"}), 400
+    if len(buses) > FORECAST_BATCH_MAX:
+        return jsonify({"error": f"At most {FORECAST_BATCH_MAX} buses per request"}), 413
+
+    calls_before = active_forecaster.predict_calls
+    results = active_forecaster.forecast_many(buses, cache=forecast_cache, tables=forecast_tables)
+    return jsonify({
+        "results": [{"bus_id": bus.get("bus_id") if isinstance(bus, dict) else None, **result}
+                    for bus, result in zip(buses, results)],
+        "count": len(results),
+        "errors": sum(1 for result in results if "error" in result),
+        "model_calls": active_forecaster.predict_calls - calls_before,
+        "timestamp": time.time(),
+    })
+
+@app.route('/forecast/cache', methods=['GET'])
+def forecast_cache_stats():
+    active_forecaster = current_forecaster()
+    return jsonify({**forecast_cache.stats(), "model_version": active_forecaster.version if active_forecaster else None,
+                    "tables": forecast_tables.stats(), "buses": bus_forecasts.stats(), "timestamp": time.time()})
+
+# Readiness: load balancer baru mengirim trafik setelah model selesai dimuat + warm-up
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    status = model_registry.status()
+    return jsonify({**status, "timestamp": time.time()}), 200 if status["ready"] else 503
+
+def admin_denied():
+    """Error response for /admin/* unless ADMIN_TOKEN is set and matches X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@app.route('/admin/model', methods=['GET'])
+def model_status():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify(model_registry.status())
+
+@app.route('/admin/model/reload', methods=['POST'])
+def reload_model():
+    """
+    Hot-swap detector weights. Body (opsional): {"weights": "best.pt"}, a file
+    inside MODEL_DIR. The new model is loaded and warmed up in the background;
+    requests keep using the current one until the swap. Poll /admin/model for
+    the result.
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    weights = data.get("weights")
+    if weights is not None:
+        try:
+            weights = model_registry.weights_path(weights)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    if not model_registry.reload_async(weights):
+        return jsonify({"error": "A model reload is already in progress", **model_registry.status()}), 409
+    return jsonify({"status": "reloading", "weights": weights or model_registry.weights}), 202
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint for the YOLO service"""
+    status = model_registry.status()
+    if status["ready"]:
+        health = "healthy"
+    else:
+        health = "degraded" if status["last_error"] else "loading"
     return jsonify({
-        "status": "healthy",
+        "status": health,
         "service": "YOLO Crowd Counter",
+        "model": model_registry.model_id,
+        "model_error": status["last_error"],
+        "model_load_attempts": status["load_attempts"],
+        "model_next_retry_at": status["next_retry_at"],
         "port": 8081,
         "timestamp": time.time()
     })
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+
+import supervision as sv
+
+from door_roi import DOOR_ROI_BAND, DoorROI
+from latency_controller import LatencyController
+from metrics import StageTimer
+from motion_gate import MotionGate
+from tiling import TILED_INFERENCE, Tiler
+
+# Session kamera yang tidak mengirim frame selama ini (detik) akan dibuang
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", "600"))
+
+
+# Person tracking for line crossing
+class PersonTracker:
+    def __init__(self, person_id, x, y, max_age=30):
+        self.id = person_id
+        self.positions = [(x, y)]
+        self.age = 0
+        self.max_age = max_age
+        self.crossed = False
+        self.direction = None
+
+    def update_position(self, x, y):
+        self.positions.append((x, y))
+        self.age = 0
+        # Keep only recent positions
+        if len(self.positions) > 10:
+            self.positions.pop(0)
+
+    def age_increment(self):
+        self.age += 1
+        return self.age <= self.max_age
+
+    def check_line_crossing(self, line_y):
+        if len(self.positions) >= 2 and not self.crossed:
+            prev_y = self.positions[-2][1]
+            curr_y = self.positions[-1][1]
+
+            # Check if crossed the line
+            if prev_y < line_y and curr_y >= line_y:
+                self.direction = "down"  # Going down (entering)
+                self.crossed = True
+                return "down"
+            elif prev_y > line_y and curr_y <= line_y:
+                self.direction = "up"  # Going up (exiting)
+                self.crossed = True
+                return "up"
+        return None
+
+
+class CameraSession:
+    """
+    Tracking state of one camera/bus: its own ByteTrack, PersonTracker map,
+    line-crossing counters, latency-SLO controller, motion gate, door ROI and
+    optional tiled inference. Hold `lock` while updating it.
+    """
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.byte_tracker = sv.ByteTrack()
+        self.person_trackers = {}
+        self.cnt_up = 0  # People going up (exiting)
+        self.cnt_down = 0  # People going down (entering)
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.people_detected = 0  # jumlah deteksi frame terakhir yang diproses
+        self.controller = LatencyController()
+        self.roi = DoorROI(band=DOOR_ROI_BAND)
+        self.motion_gate = MotionGate()
+        self.tiler = Tiler() if TILED_INFERENCE else None
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.lock = threading.Lock()
+
+    def update_line_crossing(self, detections, line_y):
+        """Update PersonTrackers from tracked detections; return crossing events of this frame."""
+        current_detections = set()
+        events = []
+        if detections.tracker_id is not None:
+            for bbox, tracker_id in zip(detections.xyxy, detections.tracker_id):
+                if tracker_id is None:
+                    continue
+                # Get bounding box center
+                center_x = int((bbox[0] + bbox[2]) / 2)
+                center_y = int((bbox[1] + bbox[3]) / 2)
+
+                current_detections.add(tracker_id)
+
+                # Update or create person tracker
+                if tracker_id not in self.person_trackers:
+                    self.person_trackers[tracker_id] = PersonTracker(tracker_id, center_x, center_y)
+                else:
+                    self.person_trackers[tracker_id].update_position(center_x, center_y)
+
+                # Check for line crossing
+                crossing = self.person_trackers[tracker_id].check_line_crossing(line_y)
+                if crossing == "down":
+                    self.cnt_down += 1
+                    print(f"👤 [{self.camera_id}] Person {tracker_id} ENTERED (going down). Total entered: {self.cnt_down}")
+                elif crossing == "up":
+                    self.cnt_up += 1
+                    print(f"👤 [{self.camera_id}] Person {tracker_id} EXITED (going up). Total exited: {self.cnt_up}")
+                if crossing:
+                    events.append({"track_id": int(tracker_id), "direction": crossing,
+                                   "center": (center_x, center_y)})
+
+        # Age and remove old trackers
+        for tracker_id in list(self.person_trackers):
+            if tracker_id not in current_detections:
+                if not self.person_trackers[tracker_id].age_increment():
+                    del self.person_trackers[tracker_id]
+
+        return events
+
+    def detect_and_count(self, frame, line_y, predict_many, tiling=True, timer=None):
+        """
+        Motion gate, door ROI, (tiled) detection, ByteTrack and line crossing
+        for one frame. predict_many(list_of_frames) -> list of sv.Detections.
+        Returns (detections, events), or None when the motion gate skipped
+        the detector (the tracks still age by one empty frame).
+        """
+        timer = timer if timer is not None else StageTimer()
+        # Motion gate: tidak ada gerakan di dekat garis -> YOLO dilewati,
+        # tracker tetap di-update dengan deteksi kosong supaya umur track bertambah
+        with timer.stage("motion"):
+            motion = self.motion_gate.should_detect(frame, line_y)
+        if not motion:
+            empty = sv.Detections.empty()
+            self.byte_tracker.update_with_detections(empty)
+            self.update_line_crossing(empty, line_y)
+            return None
+
+        # Hanya area pintu (ROI kamera) yang dikirim ke detector, box dikembalikan ke koordinat frame penuh
+        tiler = self.tiler if tiling else None
+        with timer.stage("inference"):
+            roi_frame, roi_offset = self.roi.crop(frame, line_y)
+            if tiler is not None:
+                # Mode tile (halte padat): semua tile satu batch, digabung dengan NMS lintas tile
+                detections = tiler.detect(roi_frame, predict_many)
+            else:
+                detections = predict_many([roi_frame])[0]
+            detections = self.roi.to_frame(detections, roi_offset, frame.shape)
+
+        with timer.stage("tracking"):
+            detections = self.byte_tracker.update_with_detections(detections)
+        with timer.stage("line_crossing"):
+            events = self.update_line_crossing(detections, line_y)
+
+        self.frames_processed += 1
+        self.people_detected = len(detections)
+        return detections, events
+
+    def current_inside(self):
+        return max(0, self.cnt_down - self.cnt_up)
+
+    def occupancy(self):
+        """Occupancy payload in the /api/occupancy format."""
+        return {
+            "camera_id": self.camera_id,
+            "current_inside": self.current_inside(),
+            "total_entered": self.cnt_down,
+            "total_exited": self.cnt_up,
+            "frames_processed": self.frames_processed,
+            "last_seen": self.last_seen,
+            "timestamp": time.time(),
+            "status": "active" if self.frames_processed > 0 else "inactive"
+        }
+
+
+class SessionRegistry:
+    """
+    Thread-safe camera_id -> CameraSession map with idle-session eviction.
+
+    Per-camera settings set through configure() outlive eviction: they are
+    kept separately and applied again when the camera's session is recreated.
+    on_evict(camera_id) is called for every evicted session, so per-camera
+    state kept elsewhere (e.g. FrameGate slots) goes with it.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT, sweep_interval=30.0, on_evict=None):
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self._sessions = {}
+        self._configs = {}  # camera_id -> {atribut session: nilai}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def get(self, camera_id):
+        """Return the session for camera_id, creating it on first use."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._evict_idle(now)
+            session = self._sessions.get(camera_id)
+            if session is None:
+                session = CameraSession(camera_id)
+                for name, value in self._configs.get(camera_id, {}).items():
+                    setattr(session, name, value)
+                self._sessions[camera_id] = session
+                print(f"📷 New camera session: {camera_id} ({len(self._sessions)} active)")
+            session.last_seen = now
+            return session
+
+    def configure(self, camera_id, **settings):
+        """Store settings (e.g. roi=DoorROI(...)) for camera_id and apply them to its live session."""
+        with self._lock:
+            self._configs.setdefault(camera_id, {}).update(settings)
+            session = self._sessions.get(camera_id)
+        if session is not None:
+            with session.lock:
+                for name, value in settings.items():
+                    setattr(session, name, value)
+
+    def config(self, camera_id):
+        with self._lock:
+            return dict(self._configs.get(camera_id, {}))
+
+    def find(self, camera_id):
+        """Return an existing session or None (does not create one)."""
+        with self._lock:
+            return self._sessions.get(camera_id)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def evict_idle(self):
+        with self._lock:
+            return self._evict_idle(time.time())
+
+    def _evict_idle(self, now):
+        self._last_sweep = now
+        expired = [camera_id for camera_id, session in self._sessions.items()
+                   if now - session.last_seen > self.idle_timeout]
+        for camera_id in expired:
+            del self._sessions[camera_id]
+            if self.on_evict is not None:
+                self.on_evict(camera_id)
+            print(f"🧹 Evicted idle camera session: {camera_id}")
+        return expired
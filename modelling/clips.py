@@ -0,0 +1,20 @@
+import glob
+import json
+import os
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def list_clips(clips_dir):
+    """Video files in clips_dir, sorted by name."""
+    return sorted(p for p in glob.glob(os.path.join(clips_dir, "*")) if p.lower().endswith(VIDEO_EXTENSIONS))
+
+
+def clip_ground_truth(clip_path):
+    """Optional <clip>.json next to the clip: {"in": n, "out": m}."""
+    gt_path = os.path.splitext(clip_path)[0] + ".json"
+    if os.path.exists(gt_path):
+        with open(gt_path) as f:
+            gt = json.load(f)
+        return int(gt["in"]), int(gt["out"])
+    return None
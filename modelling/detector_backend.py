@@ -0,0 +1,125 @@
+import importlib.util
+import os
+
+from ultralytics import YOLO
+import supervision as sv
+
+# auto = runtime CPU tercepat yang tersedia (OpenVINO > ONNX Runtime > PyTorch)
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "auto").lower()
+DETECTOR_IMGSZ = int(os.environ.get("DETECTOR_IMGSZ", "640"))
+# auto = pakai model INT8 hasil quantize_yolo.py jika sudah lolos gate; fp32 = selalu FP32
+DETECTOR_PRECISION = os.environ.get("DETECTOR_PRECISION", "auto").lower()
+PERSON_CLASS_ID = 0
+
+BACKENDS = ("openvino", "onnx", "torch")
+# Modul Python yang harus ada supaya backend bisa dipakai
+BACKEND_MODULES = {"openvino": "openvino", "onnx": "onnxruntime", "torch": "torch"}
+
+
+class Detector:
+    """
+    YOLO person detector on one runtime (PyTorch, ONNX Runtime or OpenVINO).
+
+    Exported artifacts are loaded through Ultralytics as well, so every
+    backend yields the same Results and predict() returns person-only
+    sv.Detections that ByteTrack and the line counter already understand.
+    """
+
+    def __init__(self, model, backend, weights, artifact):
+        self.model = model
+        self.backend = backend
+        self.weights = weights
+        self.artifact = artifact
+
+    @property
+    def model_id(self):
+        return f"{os.path.basename(self.artifact)}@{self.backend}"
+
+    def predict(self, frames, **kwargs):
+        """Run one (batched) inference call; returns a list of person sv.Detections."""
+        results = self.model(frames, **kwargs)
+        detections = []
+        for result in results:
+            frame_detections = sv.Detections.from_ultralytics(result)
+            detections.append(frame_detections[frame_detections.class_id == PERSON_CLASS_ID])
+        return detections
+
+    def detect(self, frame, **kwargs):
+        """Person detections for a single frame."""
+        return self.predict([frame], **kwargs)[0]
+
+
+def backend_available(backend):
+    return importlib.util.find_spec(BACKEND_MODULES[backend]) is not None
+
+
+def exported_path(weights, backend):
+    """Where Ultralytics puts the export of `weights` (next to the .pt file)."""
+    stem, _ = os.path.splitext(weights)
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    return weights
+
+
+def int8_path(weights):
+    """INT8 ONNX promoted by quantize_yolo.py (only written when the accuracy/latency gate passes)."""
+    return os.path.splitext(weights)[0] + "_int8.onnx"
+
+
+def _promoted_int8(weights):
+    path = int8_path(weights)
+    if not os.path.exists(path) or not backend_available("onnx"):
+        return None
+    if os.path.exists(weights) and os.path.getmtime(path) < os.path.getmtime(weights):
+        print(f"⚠️ {path} is older than {weights}, re-run quantize_yolo.py; using FP32")
+        return None
+    return path
+
+
+def export_weights(weights, backend, imgsz=DETECTOR_IMGSZ):
+    """Export once and cache next to the weights; re-export when the .pt is newer."""
+    model = None if os.path.exists(weights) else YOLO(weights)  # download yolov8n.pt dkk. jika belum ada
+    target = exported_path(weights, backend)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights):
+        return target
+
+    print(f"📦 Exporting {weights} to {backend} (one-time)...")
+    # dynamic=True supaya batch size dan imgsz bisa berubah saat inference
+    exported = (model or YOLO(weights)).export(format=backend, imgsz=imgsz, dynamic=True)
+    return str(exported or target)
+
+
+def _candidate_backends(prefer):
+    if prefer in BACKENDS:
+        # backend yang diminta dulu, PyTorch selalu jadi fallback terakhir
+        return [prefer] + ([] if prefer == "torch" else ["torch"])
+    if backend_available("torch"):
+        import torch
+        if torch.cuda.is_available():
+            return ["torch"]  # ada GPU: PyTorch CUDA lebih cepat dari runtime CPU
+    return list(BACKENDS)
+
+
+def load_detector(weights, prefer=DETECTOR_BACKEND, imgsz=DETECTOR_IMGSZ, precision=DETECTOR_PRECISION):
+    """Load `weights` on the fastest available runtime, falling back to PyTorch."""
+    if precision != "fp32" and prefer != "torch":
+        int8_model = _promoted_int8(weights)
+        if int8_model:
+            try:
+                return Detector(YOLO(int8_model, task="detect"), "onnx-int8", weights, int8_model)
+            except Exception as e:
+                print(f"⚠️ INT8 model {int8_model} failed to load: {e}")
+
+    for backend in _candidate_backends(prefer):
+        if backend == "torch":
+            return Detector(YOLO(weights), "torch", weights, weights)
+        if not backend_available(backend) or not weights.endswith(".pt"):
+            continue
+        try:
+            artifact = export_weights(weights, backend, imgsz=imgsz)
+            return Detector(YOLO(artifact, task="detect"), backend, weights, artifact)
+        except Exception as e:
+            print(f"⚠️ {backend} backend unavailable for {weights}: {e}")
+    return Detector(YOLO(weights), "torch", weights, weights)
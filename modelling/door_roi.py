@@ -0,0 +1,103 @@
+import os
+
+import cv2
+import numpy as np
+
+# Default ROI: pita setinggi DOOR_ROI_BAND x tinggi frame di atas dan di bawah garis hitung; 0 = seluruh frame
+DOOR_ROI_BAND = float(os.environ.get("DOOR_ROI_BAND", "0"))
+
+
+class DoorROI:
+    """
+    Region of a camera frame that is sent to the detector.
+
+    Either a horizontal band around the counting line (`band` = fraction of
+    the frame height above and below the line) or a polygon in normalized
+    [0, 1] coordinates. Only the bounding rectangle of the region is cropped;
+    detections are shifted back to full-frame coordinates and, for polygons,
+    dropped when their box center falls outside the polygon.
+    """
+
+    def __init__(self, band=0.0, polygon=None):
+        self.band = float(band or 0.0)
+        self.polygon = np.asarray(polygon, dtype=np.float64) if polygon is not None else None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from the JSON config of /api/cameras/<id>/config; raises ValueError on bad input."""
+        if not config:
+            return cls()
+        if not isinstance(config, dict):
+            raise ValueError('roi must be an object like {"band": 0.25} or {"polygon": [[x, y], ...]}')
+        if "polygon" in config and config["polygon"] is not None:
+            try:
+                polygon = np.asarray(config["polygon"], dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError("roi.polygon must be a list of [x, y] points")
+            if polygon.ndim != 2 or polygon.shape[0] < 3 or polygon.shape[1] != 2:
+                raise ValueError("roi.polygon needs at least 3 [x, y] points")
+            if not np.isfinite(polygon).all() or polygon.min() < 0.0 or polygon.max() > 1.0:
+                raise ValueError("roi.polygon coordinates must be normalized to [0, 1]")
+            return cls(polygon=polygon)
+        try:
+            band = float(config.get("band", 0.0))
+        except (TypeError, ValueError):
+            raise ValueError("roi.band must be a number")
+        if not 0.0 <= band <= 1.0:
+            raise ValueError("roi.band must be between 0 and 1")
+        return cls(band=band)
+
+    @property
+    def enabled(self):
+        return self.polygon is not None or self.band > 0
+
+    def bounds(self, frame_shape, line_y):
+        """(x0, y0, x1, y1) of the crop in pixels."""
+        h, w = frame_shape[:2]
+        if self.polygon is not None:
+            points = self.polygon * (w, h)
+            x0, y0 = np.floor(points.min(axis=0)).astype(int)
+            x1, y1 = np.ceil(points.max(axis=0)).astype(int)
+            return max(0, x0), max(0, y0), min(w, x1), min(h, y1)
+        if self.band > 0:
+            half = int(round(self.band * h))
+            return 0, max(0, line_y - half), w, min(h, line_y + half)
+        return 0, 0, w, h
+
+    def crop(self, frame, line_y):
+        """Return (region, (x0, y0)); the full frame when no ROI is configured."""
+        if not self.enabled:
+            return frame, (0, 0)
+        x0, y0, x1, y1 = self.bounds(frame.shape, line_y)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return frame, (0, 0)
+        return frame[y0:y1, x0:x1], (x0, y0)
+
+    def to_frame(self, detections, offset, frame_shape):
+        """Shift detections of the cropped region back to full-frame coordinates."""
+        x0, y0 = offset
+        if len(detections) and (x0 or y0):
+            detections.xyxy = detections.xyxy + np.array([x0, y0, x0, y0], dtype=detections.xyxy.dtype)
+        if self.polygon is not None and len(detections):
+            h, w = frame_shape[:2]
+            contour = (self.polygon * (w, h)).astype(np.float32).reshape(-1, 1, 2)
+            centers = (detections.xyxy[:, :2] + detections.xyxy[:, 2:]) / 2.0
+            inside = np.array([cv2.pointPolygonTest(contour, (float(cx), float(cy)), False) >= 0
+                               for cx, cy in centers], dtype=bool)
+            detections = detections[inside]
+        return detections
+
+    def outline(self, frame_shape, line_y):
+        """Pixel polygon of the ROI for drawing, or None."""
+        if not self.enabled:
+            return None
+        if self.polygon is not None:
+            h, w = frame_shape[:2]
+            return (self.polygon * (w, h)).astype(np.int32)
+        x0, y0, x1, y1 = self.bounds(frame_shape, line_y)
+        return np.array([[x0, y0], [x1 - 1, y0], [x1 - 1, y1 - 1], [x0, y1 - 1]], dtype=np.int32)
+
+    def to_dict(self):
+        if self.polygon is not None:
+            return {"polygon": self.polygon.tolist()}
+        return {"band": self.band}
@@ -0,0 +1,103 @@
+import copy
+import json
+import threading
+
+import numpy as np
+
+# Fitur yang bisa dibangun builder; nama lain di features.json = error saat startup
+KNOWN_FEATURES = (
+    "hour", "dow", "is_weekend", "is_workday", "is_peak_am", "is_peak_pm",
+    "direction", "direction_num",
+    "prev_load", "load_prior", "board_prior", "alight_prior", "dwell_s",
+)
+
+
+class FeatureBuilder:
+    """
+    Writes forecast features straight into a float64 matrix in the column
+    order of features.json.
+
+    The column plan is resolved once; build() only assigns scalars or
+    per-row arrays into a preallocated, per-thread buffer, so a request
+    costs no DataFrame and no per-column allocation. The returned matrix is
+    a view of that buffer and is only valid until the thread's next build().
+    validate() checks the list against the model's feature_names_in_, and
+    positional() gives the model to predict these matrices with.
+    """
+
+    def __init__(self, features, initial_rows=64):
+        self.features = list(features)
+        unknown = [name for name in self.features if name not in KNOWN_FEATURES]
+        if unknown:
+            raise ValueError(f"features.json lists features the forecast service cannot build: {unknown}")
+        if len(set(self.features)) != len(self.features):
+            raise ValueError(f"features.json has duplicate features: {self.features}")
+        self.columns = {name: i for i, name in enumerate(self.features)}
+        self.initial_rows = initial_rows
+        self._local = threading.local()
+
+    @classmethod
+    def from_json(cls, path, model=None):
+        with open(path, "r") as f:
+            builder = cls(json.load(f))
+        if model is not None:
+            builder.validate(model)
+        return builder
+
+    def validate(self, model):
+        """Raise if the model was trained on other features or another column order."""
+        expected = getattr(model, "feature_names_in_", None)
+        if expected is not None and list(expected) != self.features:
+            raise ValueError(f"features.json {self.features} does not match the model's features {list(expected)}")
+        n_features = getattr(model, "n_features_in_", None)
+        if n_features is not None and n_features != len(self.features):
+            raise ValueError(f"features.json has {len(self.features)} features, the model expects {n_features}")
+
+    def positional(self, model):
+        """
+        Shallow copy of a validated model without feature_names_in_, so
+        predict() on this builder's unnamed matrices does not warn about
+        missing feature names. The fitted trees are shared, not copied, and
+        no warning filter is touched (other estimators still warn).
+        """
+        self.validate(model)
+        if getattr(model, "feature_names_in_", None) is None:
+            return model
+        model = copy.copy(model)
+        del model.feature_names_in_
+        return model
+
+    def buffer(self, rows):
+        """Per-thread preallocated matrix with at least `rows` rows (grows by doubling)."""
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.shape[0] < rows:
+            size = max(self.initial_rows, rows, 2 * buf.shape[0] if buf is not None else 0)
+            buf = self._local.buf = np.empty((size, len(self.features)), dtype=np.float64)
+        return buf[:rows]
+
+    def build(self, rows, hour, dow, direction, prev_load, load_prior, board_prior, alight_prior, dwell_s,
+              out=None):
+        """
+        Feature matrix of `rows` rows. Each argument is a scalar (same for
+        every row) or an array of length `rows`.
+        """
+        X = self.buffer(rows) if out is None else out[:rows]
+        is_weekend = np.asarray(dow) >= 5
+        values = {
+            "hour": hour,
+            "dow": dow,
+            "is_weekend": is_weekend,
+            "is_workday": ~is_weekend,
+            "is_peak_am": (np.asarray(hour) >= 6) & (np.asarray(hour) <= 9),
+            "is_peak_pm": (np.asarray(hour) >= 17) & (np.asarray(hour) <= 20),
+            "direction": direction,
+            "direction_num": direction,
+            "prev_load": prev_load,
+            "load_prior": load_prior,
+            "board_prior": board_prior,
+            "alight_prior": alight_prior,
+            "dwell_s": dwell_s,
+        }
+        for name, column in self.columns.items():
+            X[:, column] = values[name]
+        return X
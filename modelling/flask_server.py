@@ -5,23 +5,29 @@ import numpy as np
 import base64
 import time
 import os
-from ultralytics import YOLO
+from detector_backend import load_detector
 import supervision as sv
 import threading
 from datetime import datetime
 import json
+from camera_sessions import SESSION_IDLE_TIMEOUT
+from frame_gate import FrameGate, FrameDropped
+from motion_gate import MotionGate
+from metrics import LatencyMetrics, PROMETHEUS_CONTENT_TYPE, StageTimer, metric_lines
+from collections import deque
 
 app = Flask(__name__)
 CORS(app, origins="*")  # Allow all origins for development
 
 class iPhoneCrowdCounter:
-    def __init__(self):
+    def __init__(self, detector=None):
         print("🚀 Initializing iPhone Crowd Counter Server...")
         print("📦 Loading YOLO model...")
         
-        # Initialize YOLO model (will download if not present)
-        self.model = YOLO("yolov8n.pt")
-        print("✅ YOLO model loaded successfully!")
+        # Initialize YOLO model (will download if not present) on the fastest CPU runtime;
+        # replay_benchmark.py memberikan detector-nya sendiri
+        self.detector = detector if detector is not None else load_detector("yolov8n.pt")
+        print(f"✅ YOLO model loaded successfully! ({self.detector.model_id})")
         
         # Initialize tracker and annotator (from your original script)
         self.byte_tracker = sv.ByteTrack()
@@ -30,7 +36,8 @@ class iPhoneCrowdCounter:
         # Stats tracking
         self.frames_processed = 0
         self.last_people_count = 0
-        self.processing_times = []
+        self.processing_times = deque(maxlen=10)  # 10 durasi terakhir untuk overlay 'Proc'
+        self.stage_metrics = LatencyMetrics()
         self.start_time = time.time()
         
         # Display settings
@@ -38,6 +45,15 @@ class iPhoneCrowdCounter:
         self.current_frame = None
         self.frame_lock = threading.Lock()
         
+        # Backpressure per kamera: frame terbaru menang, frame basi ditolak
+        self.frame_gate = FrameGate(idle_timeout=SESSION_IDLE_TIMEOUT)
+        # Tracker, motion gate dan counter di atas dipakai bersama semua camera_id:
+        # frame dari kamera berbeda tetap diproses satu per satu
+        self.pipeline_lock = threading.Lock()
+        
+        # Motion gate MOG2 di tengah frame: tanpa gerakan YOLO dilewati
+        self.motion_gate = MotionGate()
+        
         # Create output folder (from your original script)
         self.output_folder = 'yolo_results'
         if not os.path.exists(self.output_folder):
@@ -71,51 +87,55 @@ class iPhoneCrowdCounter:
             print(f"❌ Error decoding frame: {e}")
             return None
     
-    def process_frame(self, frame):
+    def process_frame(self, frame, timer=None):
         """Process frame with YOLO detection (adapted from your original script)"""
         start_time = time.time()
+        timer = timer if timer is not None else StageTimer()
         
         try:
             # Get frame dimensions
             h_full, w_full = frame.shape[:2]
             
-            # Run YOLO detection (same as your original script)
-            results = self.model(frame)[0]
-            detections = sv.Detections.from_ultralytics(results)
-            
-            # Filter for people only (class_id == 0) - same as your original script
-            detections = detections[detections.class_id == 0]
+            # Run YOLO detection, people only (class_id == 0) - same as your original script;
+            # dilewati jika tidak ada gerakan di tengah frame (jumlah orang terakhir dipakai)
+            with timer.stage("motion"):
+                motion = self.motion_gate.should_detect(frame, h_full // 2)
+            with timer.stage("inference"):
+                if motion:
+                    detections = self.detector.detect(frame)
+                else:
+                    detections = sv.Detections.empty()
             
             # Update tracker (same as your original script)
-            detections = self.byte_tracker.update_with_detections(detections)
+            with timer.stage("tracking"):
+                detections = self.byte_tracker.update_with_detections(detections)
             
             # Count people (same as your original script)
-            people_count = len(detections)
+            people_count = len(detections) if motion else self.last_people_count
             
-            # Annotate frame (same as your original script)
-            annotated_frame = self.box_annotator.annotate(scene=frame.copy(), detections=detections)
+            with timer.stage("render"):
+                # Annotate frame (same as your original script)
+                annotated_frame = self.box_annotator.annotate(scene=frame.copy(), detections=detections)
             
-            # Add text overlays (enhanced from your original script)
-            cv2.putText(annotated_frame, f'Jumlah Orang: {people_count}', 
-                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
+                # Add text overlays (enhanced from your original script)
+                cv2.putText(annotated_frame, f'Jumlah Orang: {people_count}', 
+                           (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
             
-            cv2.putText(annotated_frame, f'Frame: {self.frames_processed + 1}', 
-                       (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
+                cv2.putText(annotated_frame, f'Frame: {self.frames_processed + 1}', 
+                           (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
             
-            # Add timestamp
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            cv2.putText(annotated_frame, f'Time: {timestamp}', 
-                       (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
+                # Add timestamp
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                cv2.putText(annotated_frame, f'Time: {timestamp}', 
+                           (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
             
-            # Add iPhone source indicator
-            cv2.putText(annotated_frame, 'Source: iPhone Safari', 
-                       (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2, cv2.LINE_AA)
+                # Add iPhone source indicator
+                cv2.putText(annotated_frame, 'Source: iPhone Safari', 
+                           (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2, cv2.LINE_AA)
             
             # Calculate processing time
             processing_time = time.time() - start_time
             self.processing_times.append(processing_time)
-            if len(self.processing_times) > 10:
-                self.processing_times.pop(0)
             
             avg_processing_time = sum(self.processing_times) / len(self.processing_times)
             cv2.putText(annotated_frame, f'Proc: {avg_processing_time:.2f}s', 
@@ -160,14 +180,21 @@ class iPhoneCrowdCounter:
         cv2.destroyAllWindows()
         print("🖥️  Display window closed")
 
-# Initialize the crowd counter
-print("🔧 Creating iPhone Crowd Counter instance...")
-crowd_counter = iPhoneCrowdCounter()
+# Dibuat di create_counter() saat server start, bukan saat import
+# (replay_benchmark.py mengimpor iPhoneCrowdCounter tanpa model, window dan server)
+crowd_counter = None
+
+
+def create_counter():
+    """Create the server's crowd counter and start its display thread."""
+    global crowd_counter
+    print("🔧 Creating iPhone Crowd Counter instance...")
+    crowd_counter = iPhoneCrowdCounter()
 
-# Start display thread
-print("🖥️  Starting display thread...")
-display_thread = threading.Thread(target=crowd_counter.display_loop, daemon=True)
-display_thread.start()
+    print("🖥️  Starting display thread...")
+    display_thread = threading.Thread(target=crowd_counter.display_loop, daemon=True)
+    display_thread.start()
+    return crowd_counter
 
 @app.route('/')
 def index():
@@ -250,25 +277,43 @@ def test_connection():
 @app.route('/upload', methods=['POST'])
 def upload_frame():
     """Main endpoint to receive and process frames from iPhone"""
+    timer = StageTimer()
     try:
         # Get JSON data
-        data = request.get_json()
+        with timer.stage("parse"):
+            data = request.get_json()
         
         if not data or 'frame' not in data:
             return jsonify({'error': 'No frame data received'}), 400
         
         print(f"📥 Received frame {data.get('frame_number', '?')} from iPhone")
         
+        camera_id = str(data.get('camera_id') or 'iphone')
+        try:
+            capture_ts = data.get('capture_ts')
+            if capture_ts not in (None, ''):
+                capture_ts = float(capture_ts)
+            elif data.get('timestamp') not in (None, ''):
+                capture_ts = float(data['timestamp'])
+                if capture_ts > 1e11:  # Date.now() dari browser dalam milidetik
+                    capture_ts /= 1000.0
+            else:
+                capture_ts = None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid capture_ts or timestamp'}), 400
+        
         # Decode the frame
-        frame = crowd_counter.decode_base64_frame(data['frame'])
+        with timer.stage("decode"):
+            frame = crowd_counter.decode_base64_frame(data['frame'])
         
         if frame is None:
             return jsonify({'error': 'Failed to decode frame'}), 400
         
         print(f"✅ Frame decoded successfully: {frame.shape}")
         
-        # Process the frame with YOLO detection
-        people_count, processed_frame = crowd_counter.process_frame(frame)
+        # Process the frame with YOLO detection (hanya jika tidak tertimpa frame lebih baru / basi)
+        with crowd_counter.frame_gate.admit(camera_id, capture_ts), crowd_counter.pipeline_lock:
+            people_count, processed_frame = crowd_counter.process_frame(frame, timer)
         
         # Prepare response (same format as your original script's backend communication)
         response = {
@@ -276,12 +321,20 @@ def upload_frame():
             'people_count': people_count,
             'timestamp': time.time(),
             'frames_processed': crowd_counter.frames_processed,
-            'processing_time': crowd_counter.processing_times[-1] if crowd_counter.processing_times else 0
+            'processing_time': crowd_counter.processing_times[-1] if crowd_counter.processing_times else 0,
+            'next_frame_in_ms': crowd_counter.frame_gate.next_frame_in_ms(camera_id)
         }
         
         print(f"📤 Sending response: {people_count} people detected")
         
-        return jsonify(response)
+        with timer.stage("response"):
+            http_response = jsonify(response)
+        crowd_counter.stage_metrics.record(camera_id, timer.durations)
+        return http_response
+    
+    except FrameDropped as dropped:
+        print(f"⏭️  Frame dropped ({dropped.reason}) for {dropped.camera_id}")
+        return jsonify(dropped.to_dict()), 429, {'Retry-After': dropped.retry_after_header()}
         
     except Exception as e:
         print(f"❌ Error in upload_frame: {e}")
@@ -302,9 +355,32 @@ def get_stats():
         'uptime_seconds': uptime,
         'uptime_minutes': uptime / 60,
         'server_start_time': crowd_counter.start_time,
-        'current_time': time.time()
+        'current_time': time.time(),
+        'ingress': crowd_counter.frame_gate.stats(),
+        'motion_gate': crowd_counter.motion_gate.stats(),
+        'stages': crowd_counter.stage_metrics.summary()
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text format: per-stage latency histograms, dropped frames, model id"""
+    ingress = crowd_counter.frame_gate.stats()["cameras"]
+    lines = crowd_counter.stage_metrics.prometheus_lines()
+    lines += metric_lines("crowd_frames_processed_total", "counter", "Frames run through detection and tracking.",
+                          [({}, crowd_counter.frames_processed)])
+    lines += metric_lines("crowd_frames_dropped_total", "counter", "Frames dropped before processing.",
+                          [({"camera": camera_id, "reason": reason}, stats[f"dropped_{reason}"])
+                           for camera_id, stats in sorted(ingress.items()) for reason in ("superseded", "stale")])
+    lines += metric_lines("crowd_frames_skipped_total", "counter", "Frames answered without detection.",
+                          [({"reason": "no_motion"}, crowd_counter.motion_gate.skipped)])
+    lines += metric_lines("crowd_frames_in_flight", "gauge", "Cameras with a frame currently being processed.",
+                          [({}, sum(1 for stats in ingress.values() if stats["busy"]))])
+    lines += metric_lines("crowd_people_count", "gauge", "People in the last processed frame.",
+                          [({}, crowd_counter.last_people_count)])
+    lines += metric_lines("crowd_model_info", "gauge", "Active detector model.",
+                          [({"model": crowd_counter.detector.model_id}, 1)])
+    return "\n".join(lines) + "\n", 200, {"Content-Type": PROMETHEUS_CONTENT_TYPE}
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 iPhone Crowd Counter Server Starting...")
@@ -328,6 +404,8 @@ if __name__ == '__main__':
     print("\n⌨️  Press 'q' in the display window to quit")
     print("="*60 + "\n")
     
+    create_counter()
+    
     # Run Flask server
     try:
         app.run(host='0.0.0.0', port=5003, debug=False, threaded=True)
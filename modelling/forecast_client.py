@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+FORECAST_CLIENT_QUEUE = int(os.environ.get("FORECAST_CLIENT_QUEUE", "32"))      # commit yang boleh antre
+FORECAST_CLIENT_TIMEOUT = float(os.environ.get("FORECAST_CLIENT_TIMEOUT", "3"))
+FORECAST_CLIENT_RETRIES = int(os.environ.get("FORECAST_CLIENT_RETRIES", "3"))    # percobaan ulang setelah gagal
+FORECAST_CLIENT_BACKOFF = float(os.environ.get("FORECAST_CLIENT_BACKOFF", "0.5"))  # detik, dikali 2 tiap retry
+
+
+class ForecastClient:
+    """
+    Asynchronous client for the /forecast endpoint.
+
+    submit() only puts the commit event on a bounded queue and returns a
+    Future; a background worker sends it over one keep-alive
+    requests.Session, retrying connection errors, timeouts and 5xx with
+    exponential backoff. When the queue is full the oldest event is
+    dropped (its forecast would be stale anyway) and its Future resolves
+    to []. Futures resolve to the list of forecasts, or [] after the last
+    failed attempt, exactly what the old synchronous call returned. After
+    close() submit() no longer queues anything and resolves to [] at once.
+    """
+
+    def __init__(self, url, max_queue=FORECAST_CLIENT_QUEUE, timeout=FORECAST_CLIENT_TIMEOUT,
+                 retries=FORECAST_CLIENT_RETRIES, backoff=FORECAST_CLIENT_BACKOFF):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self._closed = False
+        self._lock = threading.Lock()  # submit() vs close(): sentinel None tidak boleh ikut di-drop
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="forecast-client", daemon=True)
+        self._thread.start()
+
+    def submit(self, params, callback=None):
+        """
+        Queue one forecast request; never blocks. callback(forecasts) runs on
+        the worker thread (or inline if this event is dropped right away).
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(f.result()))
+        event = (params, future)
+        dropped = []
+        with self._lock:
+            if self._closed:
+                dropped.append(future)
+            else:
+                while True:
+                    try:
+                        self._queue.put_nowait(event)
+                        break
+                    except queue.Full:
+                        try:
+                            _, oldest = self._queue.get_nowait()
+                        except queue.Empty:
+                            continue
+                        dropped.append(oldest)
+        # callback dijalankan di luar lock
+        for oldest in dropped:
+            self._count("dropped")
+            oldest.set_result([])
+        return future
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            params, future = event
+            try:
+                forecasts = self._fetch(params)
+            except Exception as e:
+                # worker tidak boleh mati: Future yang masih antre akan menggantung selamanya
+                print("[forecast] unexpected error:", e)
+                self._count("failed")
+                forecasts = []
+            future.set_result(forecasts)
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _fetch(self, params):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count("retried")
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                body = response.json()
+                if not isinstance(body, dict):
+                    raise ValueError(f"expected a JSON object, got {type(body).__name__}")
+                self._count("sent")
+                return body.get("forecasts", [])
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or e.response.status_code >= 500
+                if retryable and attempt < self.retries:
+                    continue
+                print("[forecast] error:", e)
+            except (requests.RequestException, ValueError) as e:
+                # body bukan JSON/objek, atau MissingSchema, InvalidURL, TooManyRedirects, ...: retry tidak membantu
+                print("[forecast] error:", e)
+            break
+        self._count("failed")
+        return []
+
+    def close(self, timeout=5.0):
+        """Finish the queued requests, then stop the worker; later submit() calls resolve to []."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self.session.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return {"queued": self._queue.qsize(), "sent": self.sent, "failed": self.failed,
+                    "retried": self.retried, "dropped": self.dropped}
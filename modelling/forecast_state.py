@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from forecast_tables import time_bucket
+from forecasting import WIB
+
+# State forecast per bus dibuang kalau bus tidak commit selama ini (detik)
+BUS_FORECAST_IDLE_TIMEOUT = float(os.environ.get("BUS_FORECAST_IDLE_TIMEOUT", "1800"))
+
+
+class BusForecastState:
+    """
+    Feature rows for the rest of one bus trip, built at the bus's first
+    forecast and reused at every later stop.
+
+    Only prev_load (and load_prior where the stop has no prior, which falls
+    back to prev_load) depends on the committed load; the calendar, prior
+    and dwell columns of the remaining stops are taken from these rows as
+    they are. The last predictions are kept too: when the corrected
+    prev_load column comes out identical (e.g. a full bus held at cap) the
+    model is not called at all.
+    """
+
+    def __init__(self, bus_id, query, bucket, version, seqs, X, flows, load_prior, prior_missing):
+        self.bus_id = bus_id
+        self.direction = query["direction"]
+        self.cap = query["cap"]
+        self.bucket = bucket
+        self.version = version
+        self.seqs = seqs
+        self.positions = {int(seq): i for i, seq in enumerate(seqs)}
+        self.origin = query["stop_seq"]
+        self.X = X
+        self.flows = flows
+        self.load_prior = load_prior
+        self.prior_missing = prior_missing
+        self.predicted = np.full(len(seqs), np.nan)
+        self.lock = threading.Lock()
+        self.last_seen = time.time()
+
+    def start_row(self, query, bucket, version):
+        """First row of this state after query's origin stop, or None if the state cannot serve it."""
+        if (query["direction"] != self.direction or query["cap"] != self.cap
+                or bucket != self.bucket or version != self.version):
+            return None
+        if query["stop_seq"] == self.origin:
+            return 0
+        position = self.positions.get(query["stop_seq"])
+        return None if position is None else position + 1
+
+
+class BusForecasts:
+    """
+    bus_id -> BusForecastState, so LoadTracker's commit at each stop only
+    recomputes the remaining horizon from the corrected load instead of
+    rebuilding the whole downstream forecast. A state is rebuilt when the
+    bus changes direction, the hour bucket or model version changes, or it
+    asks for a stop behind its trip's origin.
+
+    Requests with a bus_id always go through here; the precomputed
+    ForecastTables only serve requests without one (and /forecast/batch).
+    Consulting the tables first would answer nearly every commit from the
+    table and leave this state unused.
+    """
+
+    def __init__(self, idle_timeout=BUS_FORECAST_IDLE_TIMEOUT, sweep_interval=60.0):
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._states = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.built = 0
+        self.reused = 0
+        self.unchanged = 0
+
+    def _build(self, forecaster, bus_id, query, now, bucket):
+        seqs = query["seqs"]
+        X = np.empty((len(seqs), len(forecaster.builder.features)))
+        forecaster.build_features(query["direction"], seqs, query["current_load"], query["cap"], now, out=X)
+        board, alight, load_prior = forecaster.index.priors(query["direction"], seqs, now.hour)
+        flows = np.nan_to_num(board) - np.nan_to_num(alight)
+        return BusForecastState(bus_id, query, bucket, forecaster.version, seqs, X, flows,
+                                load_prior, np.isnan(load_prior))
+
+    def forecast(self, forecaster, bus_id, origin_stop, direction, current_load, cap, now=None):
+        """Forecaster.forecast() for one bus, reusing that bus's feature rows from its earlier stops."""
+        now = now or datetime.now(WIB)
+        query = forecaster.prepare(origin_stop, direction, current_load, cap, now)
+        if not len(query["seqs"]):
+            return forecaster.make_result(query, now, np.empty(0))
+
+        bucket = time_bucket(now)
+        state = self._get(bus_id)
+        start = state.start_row(query, bucket, forecaster.version) if state is not None else None
+        if start is None:
+            state = self._build(forecaster, bus_id, query, now, bucket)
+            with self._lock:
+                self._states[bus_id] = state
+                self.built += 1
+            start = 0
+        else:
+            self._count("reused")
+
+        # prev_load sisa rute = load terkoreksi + net naik/turun prior (sama seperti build_features)
+        net = np.concatenate(([0.0], np.cumsum(state.flows[start:])[:-1]))
+        prev_load = np.clip(query["current_load"] + net, 0.0, query["cap"])
+        load_prior = np.where(state.prior_missing[start:], prev_load, state.load_prior[start:])
+        columns = forecaster.builder.columns
+        with state.lock:
+            rows = state.X[start:]
+            changed = np.isnan(state.predicted[start:]).any()
+            for name, values in (("prev_load", prev_load), ("load_prior", load_prior)):
+                if name in columns:
+                    changed = changed or not np.array_equal(rows[:, columns[name]], values)
+                    rows[:, columns[name]] = values
+            if changed:
+                state.predicted[start:] = forecaster.model.predict(rows)
+                forecaster.count_predict(len(rows))
+            else:
+                self._count("unchanged")
+            state.last_seen = time.time()
+            loads = state.predicted[start:].copy()
+        return forecaster.make_result(query, now, loads)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _get(self, bus_id):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = now
+                for stale in [b for b, s in self._states.items() if now - s.last_seen > self.idle_timeout]:
+                    del self._states[stale]
+            return self._states.get(bus_id)
+
+    def drop(self, bus_id):
+        with self._lock:
+            return self._states.pop(bus_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {"active_buses": len(self._states), "built": self.built, "reused": self.reused,
+                    "unchanged": self.unchanged, "idle_timeout_s": self.idle_timeout}
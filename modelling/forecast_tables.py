@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from forecasting import DEFAULT_CAPACITY, FORECAST_LOAD_STEP, WIB
+
+# Tabel forecast seluruh rute untuk jam ini dan jam berikutnya; 0 = nonaktif (selalu prediksi on-demand)
+FORECAST_TABLES = os.environ.get("FORECAST_TABLES", "1") == "1"
+FORECAST_TABLE_REFRESH_S = float(os.environ.get("FORECAST_TABLE_REFRESH_S", "30"))
+FORECAST_TABLE_CAP = float(os.environ.get("FORECAST_TABLE_CAP", str(DEFAULT_CAPACITY)))
+FORECAST_TABLE_LOAD_STEP = float(os.environ.get("FORECAST_TABLE_LOAD_STEP", str(FORECAST_LOAD_STEP or 1)))
+
+
+def time_bucket(now):
+    """Forecast features only change with the day of week and the hour."""
+    return now.weekday(), now.hour
+
+
+class ForecastTable:
+    """Predicted loads for one time bucket: loads[direction, stop_seq, load_index, k] for the k-th stop downstream."""
+
+    def __init__(self, bucket, version, cap, load_step, loads, build_s):
+        self.bucket = bucket
+        self.version = version
+        self.cap = cap
+        self.load_step = load_step
+        self.loads = loads
+        self.build_s = build_s
+        self.built_at = time.time()
+
+
+class ForecastTables:
+    """
+    Background precomputation of route-wide forecast tables.
+
+    A worker thread keeps a table for the current and the next hour bucket:
+    every direction x origin stop x load bucket (0..cap in load_step) is
+    forecast with one vectorized predict per bucket, and the finished set
+    is swapped in with a single assignment. lookup() is then an array read;
+    it returns None (and the caller predicts on demand) while a table is
+    missing, was built by another model version or the cap differs.
+    """
+
+    def __init__(self, get_forecaster, cap=FORECAST_TABLE_CAP, load_step=FORECAST_TABLE_LOAD_STEP,
+                 refresh_every=FORECAST_TABLE_REFRESH_S):
+        self.get_forecaster = get_forecaster
+        self.cap = float(cap)
+        self.load_step = float(load_step)
+        self.refresh_every = refresh_every
+        # 0..cap per load_step; titik terakhir selalu cap, juga jika load_step tidak membagi cap habis
+        grid = np.arange(0.0, self.cap, self.load_step)
+        self.load_grid = np.append(grid, self.cap)
+        self._tables = {}  # time bucket -> ForecastTable; diganti utuh, tidak pernah dimodifikasi
+        self._wake = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="forecast-tables", daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        """Rebuild now (e.g. after the forecast model was reloaded)."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Forecast table refresh failed: {e}")
+            self._wake.wait(self.refresh_every)
+            self._wake.clear()
+
+    def refresh(self, now=None):
+        forecaster = self.get_forecaster()
+        if forecaster is None:
+            return
+        now = now or datetime.now(WIB)
+        wanted = [time_bucket(now), time_bucket(now + timedelta(hours=1))]
+        tables = {bucket: table for bucket, table in self._tables.items()
+                  if bucket in wanted and table.version == forecaster.version}
+        for bucket in wanted:
+            if bucket not in tables:
+                tables[bucket] = self.build(forecaster, bucket)
+                print(f"📋 Forecast table dow={bucket[0]} hour={bucket[1]} built in {tables[bucket].build_s * 1000:.0f} ms")
+        self._tables = tables  # swap atomik; lookup() yang sedang jalan tetap memakai dict lama
+
+    def build(self, forecaster, bucket):
+        started = time.perf_counter()
+        dow, hour = bucket
+        # tanggal apa pun dengan hari & jam yang sama; fitur hanya memakai dow dan hour
+        base = datetime(2024, 1, 1, hour, tzinfo=WIB) + timedelta(days=dow)
+        index = forecaster.index
+        routes = [(direction, int(stop_seq), index.downstream(direction, int(stop_seq)))
+                  for direction in (0, 1) for stop_seq in index.orders[direction]]
+        routes = [route for route in routes if len(route[2])]
+        horizon = max((len(seqs) for _, _, seqs in routes), default=0)
+
+        n_loads = len(self.load_grid)
+        rows = sum(len(seqs) for _, _, seqs in routes) * n_loads
+        loads = np.full((2, index.n_stops, n_loads, horizon), np.nan)
+        if rows:
+            X = forecaster.builder.buffer(rows)
+            offset = 0
+            for direction, stop_seq, seqs in routes:
+                for load in self.load_grid:
+                    forecaster.build_features(direction, seqs, load, self.cap, base, out=X[offset:offset + len(seqs)])
+                    offset += len(seqs)
+            predicted = np.clip(forecaster.model.predict(X), 0.0, self.cap)
+            offset = 0
+            for direction, stop_seq, seqs in routes:
+                n = len(seqs)
+                block = predicted[offset:offset + n * n_loads].reshape(n_loads, n)
+                loads[direction, stop_seq, :, :n] = block
+                offset += n * n_loads
+        with self._stats_lock:
+            self.builds += 1
+        return ForecastTable(bucket, forecaster.version, self.cap, self.load_step, loads,
+                             time.perf_counter() - started)
+
+    def lookup(self, query, now, version):
+        """
+        Predicted loads for a prepared Forecaster query, or None. Snaps
+        query["current_load"] to the table's load grid.
+        """
+        table = self._tables.get(time_bucket(now))
+        n = len(query["seqs"])
+        if table is None or table.version != version or query["cap"] != table.cap or not n:
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        load_index = min(int(round(query["current_load"] / table.load_step)), len(self.load_grid) - 1)
+        if (load_index < len(self.load_grid) - 1
+                and abs(self.load_grid[-1] - query["current_load"]) < abs(self.load_grid[load_index] - query["current_load"])):
+            load_index = len(self.load_grid) - 1  # cap lebih dekat dari titik grid biasa
+        query["current_load"] = float(self.load_grid[load_index])
+        with self._stats_lock:
+            self.hits += 1
+        return table.loads[query["direction"], query["stop_seq"], load_index, :n]
+
+    def stats(self):
+        tables = self._tables
+        with self._stats_lock:
+            hits, misses, builds = self.hits, self.misses, self.builds
+        lookups = hits + misses
+        return {
+            "enabled": self._thread is not None,
+            "buckets": [{"dow": t.bucket[0], "hour": t.bucket[1], "version": t.version,
+                         "build_ms": t.build_s * 1000.0, "built_at": t.built_at} for t in tables.values()],
+            "cap": self.cap,
+            "load_step": self.load_step,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": (hits / lookups) if lookups else 0.0,
+            "builds": builds,
+        }
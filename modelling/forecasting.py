@@ -0,0 +1,303 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+DEFAULT_CAPACITY = 80
+
+# Cache respons /forecast; 0 entri = cache nonaktif
+FORECAST_CACHE_SIZE = int(os.environ.get("FORECAST_CACHE_SIZE", "4096"))
+FORECAST_CACHE_TTL = float(os.environ.get("FORECAST_CACHE_TTL", "600"))
+# current_load dibulatkan ke kelipatan ini sebelum prediksi (supaya bus dengan load mirip berbagi entri)
+FORECAST_LOAD_STEP = float(os.environ.get("FORECAST_LOAD_STEP", "1"))
+
+# WIB tanpa DST, jadi offset tetap cukup (tidak perlu pytz)
+WIB = timezone(timedelta(hours=7), "Asia/Jakarta")
+
+# 0 = NB (BlokM→Kota), 1 = SB (Kota→BlokM), seperti kolom direction di dataset
+DIRECTIONS = {
+    "0": 0, "nb": 0, "blokm→kota": 0, "blokm->kota": 0,
+    "1": 1, "sb": 1, "kota→blokm": 1, "kota->blokm": 1,
+}
+DIRECTION_NAMES = {0: "BlokM→Kota", 1: "Kota→BlokM"}
+
+
+def parse_direction(value):
+    direction = DIRECTIONS.get(str(value).strip().lower().replace(" ", ""))
+    if direction is None:
+        raise ValueError(f"Unknown direction: {value}")
+    return direction
+
+
+class ForecastCache:
+    """
+    LRU + TTL cache for forecast responses.
+
+    Keys are (stop_seq, direction, quantized load, cap, dow, hour, model
+    version): the features only depend on the hour and day of week, so one
+    entry serves every bus leaving the same stop with a similar load in that
+    hour. A new model version never hits old entries; clear() drops them.
+    """
+
+    def __init__(self, max_entries=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL, load_step=FORECAST_LOAD_STEP):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.load_step = load_step
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def quantize(self, load):
+        if self.load_step <= 0:
+            return load
+        return round(load / self.load_step) * self.load_step
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "load_step": self.load_step,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+            }
+
+
+class Forecaster:
+    """
+    Downstream load forecast for one bus, as in forecast_downstream() of
+    forecast.ipynb, but with a single model.predict for the whole route.
+
+    The notebook feeds each predicted load back in as the next stop's
+    prev_load, which needs one predict per stop. Here prev_load for the
+    stops after the first is propagated from current_load with the
+    board/alight priors of the stops in between (clipped to cap), so all
+    feature rows are known up front. The predictions are clipped to cap.
+    Priors, dwell times and stop ids come from a PriorsIndex.
+    """
+
+    def __init__(self, model, builder, index, version=""):
+        self.model = model
+        self.version = version
+        self.builder = builder
+        self.index = index
+        self.predict_calls = 0
+        self.predicted_rows = 0
+        self._stats_lock = threading.Lock()  # _run dipanggil bersamaan dari handler Flask
+
+    @classmethod
+    def from_artifacts(cls, model, builder, index, version=""):
+        """Build from the artifacts app.py loads; returns None if the model or features are missing."""
+        if model is None or builder is None or index is None:
+            return None
+        return cls(builder.positional(model), builder, index, version=version)
+
+    def count_predict(self, rows):
+        with self._stats_lock:
+            self.predict_calls += 1
+            self.predicted_rows += rows
+
+    def stop_name(self, direction, stop_seq):
+        return self.index.stop_name(direction, stop_seq)
+
+    def resolve_stop(self, origin_stop, direction):
+        """Stop name (as LoadTracker sends it) or stop_seq -> stop_seq."""
+        return self.index.stop_id(origin_stop, direction)
+
+    def build_features(self, direction, seqs, current_load, cap, now, out=None):
+        hour, dow = now.hour, now.weekday()
+        is_weekend = int(dow >= 5)
+
+        board, alight, load_prior = self.index.priors(direction, seqs, hour)
+        board = np.nan_to_num(board)
+        alight = np.nan_to_num(alight)
+
+        # prev_load tiap halte = load awal + net naik/turun prior dari halte-halte sebelumnya
+        net = np.concatenate(([0.0], np.cumsum(board - alight)[:-1]))
+        prev_load = np.clip(current_load + net, 0.0, cap)
+        # tanpa prior untuk jam ini: load_prior = prev_load (sama seperti notebook)
+        load_prior = np.where(np.isnan(load_prior), prev_load, load_prior)
+
+        return self.builder.build(
+            len(seqs), hour=hour, dow=dow, direction=direction,
+            prev_load=prev_load, load_prior=load_prior, board_prior=board, alight_prior=alight,
+            dwell_s=self.index.dwell_s(direction, seqs, is_weekend, hour), out=out,
+        )
+
+    def prepare(self, origin_stop, direction, current_load, cap, now, cache=None):
+        """
+        Validate one request into a query dict (direction, stop_seq,
+        current_load, cap, cache key, downstream seqs); raises ValueError
+        with a message meant for the caller.
+        """
+        direction = parse_direction(direction)
+        stop_seq = self.resolve_stop(origin_stop, direction)
+        try:
+            current_load = float(current_load)
+            cap = float(cap)
+        except (TypeError, ValueError):
+            raise ValueError("current_load and cap must be numbers")
+        if not (np.isfinite(current_load) and np.isfinite(cap)) or cap <= 0:
+            raise ValueError("current_load must be a number and cap a positive number")
+        current_load = min(max(current_load, 0.0), cap)
+
+        key = None
+        if cache is not None and cache.enabled:
+            current_load = min(max(cache.quantize(current_load), 0.0), cap)
+            key = (stop_seq, direction, current_load, cap, now.weekday(), now.hour, self.version)
+        return {"direction": direction, "stop_seq": stop_seq, "current_load": current_load, "cap": cap,
+                "key": key, "seqs": self.index.downstream(direction, stop_seq)}
+
+    def _run(self, queries, now, cache, tables=None):
+        """
+        Answer prepared queries: precomputed tables first, then cache hits,
+        then one model.predict over everything that is left.
+        """
+        results = [None] * len(queries)
+        pending = {}  # key atau index -> posisi query yang dihitung; duplikat dalam satu batch dihitung sekali
+        for i, query in enumerate(queries):
+            if tables is not None:
+                loads = tables.lookup(query, now, self.version)
+                if loads is not None:
+                    results[i] = self.make_result(query, now, loads)
+                    continue
+            if query["key"] is not None:
+                cached = cache.get(query["key"])
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            pending.setdefault(query["key"] if query["key"] is not None else ("query", i), []).append(i)
+
+        computed = [positions[0] for positions in pending.values()]
+        rows = sum(len(queries[i]["seqs"]) for i in computed)
+        loads = np.empty(0)
+        if rows:
+            X = self.builder.buffer(rows)
+            offset = 0
+            for i in computed:
+                query = queries[i]
+                n = len(query["seqs"])
+                self.build_features(query["direction"], query["seqs"], query["current_load"], query["cap"], now,
+                                    out=X[offset:offset + n])
+                offset += n
+            loads = self.model.predict(X)
+            self.count_predict(rows)
+
+        offset = 0
+        for positions in pending.values():
+            query = queries[positions[0]]
+            n = len(query["seqs"])
+            result = self.make_result(query, now, loads[offset:offset + n])
+            offset += n
+            if query["key"] is not None:
+                cache.put(query["key"], result)
+            for i in positions:
+                results[i] = result
+        return results
+
+    def make_result(self, query, now, loads):
+        """Response dict for a prepared query and the predicted loads of its downstream stops."""
+        direction, cap = query["direction"], query["cap"]
+        loads = np.clip(loads, 0.0, cap)
+        return {
+            "origin_stop": self.stop_name(direction, query["stop_seq"]),
+            "origin_stop_seq": query["stop_seq"],
+            "direction": DIRECTION_NAMES[direction],
+            "current_load": query["current_load"],
+            "cap": cap,
+            "hour": now.hour,
+            "dow": now.weekday(),
+            "forecasts": [
+                {"stop_seq": int(seq), "stop": self.stop_name(direction, seq),
+                 "forecast_load_after": int(round(load))}
+                for seq, load in zip(query["seqs"], loads)
+            ],
+        }
+
+    def forecast(self, origin_stop, direction, current_load, cap=DEFAULT_CAPACITY, now=None, cache=None,
+                 tables=None):
+        """
+        Forecast load_after for every stop after origin_stop.
+
+        current_load is the load when leaving origin_stop (LoadTracker commits
+        it at departure), so origin_stop itself is not forecast. With a
+        ForecastCache the load is quantized first and the result may be shared
+        with other callers, so it must not be modified. With ForecastTables the
+        answer is read from the precomputed table when one matches.
+        """
+        now = now or datetime.now(WIB)
+        query = self.prepare(origin_stop, direction, current_load, cap, now, cache)
+        return self._run([query], now, cache, tables)[0]
+
+    def forecast_many(self, requests, now=None, cache=None, tables=None):
+        """
+        forecast() for many buses with a single model.predict.
+
+        requests: dicts with origin_stop, direction, current_load and cap.
+        Returns one entry per request, in order; an invalid request gets
+        {"error": ...} instead of failing the whole batch.
+        """
+        now = now or datetime.now(WIB)
+        results = [None] * len(requests)
+        queries, positions = [], []
+        for i, request in enumerate(requests):
+            if not isinstance(request, dict):
+                results[i] = {"error": "Expected an object"}
+                continue
+            try:
+                queries.append(self.prepare(request.get("origin_stop"), request.get("direction"),
+                                             request.get("current_load", 0), request.get("cap", DEFAULT_CAPACITY),
+                                             now, cache))
+                positions.append(i)
+            except ValueError as e:
+                results[i] = {"error": str(e)}
+        for i, result in zip(positions, self._run(queries, now, cache, tables)):
+            results[i] = result
+        return results
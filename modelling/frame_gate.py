@@ -0,0 +1,212 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Frame yang umurnya lebih dari ini (detik) ditolak; 0 = nonaktif
+FRAME_MAX_AGE = float(os.environ.get("FRAME_MAX_AGE", "2.0"))
+# Offset jam kamera diukur ulang setelah sekian frame basi berturut-turut (mis. jam device disinkron ulang)
+FRAME_CLOCK_RESYNC = int(os.environ.get("FRAME_CLOCK_RESYNC", "5"))
+
+
+class FrameDropped(Exception):
+    """Raised when a frame is not processed: 'superseded' by a newer one or 'stale'."""
+
+    def __init__(self, camera_id, reason, retry_after_ms):
+        super().__init__(f"Frame {reason} for camera {camera_id}")
+        self.camera_id = camera_id
+        self.reason = reason
+        self.retry_after_ms = retry_after_ms
+
+    def to_dict(self):
+        return {
+            "status": "dropped",
+            "reason": self.reason,
+            "camera_id": self.camera_id,
+            "retry_after_ms": self.retry_after_ms,
+        }
+
+    def retry_after_header(self):
+        """Retry-After is whole seconds."""
+        return str(max(1, math.ceil(self.retry_after_ms / 1000.0)))
+
+
+class _CameraSlot:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.busy = False
+        self.latest_ticket = 0
+        self.avg_processing = 0.0  # EWMA detik
+        self.processed = 0
+        self.dropped_superseded = 0
+        self.dropped_stale = 0
+        self.clock_offset = None  # min(waktu terima server - capture_ts), detik
+        self.clock_streak = 0  # drop berturut-turut karena capture_ts
+        self.last_capture_ts = None
+        self.last_seen = time.time()
+
+
+class FrameGate:
+    """
+    Bounded per-camera ingress slot with latest-frame-wins semantics.
+
+    At most one frame per camera is processed and at most one waits behind
+    it: a newer frame replaces (supersedes) the one still waiting, and frames
+    older than max_frame_age are rejected as stale.
+
+    A frame's age is measured with the server clock: the time it has spent
+    here since it was received, plus how much later it arrived than the
+    camera's fastest frame so far. capture_ts comes from the device clock,
+    so it is only compared against other frames of the same camera (the
+    per-camera offset and ordering), never against time.time() directly.
+    """
+
+    def __init__(self, max_frame_age=FRAME_MAX_AGE, ewma_alpha=0.2, clock_resync=FRAME_CLOCK_RESYNC,
+                 idle_timeout=None, sweep_interval=30.0):
+        self.max_frame_age = max_frame_age
+        self.ewma_alpha = ewma_alpha
+        self.clock_resync = clock_resync
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def _slot(self, camera_id):
+        now = time.time()
+        with self._lock:
+            if self.idle_timeout and now - self._last_sweep >= self.sweep_interval:
+                self._evict_idle(now, self.idle_timeout)
+            slot = self._slots.get(camera_id)
+            if slot is None:
+                slot = self._slots[camera_id] = _CameraSlot()
+            slot.last_seen = now
+            return slot
+
+    def forget(self, camera_id):
+        """Drop the camera's slot (called when its session is evicted)."""
+        with self._lock:
+            return self._slots.pop(camera_id, None) is not None
+
+    def evict_idle(self, idle_timeout):
+        with self._lock:
+            return self._evict_idle(time.time(), idle_timeout)
+
+    def _evict_idle(self, now, idle_timeout):
+        self._last_sweep = now
+        expired = [camera_id for camera_id, slot in self._slots.items()
+                   if not slot.busy and now - slot.last_seen > idle_timeout]
+        for camera_id in expired:
+            del self._slots[camera_id]
+        return expired
+
+    def _transit_lag(self, slot, capture_ts, received_at):
+        """Delay beyond the camera's fastest frame so far; updates the per-camera clock offset."""
+        if capture_ts is None:
+            return 0.0
+        offset = received_at - capture_ts
+        if slot.clock_offset is None or offset < slot.clock_offset:
+            slot.clock_offset = offset
+        return offset - slot.clock_offset
+
+    def _is_stale(self, lag, received_at):
+        if not self.max_frame_age:
+            return False
+        return lag + (time.time() - received_at) > self.max_frame_age
+
+    def _drop_by_clock(self, camera_id, slot, reason):
+        """Drop decided from capture_ts; a run of these means the device clock moved, so re-measure it."""
+        slot.clock_streak += 1
+        if self.clock_resync and slot.clock_streak >= self.clock_resync:
+            slot.clock_offset = None
+            slot.last_capture_ts = None
+            slot.clock_streak = 0
+        self._drop(camera_id, slot, reason)
+
+    def _count_drop(self, camera_id, slot, reason):
+        if reason == "stale":
+            slot.dropped_stale += 1
+        else:
+            slot.dropped_superseded += 1
+        return FrameDropped(camera_id, reason, self._retry_after_ms(slot))
+
+    def _drop(self, camera_id, slot, reason):
+        raise self._count_drop(camera_id, slot, reason)
+
+    @staticmethod
+    def _retry_after_ms(slot):
+        return int(round(slot.avg_processing * 1000.0))
+
+    @contextmanager
+    def admit(self, camera_id, capture_ts=None):
+        """Wait for the camera's slot; raises FrameDropped if superseded or stale."""
+        received_at = time.time()
+        slot = self._slot(camera_id)
+        with slot.cond:
+            if capture_ts is not None and slot.last_capture_ts is not None and capture_ts < slot.last_capture_ts:
+                # lebih tua dari frame kamera ini yang sudah diproses
+                self._drop_by_clock(camera_id, slot, "superseded")
+            lag = self._transit_lag(slot, capture_ts, received_at)
+            if self._is_stale(lag, received_at):
+                self._drop_by_clock(camera_id, slot, "stale")
+            slot.latest_ticket += 1
+            ticket = slot.latest_ticket
+            slot.cond.notify_all()  # frame yang masih menunggu langsung gugur
+            while slot.busy and slot.latest_ticket == ticket:
+                slot.cond.wait()
+            if slot.latest_ticket != ticket:
+                self._drop(camera_id, slot, "superseded")
+            if self._is_stale(lag, received_at):
+                self._drop(camera_id, slot, "stale")
+            slot.busy = True
+            slot.clock_streak = 0
+            if capture_ts is not None:
+                slot.last_capture_ts = capture_ts
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with slot.cond:
+                slot.busy = False
+                slot.processed += 1
+                if slot.avg_processing == 0.0:
+                    slot.avg_processing = elapsed
+                else:
+                    slot.avg_processing += self.ewma_alpha * (elapsed - slot.avg_processing)
+                slot.cond.notify_all()
+
+    def record_drop(self, camera_id, reason):
+        """Count a frame dropped outside admit() (e.g. coalesced in a WebSocket queue)."""
+        slot = self._slot(camera_id)
+        with slot.cond:
+            return self._count_drop(camera_id, slot, reason)
+
+    def next_frame_in_ms(self, camera_id):
+        """Hint for clients: send the next frame after roughly one processing time."""
+        slot = self._slot(camera_id)
+        with slot.cond:
+            return self._retry_after_ms(slot)
+
+    def stats(self):
+        with self._lock:
+            slots = dict(self._slots)
+        cameras = {}
+        for camera_id, slot in slots.items():
+            with slot.cond:
+                cameras[camera_id] = {
+                    "processed": slot.processed,
+                    "dropped_superseded": slot.dropped_superseded,
+                    "dropped_stale": slot.dropped_stale,
+                    "avg_processing_ms": slot.avg_processing * 1000.0,
+                    "busy": slot.busy,
+                    "clock_offset_s": slot.clock_offset,
+                }
+        return {
+            "max_frame_age_s": self.max_frame_age,
+            "dropped_superseded": sum(c["dropped_superseded"] for c in cameras.values()),
+            "dropped_stale": sum(c["dropped_stale"] for c in cameras.values()),
+            "cameras": cameras,
+        }
@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Batas batch dan jendela tunggu bisa diatur lewat env tanpa ubah kode
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("BATCH_WAIT_MS", "10"))
+
+
+class _InferenceRequest:
+    def __init__(self, frame, imgsz=None):
+        self.frame = frame
+        self.imgsz = imgsz
+        self.enqueued_at = time.perf_counter()
+        self.future = Future()
+
+
+class InferenceScheduler:
+    """
+    Central micro-batching scheduler for the YOLO detector.
+
+    Concurrent requests call submit(frame); a single worker thread gathers
+    frames until max_batch_size is reached or max_wait_ms has passed since
+    the oldest queued frame, runs one batched predict_fn(frames) call and
+    routes each result back to the waiting request.
+
+    A batch only contains frames with the same imgsz (cameras can run at
+    different resolutions, see latency_controller); frames with another
+    imgsz stay in a backlog and are served first in the next batch.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, stats_window=500):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._backlog = deque()  # hanya disentuh worker thread
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._imgsz_frames = Counter()
+        self._queue_waits = deque(maxlen=stats_window)
+        self._inference_times = deque(maxlen=stats_window)
+        self._batches = 0
+        self._frames = 0
+        self._errors = 0
+
+        self._worker = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, frame, imgsz=None, timeout=None):
+        """Queue a frame for batched inference and block until its result is ready."""
+        request = _InferenceRequest(frame, imgsz)
+        self._queue.put(request)
+        return request.future.result(timeout=timeout)
+
+    def submit_many(self, frames, imgsz=None, timeout=None):
+        """Queue several frames (e.g. tiles of one frame) at once so they land in the same batch."""
+        requests = [_InferenceRequest(frame, imgsz) for frame in frames]
+        for request in requests:
+            self._queue.put(request)
+        return [request.future.result(timeout=timeout) for request in requests]
+
+    def queue_depth(self):
+        return self._queue.qsize() + len(self._backlog)
+
+    def _collect_batch(self):
+        first = self._backlog.popleft() if self._backlog else self._queue.get()
+        batch = [first]
+        held = []
+        while self._backlog and len(batch) < self.max_batch_size:
+            request = self._backlog.popleft()
+            (batch if request.imgsz == first.imgsz else held).append(request)
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    request = self._queue.get_nowait()
+                else:
+                    request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            (batch if request.imgsz == first.imgsz else held).append(request)
+        # imgsz lain menunggu batch berikutnya, urutan kedatangan tetap
+        self._backlog.extendleft(reversed(held))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            imgsz = batch[0].imgsz
+            started = time.perf_counter()
+            try:
+                frames = [request.frame for request in batch]
+                results = self.predict_fn(frames, imgsz=imgsz) if imgsz else self.predict_fn(frames)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"predict_fn returned {len(results)} results for {len(batch)} frames")
+            except Exception as e:
+                print(f"❌ Batched inference failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                with self._stats_lock:
+                    self._errors += 1
+                continue
+
+            finished = time.perf_counter()
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._frames += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._imgsz_frames[imgsz or "default"] += len(batch)
+                self._inference_times.append(finished - started)
+                self._queue_waits.extend(started - request.enqueued_at for request in batch)
+
+    def stats(self):
+        """Batch size and queue wait metrics for /api/inference."""
+        with self._stats_lock:
+            waits_ms = np.array(self._queue_waits, dtype=float) * 1000.0
+            infer_ms = np.array(self._inference_times, dtype=float) * 1000.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self._batches,
+                "frames": self._frames,
+                "errors": self._errors,
+                "avg_batch_size": (self._frames / self._batches) if self._batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "frames_by_imgsz": {str(imgsz): count for imgsz, count in self._imgsz_frames.items()},
+                "queue_depth": self.queue_depth(),
+                "queue_wait_ms": _summarize(waits_ms),
+                "inference_ms": _summarize(infer_ms),
+            }
+
+
+def _summarize(values_ms):
+    if values_ms.size == 0:
+        return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "avg": float(values_ms.mean()),
+        "p50": float(np.percentile(values_ms, 50)),
+        "p95": float(np.percentile(values_ms, 95)),
+        "max": float(values_ms.max()),
+    }
@@ -0,0 +1,120 @@
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+# Target p95 latensi deteksi per kamera (ms); 0 = controller nonaktif
+SLO_TARGET_P95_MS = float(os.environ.get("SLO_TARGET_P95_MS", "250"))
+SLO_IMGSZ_STEPS = tuple(int(s) for s in os.environ.get("SLO_IMGSZ_STEPS", "640,480,320").split(","))
+SLO_MAX_STRIDE = int(os.environ.get("SLO_MAX_STRIDE", "4"))
+SLO_QUEUE_LIMIT = int(os.environ.get("SLO_QUEUE_LIMIT", "8"))
+
+
+class LatencyController:
+    """
+    Per-camera latency-SLO controller.
+
+    Degradation levels go first down the detector input sizes (640 -> 480 ->
+    320) and then up the processing stride (every 2nd, 3rd, ... frame).
+    For a camera with tiled inference the first step is to turn tiling off:
+    tiles are only run at the full input size, since shrinking them would
+    undo the small-person gain they are there for. After each processed
+    frame observe() looks at the recent p95 latency and the inference queue
+    depth and moves at most one level, with a cooldown so a single slow
+    batch does not cause flapping.
+    """
+
+    def __init__(self, target_p95_ms=SLO_TARGET_P95_MS, imgsz_steps=SLO_IMGSZ_STEPS,
+                 max_stride=SLO_MAX_STRIDE, queue_limit=SLO_QUEUE_LIMIT,
+                 window=20, cooldown=10, recover_ratio=0.6):
+        self.target_p95_ms = target_p95_ms
+        self.queue_limit = queue_limit
+        self.cooldown = cooldown
+        self.recover_ratio = recover_ratio
+        # (imgsz, stride, tiling); level 0 hanya beda dari level 1 untuk kamera dengan tiling
+        self.levels = [(imgsz_steps[0], 1, True)]
+        self.levels += [(imgsz, 1, False) for imgsz in imgsz_steps]
+        self.levels += [(imgsz_steps[-1], stride, False) for stride in range(2, max_stride + 1)]
+        self.level = 0
+        self.latencies = deque(maxlen=window)
+        self.frames_since_change = 0
+        self.frame_counter = 0
+        self.changes = 0
+        self.last_change = None
+
+    @property
+    def enabled(self):
+        return self.target_p95_ms > 0
+
+    @property
+    def imgsz(self):
+        return self.levels[self.level][0]
+
+    @property
+    def stride(self):
+        return self.levels[self.level][1]
+
+    @property
+    def tiling(self):
+        """False once the controller has backed off tiled inference."""
+        return self.levels[self.level][2]
+
+    def should_process(self):
+        """True if this frame should run the detector under the current stride."""
+        self.frame_counter += 1
+        return not self.enabled or self.frame_counter % self.stride == 0
+
+    def p95_ms(self):
+        return float(np.percentile(self.latencies, 95)) if self.latencies else 0.0
+
+    def observe(self, latency_ms, queue_depth=0, tiled=False):
+        """
+        Record one processed frame; returns a change dict when the level moved, else None.
+        tiled: whether the camera has tiling configured (else the tiling level is skipped).
+        """
+        if not self.enabled:
+            return None
+        self.latencies.append(latency_ms)
+        self.frames_since_change += 1
+        if self.frames_since_change < self.cooldown:
+            return None
+
+        p95 = self.p95_ms()
+        if (p95 > self.target_p95_ms or queue_depth > self.queue_limit) and self.level < len(self.levels) - 1:
+            reason = "p95_over_target" if p95 > self.target_p95_ms else "queue_depth"
+            return self._move(+1, reason, p95, queue_depth, tiled)
+        if p95 < self.target_p95_ms * self.recover_ratio and queue_depth == 0 and self.level > int(not tiled):
+            return self._move(-1, "recovered", p95, queue_depth, tiled)
+        return None
+
+    def _move(self, step, reason, p95, queue_depth, tiled):
+        previous = {"imgsz": self.imgsz, "stride": self.stride, "tiling": self.tiling and tiled}
+        self.level += step
+        if not tiled and self.level == 1 and step > 0 and len(self.levels) > 2:
+            self.level = 2  # level 0 -> 1 hanya mematikan tiling, tidak berarti tanpa tiling
+        self.latencies.clear()
+        self.frames_since_change = 0
+        self.changes += 1
+        self.last_change = {
+            "from": previous,
+            "to": {"imgsz": self.imgsz, "stride": self.stride, "tiling": self.tiling and tiled},
+            "reason": reason,
+            "p95_ms": p95,
+            "queue_depth": queue_depth,
+            "timestamp": time.time(),
+        }
+        return self.last_change
+
+    def state(self):
+        return {
+            "enabled": self.enabled,
+            "imgsz": self.imgsz,
+            "stride": self.stride,
+            "tiling": self.tiling,
+            "level": self.level,
+            "p95_ms": self.p95_ms(),
+            "target_p95_ms": self.target_p95_ms,
+            "changes": self.changes,
+            "last_change": self.last_change,
+        }
@@ -0,0 +1,269 @@
+"""
+Multi-camera load generator for app.py /process and flask_server.py /upload.
+
+Every simulated bus is a thread with its own camera id and HTTP session
+that posts frames from recorded clips at a fixed cadence (2 fps like the
+browser client, higher for edge boxes), with start times spread over one
+period. Reports achieved throughput, latency percentiles, error/drop rates
+and, afterwards, whether the server-side counts per camera match the last
+response each bus received.
+
+Contoh:
+    python load_generator.py --clips reference_clips --buses 200 --fps 2 --duration 60
+    python load_generator.py --target upload --url http://localhost:5003 --buses 20
+    python load_generator.py --clips reference_clips --ramp 50,100,200,400 --duration 30 --output load.json
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+import requests
+
+from clips import list_clips
+
+TARGETS = {"process": "/process", "upload": "/upload"}
+
+
+def load_frames(clips_dir, max_frames, width, quality=80):
+    """Decode clips once and keep JPEG bytes so the generator itself stays cheap."""
+    clips = list_clips(clips_dir)
+    frames = []
+    for clip in clips:
+        cap = cv2.VideoCapture(clip)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if width and frame.shape[1] > width:
+                frame = cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])))
+            frames.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        cap.release()
+    if not frames:
+        # tanpa klip: frame sintetis supaya jalur HTTP + inference tetap bisa diuji
+        noise = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        frames.append(cv2.imencode(".jpg", noise, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        print(f"⚠️ No clips in {clips_dir}, using a synthetic frame")
+    return frames
+
+
+class LoadResults:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.late = 0
+        self.last_response = {}  # camera_id -> JSON terakhir yang sukses
+
+    def record(self, camera_id, status, latency, body=None):
+        with self.lock:
+            self.statuses[status] += 1
+            if status == 200:
+                self.latencies.append(latency)
+                if body is not None:
+                    self.last_response[camera_id] = body
+
+    def record_error(self, kind):
+        with self.lock:
+            self.errors[kind] += 1
+
+    def record_late(self):
+        with self.lock:
+            self.late += 1
+
+
+class BusSimulator(threading.Thread):
+    """One bus camera posting frames at `fps` until `stop_at`."""
+
+    def __init__(self, camera_id, base_url, target, frames, fps, start_at, stop_at, results, mode, timeout):
+        super().__init__(daemon=True)
+        self.camera_id = camera_id
+        self.url = base_url.rstrip("/") + TARGETS[target]
+        self.target = target
+        self.frames = frames
+        self.period = 1.0 / fps
+        self.start_at = start_at
+        self.stop_at = stop_at
+        self.results = results
+        self.mode = mode
+        self.timeout = timeout
+        self.offset = random.randrange(len(frames))
+
+    def _send(self, session, seq, jpeg):
+        capture_ts = time.time()
+        if self.target == "process":
+            return session.post(self.url, data=jpeg, params={"mode": self.mode}, timeout=self.timeout, headers={
+                "Content-Type": "image/jpeg",
+                "X-Camera-Id": self.camera_id,
+                "X-Frame-Seq": str(seq),
+                "X-Capture-Ts": f"{capture_ts:.3f}",
+            })
+        payload = {
+            "frame": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii"),
+            "camera_id": self.camera_id,
+            "frame_number": seq,
+            "capture_ts": capture_ts,
+        }
+        return session.post(self.url, json=payload, timeout=self.timeout)
+
+    def run(self):
+        session = requests.Session()
+        next_at = self.start_at
+        seq = 0
+        while True:
+            now = time.time()
+            if next_at > now:
+                time.sleep(next_at - now)
+            if time.time() >= self.stop_at:
+                break
+            jpeg = self.frames[(self.offset + seq) % len(self.frames)]
+            started = time.perf_counter()
+            try:
+                response = self._send(session, seq, jpeg)
+                latency = time.perf_counter() - started
+                body = response.json() if response.status_code == 200 else None
+                self.results.record(self.camera_id, response.status_code, latency, body)
+            except requests.exceptions.Timeout:
+                self.results.record_error("timeout")
+            except requests.exceptions.RequestException as e:
+                self.results.record_error(type(e).__name__)
+            except ValueError:
+                self.results.record_error("invalid_json")
+            seq += 1
+            next_at += self.period
+            if next_at < time.time():
+                # server terlalu lambat untuk cadence ini: lewati slot yang terlewat
+                self.results.record_late()
+                next_at = time.time()
+        session.close()
+
+
+def check_consistency(base_url, target, results):
+    """Compare the server-side counts per camera with the last response each bus received."""
+    checked, mismatched = 0, []
+    if target == "upload":
+        # flask_server punya satu counter global: total frame di /stats >= jumlah respons 200
+        stats = requests.get(base_url.rstrip("/") + "/stats", timeout=5).json()
+        ok = results.statuses.get(200, 0)
+        return {"server_frames_processed": stats.get("frames_processed"), "client_ok_responses": ok,
+                "consistent": stats.get("frames_processed", 0) >= ok}
+
+    for camera_id, last in sorted(results.last_response.items()):
+        try:
+            server = requests.get(f"{base_url.rstrip('/')}/api/occupancy/{camera_id}", timeout=5).json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            mismatched.append({"camera_id": camera_id, "error": str(e)})
+            continue
+        checked += 1
+        if server.get("total_entered") != last.get("count_down") or server.get("total_exited") != last.get("count_up"):
+            mismatched.append({
+                "camera_id": camera_id,
+                "client": {"in": last.get("count_down"), "out": last.get("count_up")},
+                "server": {"in": server.get("total_entered"), "out": server.get("total_exited")},
+            })
+    return {"cameras_checked": checked, "mismatched": mismatched, "consistent": not mismatched}
+
+
+def summarize(results, buses, fps, duration):
+    latencies_ms = np.array(results.latencies, dtype=float) * 1000.0
+    sent = sum(results.statuses.values()) + sum(results.errors.values())
+    ok = results.statuses.get(200, 0)
+    dropped = results.statuses.get(429, 0)
+    failed = sent - ok - dropped
+    return {
+        "buses": buses,
+        "target_fps_per_bus": fps,
+        "offered_rps": buses * fps,
+        "duration_s": duration,
+        "sent": sent,
+        "throughput_rps": ok / duration if duration else 0.0,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies_ms, 50)) if latencies_ms.size else None,
+            "p95": float(np.percentile(latencies_ms, 95)) if latencies_ms.size else None,
+            "p99": float(np.percentile(latencies_ms, 99)) if latencies_ms.size else None,
+            "max": float(latencies_ms.max()) if latencies_ms.size else None,
+        },
+        "status_codes": {str(code): count for code, count in sorted(results.statuses.items())},
+        "client_errors": dict(results.errors),
+        "drop_rate": dropped / sent if sent else 0.0,
+        "error_rate": failed / sent if sent else 0.0,
+        "late_sends": results.late,
+    }
+
+
+def run_step(args, frames, buses):
+    results = LoadResults()
+    start_at = time.time() + 1.0
+    stop_at = start_at + args.duration
+    period = 1.0 / args.fps
+    simulators = [
+        BusSimulator(f"{args.camera_prefix}{i:04d}", args.url, args.target, frames, args.fps,
+                     start_at + random.uniform(0, period), stop_at, results, args.response_mode, args.timeout)
+        for i in range(buses)
+    ]
+    for simulator in simulators:
+        simulator.start()
+    for simulator in simulators:
+        simulator.join(timeout=args.duration + args.timeout + 5)
+
+    summary = summarize(results, buses, args.fps, args.duration)
+    summary["consistency"] = check_consistency(args.url, args.target, results)
+    return summary
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-camera load generator for /process and /upload")
+    ap.add_argument("--url", default="http://localhost:8081", help="server base URL (flask_server: :5003)")
+    ap.add_argument("--target", choices=sorted(TARGETS), default="process")
+    ap.add_argument("--clips", default="reference_clips", help="folder of recorded clips used as frames")
+    ap.add_argument("--buses", type=int, default=50, help="simulated buses (one camera id each)")
+    ap.add_argument("--ramp", default=None, help="comma-separated bus counts to step through, e.g. 50,100,200")
+    ap.add_argument("--fps", type=float, default=2.0, help="frames per second per bus (browser client = 2)")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds per step")
+    ap.add_argument("--max-frames", type=int, default=300, help="frames loaded from the clips")
+    ap.add_argument("--width", type=int, default=640, help="resize frames to this width")
+    ap.add_argument("--response-mode", choices=("full", "detections"), default="detections")
+    ap.add_argument("--camera-prefix", default="loadbus-")
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--max-p95-ms", type=float, default=1000.0, help="p95 above this marks saturation")
+    ap.add_argument("--max-error-rate", type=float, default=0.01, help="error rate above this marks saturation")
+    ap.add_argument("--output", default=None, help="write the results as JSON")
+    args = ap.parse_args()
+
+    frames = load_frames(args.clips, args.max_frames, args.width)
+    steps = [int(n) for n in args.ramp.split(",")] if args.ramp else [args.buses]
+    print(f"🚌 {len(frames)} frames loaded, target {args.url}{TARGETS[args.target]}, steps {steps}")
+
+    report = {"url": args.url, "target": args.target, "timestamp": time.time(), "steps": []}
+    for buses in steps:
+        print(f"▶️  {buses} buses x {args.fps} fps for {args.duration:.0f}s...")
+        summary = run_step(args, frames, buses)
+        p95 = summary["latency_ms"]["p95"]
+        # jenuh: latensi/error di atas batas, atau kurang dari 90% frame yang ditawarkan terlayani
+        summary["saturated"] = (p95 is None or p95 > args.max_p95_ms
+                                or summary["error_rate"] > args.max_error_rate
+                                or summary["throughput_rps"] < 0.9 * summary["offered_rps"])
+        report["steps"].append(summary)
+        print(f"   {summary['throughput_rps']:.1f}/{summary['offered_rps']:.1f} rps, "
+              f"p50 {summary['latency_ms']['p50'] or 0:.0f} ms, p95 {p95 or 0:.0f} ms, "
+              f"drop {summary['drop_rate']:.1%}, error {summary['error_rate']:.1%}, "
+              f"consistent={summary['consistency']['consistent']}"
+              + ("  ⚠️ saturated" if summary["saturated"] else ""))
+        if summary["saturated"] and args.ramp:
+            print(f"🛑 Saturation reached at {buses} buses")
+            break
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Batas bucket histogram (detik), gaya Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class StageTimer:
+    """
+    Collects the durations of one frame's stages: `with timer.stage("decode"): ...`.
+
+    Stage names used by the servers: parse, decode, motion, inference,
+    tracking, line_crossing, render, encode, response.
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + (time.perf_counter() - started)
+
+    def total(self):
+        return sum(self.durations.values())
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # bucket terakhir = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class LatencyMetrics:
+    """
+    Per-camera, per-stage latency histograms with Prometheus text export.
+
+    Plain Python (no prometheus_client dependency); record() is called once
+    per frame with a StageTimer's durations.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}  # (camera_id, stage) -> _Histogram
+        self._lock = threading.Lock()
+
+    def record(self, camera_id, durations):
+        with self._lock:
+            for stage, seconds in durations.items():
+                key = (camera_id, stage)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram(self.buckets)
+                histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram.sum += seconds
+                histogram.count += 1
+
+    def summary(self):
+        """{camera_id: {stage: {"count", "avg_ms"}}} for the JSON stats endpoints."""
+        with self._lock:
+            result = {}
+            for (camera_id, stage), histogram in sorted(self._histograms.items()):
+                result.setdefault(camera_id, {})[stage] = {
+                    "count": histogram.count,
+                    "avg_ms": (histogram.sum / histogram.count) * 1000.0 if histogram.count else 0.0,
+                }
+            return result
+
+    def prometheus_lines(self, name="crowd_stage_latency_seconds"):
+        lines = [f"# HELP {name} Frame processing latency per pipeline stage.",
+                 f"# TYPE {name} histogram"]
+        with self._lock:
+            for (camera_id, stage), histogram in sorted(self._histograms.items()):
+                labels = {"camera": camera_id, "stage": stage}
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{format_labels({**labels, 'le': le})} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum!r}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def metric_lines(name, metric_type, help_text, samples):
+    """Prometheus lines for a gauge/counter; samples = [(labels_dict, value), ...]."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    lines += [f"{name}{format_labels(labels)} {value}" for labels, value in samples]
+    return lines
+
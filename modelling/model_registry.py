@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from detector_backend import DETECTOR_IMGSZ, int8_path, load_detector
+
+MODEL_WARMUP_RUNS = int(os.environ.get("MODEL_WARMUP_RUNS", "2"))
+# Interval cek perubahan file weights (detik); 0 = file watcher nonaktif
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "0"))
+# Load pertama yang gagal dicoba ulang dengan backoff (detik, dikali 2 tiap percobaan sampai MAX)
+MODEL_LOAD_RETRY_S = float(os.environ.get("MODEL_LOAD_RETRY_S", "5"))
+MODEL_LOAD_RETRY_MAX_S = float(os.environ.get("MODEL_LOAD_RETRY_MAX_S", "300"))
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when inference is requested before the first detector finished warming up."""
+
+
+class ModelRegistry:
+    """
+    Owns the live Detector.
+
+    Weights are loaded once in a background thread and warmed up (one dummy
+    inference per input size) before the registry reports ready. reload()
+    builds and warms the new detector next to the running one and then
+    swaps the reference; batches already running keep the detector they
+    started with, so in-flight requests are never dropped. A failed first
+    load is retried with exponential backoff until a detector is up.
+
+    Weights given to reload() must live inside model_dir (default: the
+    directory of the configured weights), since loading a .pt file
+    unpickles it.
+    """
+
+    def __init__(self, weights, fallback="yolov8n.pt", warmup_imgsz=(DETECTOR_IMGSZ,),
+                 warmup_runs=MODEL_WARMUP_RUNS, model_dir=None, retry_every=MODEL_LOAD_RETRY_S,
+                 retry_max=MODEL_LOAD_RETRY_MAX_S):
+        self.weights = weights
+        self.fallback = fallback
+        self.model_dir = os.path.realpath(model_dir or os.path.dirname(os.path.abspath(weights)))
+        self.retry_every = retry_every
+        self.retry_max = retry_max
+        self.warmup_imgsz = tuple(warmup_imgsz)
+        self.warmup_runs = warmup_runs
+
+        self._detector = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.generation = 0
+        self.loaded_at = None
+        self.warmup_ms = None
+        self.last_error = None
+        self.load_attempts = 0
+        self.next_retry_at = None
+        self._watched_mtime = None
+
+    # ----- akses detector -----
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def current(self):
+        with self._swap_lock:
+            detector = self._detector
+        if detector is None:
+            raise ModelNotReady("Detector is still loading")
+        return detector
+
+    def predict(self, frames, **kwargs):
+        """predict_fn for InferenceScheduler: every batch uses the detector current at batch start."""
+        return self.current().predict(frames, **kwargs)
+
+    @property
+    def model_id(self):
+        with self._swap_lock:
+            return self._detector.model_id if self._detector is not None else None
+
+    # ----- load / swap -----
+    def weights_path(self, weights):
+        """Resolve a client-supplied weights name inside model_dir; ValueError for anything else."""
+        if not isinstance(weights, str) or not weights.strip():
+            raise ValueError("weights must be a file name")
+        path = os.path.realpath(os.path.join(self.model_dir, weights))
+        if os.path.commonpath([path, self.model_dir]) != self.model_dir or path == self.model_dir:
+            raise ValueError(f"weights must be inside the model directory: {weights}")
+        if not os.path.exists(path):
+            raise ValueError(f"Weights not found: {weights}")
+        return path
+
+    def _resolve(self, weights):
+        weights = weights or self.weights
+        if not os.path.exists(weights) and self.fallback:
+            print(f"⚠️ {weights} not found, using {self.fallback}")
+            return self.fallback
+        return weights
+
+    def _warm_up(self, detector):
+        started = time.perf_counter()
+        for imgsz in self.warmup_imgsz:
+            frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+            for _ in range(self.warmup_runs):
+                detector.predict([frame], imgsz=imgsz)
+        return (time.perf_counter() - started) * 1000.0
+
+    def reload(self, weights=None):
+        """Load + warm up `weights` (default: the configured file) and swap it in. Returns the status."""
+        with self._reload_lock:
+            return self._reload(weights)
+
+    def _reload(self, weights):
+        # dipanggil dengan _reload_lock sudah dipegang
+        path = self._resolve(weights)
+        print(f"🚀 Loading YOLO model {path}...")
+        self.load_attempts += 1
+        try:
+            detector = load_detector(path)
+            warmup_ms = self._warm_up(detector)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Failed to load {path}: {e}")
+            raise
+
+        with self._swap_lock:
+            previous = self._detector
+            self._detector = detector
+            self.generation += 1
+            self.loaded_at = time.time()
+            self.warmup_ms = warmup_ms
+            self.last_error = None
+            self.next_retry_at = None
+        if weights:
+            self.weights = weights
+        self._watched_mtime = self._weights_mtime()
+        self._ready.set()
+
+        if previous is None:
+            print(f"✅ YOLO model loaded successfully! ({detector.model_id}, warm-up {warmup_ms:.0f} ms)")
+        else:
+            print(f"🔁 YOLO model swapped: {previous.model_id} -> {detector.model_id} (warm-up {warmup_ms:.0f} ms)")
+        return self.status()
+
+    def reload_async(self, weights=None):
+        """Start reload() in the background; False if a load is already running."""
+        # lock diambil sebelum thread dibuat: dua panggilan bersamaan tidak bisa sama-sama memulai reload
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._reload(weights)
+            except Exception:
+                pass  # sudah dicatat di last_error, detector lama tetap dipakai
+            finally:
+                self._reload_lock.release()
+
+        threading.Thread(target=run, name="model-reload", daemon=True).start()
+        return True
+
+    def _load_until_ready(self):
+        delay = self.retry_every
+        while not self.ready():
+            try:
+                self.reload()
+                return
+            except Exception:
+                pass  # sudah dicatat di last_error
+            if self.ready():
+                return  # reload manual sudah berhasil di sela percobaan
+            self.next_retry_at = time.time() + delay
+            print(f"⏳ Retrying model load in {delay:g} s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.retry_max)
+
+    def start(self, watch_interval=MODEL_WATCH_INTERVAL):
+        """Lazy load in the background (server starts immediately) and optionally watch the weights file."""
+        threading.Thread(target=self._load_until_ready, name="model-load", daemon=True).start()
+        if watch_interval > 0:
+            threading.Thread(target=self._watch, args=(watch_interval,), name="model-watcher", daemon=True).start()
+
+    # ----- file watcher -----
+    def _weights_mtime(self):
+        # .pt baru hasil training atau INT8 yang baru dipromosikan quantize_yolo.py
+        weights = self.weights if os.path.exists(self.weights) else self.fallback
+        paths = [weights, int8_path(weights)]
+        mtimes = [os.path.getmtime(p) for p in paths if os.path.exists(p)]
+        return max(mtimes) if mtimes else None
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            if not self.ready() or self._reload_lock.locked():
+                continue
+            mtime = self._weights_mtime()
+            if mtime is not None and mtime != self._watched_mtime:
+                # dicatat sebelum reload (juga kalau gagal): file rusak yang sama tidak dicoba ulang tiap interval
+                previous, self._watched_mtime = self._watched_mtime, mtime
+                if self.reload_async():
+                    print(f"👀 Weights changed on disk, reloading {self.weights}")
+                else:
+                    self._watched_mtime = previous
+
+    def status(self):
+        with self._swap_lock:
+            detector = self._detector
+        return {
+            "ready": self.ready(),
+            "reloading": self._reload_lock.locked(),
+            "model": detector.model_id if detector is not None else None,
+            "weights": self.weights,
+            "generation": self.generation,
+            "loaded_at": self.loaded_at,
+            "warmup_ms": self.warmup_ms,
+            "last_error": self.last_error,
+            "load_attempts": self.load_attempts,
+            "next_retry_at": self.next_retry_at,
+        }
@@ -0,0 +1,88 @@
+import os
+
+import cv2
+import numpy as np
+
+# Fraksi piksel foreground di sekitar garis yang dianggap "ada gerakan"; 0 = gate nonaktif (selalu deteksi)
+MOTION_GATE_THRESHOLD = float(os.environ.get("MOTION_GATE_THRESHOLD", "0.002"))
+# Paksa YOLO tiap K frame walau tidak ada gerakan (di bawah track_buffer ByteTrack = 30 supaya track diam tidak hilang)
+MOTION_GATE_REFRESH = int(os.environ.get("MOTION_GATE_REFRESH", "15"))
+# Tinggi area yang dicek di atas dan di bawah garis, sebagai fraksi tinggi frame
+MOTION_GATE_BAND = float(os.environ.get("MOTION_GATE_BAND", "0.15"))
+
+
+class MotionGate:
+    """
+    Cheap MOG2 pre-filter in front of the YOLO detector.
+
+    Uses the same background subtraction and open/close morphology as the
+    MOG2 counters (process_and_save_video.py, VideoCount.py), but only on a
+    downscaled band around the counting line. should_detect() is False while
+    the foreground area there stays below `threshold`, except that every
+    `refresh_every`-th frame is detected anyway to re-anchor the tracker.
+    """
+
+    def __init__(self, threshold=MOTION_GATE_THRESHOLD, refresh_every=MOTION_GATE_REFRESH,
+                 band=MOTION_GATE_BAND, scale=0.5):
+        self.threshold = threshold
+        self.refresh_every = max(1, refresh_every)
+        self.band = band
+        self.scale = scale
+        self.kernelOp = np.ones((3, 3), np.uint8)
+        self.kernelCl = np.ones((11, 11), np.uint8)
+        self.fgbg = None
+        self._region_shape = None
+        self.frames_since_detect = self.refresh_every  # frame pertama selalu dideteksi
+        self.last_motion = 0.0
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def _region(self, frame, line_y):
+        h = frame.shape[0]
+        half = max(1, int(round(self.band * h)))
+        region = frame[max(0, line_y - half):min(h, line_y + half)]
+        if self.scale < 1.0:
+            region = cv2.resize(region, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return region
+
+    def motion_ratio(self, frame, line_y):
+        """Fraction of foreground pixels in the band around the line (also updates the background model)."""
+        region = self._region(frame, line_y)
+        if region.shape != self._region_shape:
+            # resolusi / posisi garis berubah: model background lama tidak berlaku lagi
+            self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=True)
+            self._region_shape = region.shape
+            self.frames_since_detect = self.refresh_every
+        fgmask = self.fgbg.apply(region)
+        ret, imBin = cv2.threshold(fgmask, 200, 255, cv2.THRESH_BINARY)  # buang bayangan (127)
+        mask = cv2.morphologyEx(imBin, cv2.MORPH_OPEN, self.kernelOp)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernelCl)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    def should_detect(self, frame, line_y):
+        """True if YOLO should run on this frame."""
+        if not self.enabled:
+            return True
+        self.checked += 1
+        self.last_motion = self.motion_ratio(frame, line_y)
+        self.frames_since_detect += 1
+        if self.last_motion >= self.threshold or self.frames_since_detect >= self.refresh_every:
+            self.frames_since_detect = 0
+            return True
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "refresh_every": self.refresh_every,
+            "last_motion": self.last_motion,
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_ratio": (self.skipped / self.checked) if self.checked else 0.0,
+        }
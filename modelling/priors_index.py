@@ -0,0 +1,170 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DWELL_S = 30.0
+PRIORS_INDEX_FORMAT = 1  # naikkan kalau layout array berubah supaya .npz lama dibangun ulang
+
+# Koridor 1, urutan NB (BlokM→Kota); stop_seq = posisi di urutan arah masing-masing, mulai 1
+STOP_NAMES_NB = [
+    "Blok M", "ASEAN", "Kejaksaan Agung", "Masjid Agunng", "Bundaran Senayan", "Gelora Bung Karno",
+    "Polda Metro Jaya", "Bendungan Hilir", "Karet", "Dukuh Atas 1", "Tosari", "Bundaran HI ASTRA",
+    "M.H Thamrin", "Kebon Sirih", "Monumen Nasional", "Harmoni", "Sawah Besar", "Mangga Besar",
+    "Taman Sari", "Glodok", "Kota", "Museum Sejarah Jakarta", "Kali Besar",
+]
+STOP_NAMES_SB = list(reversed(STOP_NAMES_NB))
+
+
+def artifact_version(paths):
+    """Cheap fingerprint of the artifact files (mtime + size); changes when a new model is exported."""
+    parts = []
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{st.st_mtime_ns}:{st.st_size}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
+
+
+def normalize_stop_name(name):
+    """'M.H. Thamrin ' / 'mh  thamrin' -> 'mh thamrin'."""
+    return " ".join(re.sub(r"[^0-9a-z ]+", "", str(name).lower().replace("-", " ")).split())
+
+
+def _read_stops(path, count):
+    if path and os.path.exists(path):
+        return [int(s) for s in pd.read_csv(path, header=None)[0].tolist()]  # file tanpa header
+    return list(range(1, count + 1))
+
+
+def _read_optional_csv(path):
+    return pd.read_csv(path) if path and os.path.exists(path) else None
+
+
+class PriorsIndex:
+    """
+    priors_lookup.csv, the stop orders and the dwell lookups compiled into
+    dense arrays.
+
+    board/alight/load are indexed [direction, stop_seq, hour] (NaN where the
+    notebook had no prior); dwell is indexed [direction, stop_seq,
+    is_weekend, hour] with the hour -> weekend -> stop -> 30 s fallback of
+    forecast.ipynb already applied. A lookup for a whole route is one
+    fancy-indexing operation. The compiled arrays are cached as an .npz next
+    to the CSVs and rebuilt when any source file changes.
+    """
+
+    ARRAYS = ("order_nb", "order_sb", "board", "alight", "load", "dwell")
+
+    def __init__(self, order_nb, order_sb, board, alight, load, dwell, version=""):
+        self.orders = {0: np.asarray(order_nb, dtype=np.int64), 1: np.asarray(order_sb, dtype=np.int64)}
+        self.board = board
+        self.alight = alight
+        self.load = load
+        self.dwell = dwell
+        self.version = version
+        self.names = {0: STOP_NAMES_NB, 1: STOP_NAMES_SB}
+        # posisi tiap stop_seq di urutan arahnya, untuk memotong sisa rute tanpa list.index()
+        self._positions = {d: {int(seq): i for i, seq in enumerate(order)} for d, order in self.orders.items()}
+        self._stop_ids = {
+            d: {normalize_stop_name(name): seq for seq, name in enumerate(names, start=1)}
+            for d, names in self.names.items()
+        }
+
+    @classmethod
+    def from_csv(cls, priors_path, stops_nb_path, stops_sb_path,
+                 dwell_h_path=None, dwell_we_path=None, dwell_sx_path=None, version=""):
+        order_nb = _read_stops(stops_nb_path, len(STOP_NAMES_NB))
+        order_sb = _read_stops(stops_sb_path, len(STOP_NAMES_SB))
+        priors = _read_optional_csv(priors_path)
+        dwell_tables = [_read_optional_csv(p) for p in (dwell_h_path, dwell_we_path, dwell_sx_path)]
+
+        seqs = order_nb + order_sb + [len(STOP_NAMES_NB)]
+        for table in [priors] + dwell_tables:
+            if table is not None and len(table):
+                seqs.append(int(table["stop_seq"].max()))
+        n_stops = max(seqs) + 1  # index langsung dengan stop_seq (index 0 tidak dipakai)
+
+        board = np.full((2, n_stops, 24), np.nan)
+        alight = np.full((2, n_stops, 24), np.nan)
+        load = np.full((2, n_stops, 24), np.nan)
+        if priors is not None:
+            d, s, h = (priors[c].to_numpy(dtype=np.int64) for c in ("direction", "stop_seq", "hour"))
+            board[d, s, h] = priors["board_prior"].to_numpy(dtype=float)
+            alight[d, s, h] = priors["alight_prior"].to_numpy(dtype=float)
+            load[d, s, h] = priors["load_prior"].to_numpy(dtype=float)
+
+        # dwell diisi dari yang paling umum ke paling spesifik, jadi yang spesifik menimpa
+        dwell = np.full((2, n_stops, 2, 24), DEFAULT_DWELL_S)
+        dwell_h, dwell_we, dwell_sx = dwell_tables
+        if dwell_sx is not None:
+            d, s = (dwell_sx[c].to_numpy(dtype=np.int64) for c in ("direction", "stop_seq"))
+            dwell[d, s] = dwell_sx["dwell_sx"].to_numpy(dtype=float)[:, None, None]
+        if dwell_we is not None:
+            d, s, w = (dwell_we[c].to_numpy(dtype=np.int64) for c in ("direction", "stop_seq", "is_weekend"))
+            dwell[d, s, w] = dwell_we["dwell_we"].to_numpy(dtype=float)[:, None]
+        if dwell_h is not None:
+            d, s, h = (dwell_h[c].to_numpy(dtype=np.int64) for c in ("direction", "stop_seq", "hour"))
+            dwell[d, s, :, h] = dwell_h["dwell_h"].to_numpy(dtype=float)[:, None]
+
+        return cls(order_nb, order_sb, board, alight, load, dwell, version=version)
+
+    @classmethod
+    def load(cls, priors_path, stops_nb_path, stops_sb_path,
+             dwell_h_path=None, dwell_we_path=None, dwell_sx_path=None, cache_path=None):
+        """Load from the .npz cache if it matches the CSVs, else compile the CSVs and refresh the cache."""
+        sources = [p for p in (priors_path, stops_nb_path, stops_sb_path, dwell_h_path, dwell_we_path, dwell_sx_path) if p]
+        version = artifact_version(sources)
+        if cache_path is None:
+            cache_path = os.path.splitext(priors_path)[0] + "_index.npz"
+        if os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as cached:
+                    if int(cached["format"]) == PRIORS_INDEX_FORMAT and str(cached["version"]) == version:
+                        return cls(*(cached[name] for name in cls.ARRAYS), version=version)
+            except Exception as e:
+                print(f"⚠️ Ignoring priors index cache {cache_path}: {e}")
+
+        index = cls.from_csv(priors_path, stops_nb_path, stops_sb_path,
+                             dwell_h_path, dwell_we_path, dwell_sx_path, version=version)
+        try:
+            index.save(cache_path)
+        except OSError as e:
+            print(f"⚠️ Cannot write priors index cache {cache_path}: {e}")
+        return index
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, format=PRIORS_INDEX_FORMAT, version=self.version,
+                 order_nb=self.orders[0], order_sb=self.orders[1],
+                 board=self.board, alight=self.alight, load=self.load, dwell=self.dwell)
+        os.replace(tmp_path, path)  # atomik: proses lain tidak pernah membaca file setengah jadi
+
+    @property
+    def n_stops(self):
+        return self.board.shape[1]
+
+    def stop_name(self, direction, stop_seq):
+        names = self.names[direction]
+        return names[stop_seq - 1] if 1 <= stop_seq <= len(names) else str(stop_seq)
+
+    def stop_id(self, stop, direction):
+        """Stop name (any case/punctuation) or stop_seq -> stop_seq on this direction's route."""
+        value = str(stop).strip()
+        stop_seq = int(value) if value.isdigit() else self._stop_ids[direction].get(normalize_stop_name(value))
+        if stop_seq is None or stop_seq not in self._positions[direction]:
+            raise ValueError(f"Unknown origin_stop: {stop}")
+        return stop_seq
+
+    def downstream(self, direction, stop_seq):
+        """stop_seqs after stop_seq, in driving order."""
+        return self.orders[direction][self._positions[direction][stop_seq] + 1:]
+
+    def priors(self, direction, seqs, hour):
+        """(board, alight, load) prior arrays for seqs; NaN where no prior exists."""
+        return self.board[direction, seqs, hour], self.alight[direction, seqs, hour], self.load[direction, seqs, hour]
+
+    def dwell_s(self, direction, seqs, is_weekend, hour):
+        return self.dwell[direction, seqs, is_weekend, hour]
@@ -88,177 +88,195 @@ class MultiPerson:
         self.done = False
 # ====================================================================
 
-# argument parsing
-ap = argparse.ArgumentParser()
-ap.add_argument("-v", "--video", default="video.mp4", help="path to the video file")
-ap.add_argument("-a", "--min-area", type=int, default=500, help="minimum area size")
-ap.add_argument("-t", "--status", type=str, help="tracking status(True/False)")
-args = vars(ap.parse_args())
-
-print("Tracking Status=", args["status"])
-
-if args.get("video", None) is None:
-    cap = cv2.VideoCapture(0)
-else:
-    cap = cv2.VideoCapture(args["video"])
-
-w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-fps = cap.get(cv2.CAP_PROP_FPS)
-
-print('Height: ', h)
-print('Width: ', w)
-print('Frame per Seconds: ', fps)
-
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-out_original = cv2.VideoWriter('output_original.mp4', fourcc, fps, (w, h))
-out_masked = cv2.VideoWriter('output_masked.mp4', fourcc, fps, (w, h))
-
-cnt_up = 0
-cnt_down = 0
-frameArea = h*w
-areaTH = frameArea/500
-
-line_up = int((h/2)-50)
-line_down = int((h/2)+50)
-
-up_limit = int(1*(h/5))
-down_limit = int(4*(h/5))
-
-line_down_color = (255, 0, 0)
-line_up_color = (0, 0, 255)
-
-pt1 = [0, line_down]
-pt2 = [w, line_down]
-pts_L1 = np.array([pt1, pt2], np.int32)
-pts_L1 = pts_L1.reshape((-1, 1, 2))
-
-pt3 = [0, line_up]
-pt4 = [w, line_up]
-pts_L2 = np.array([pt3, pt4], np.int32)
-pts_L2 = pts_L2.reshape((-1, 1, 2))
-
-pt5 = [0, up_limit]
-pt6 = [w, up_limit]
-pts_L3 = np.array([pt5, pt6], np.int32)
-pts_L3 = pts_L3.reshape((-1, 1, 2))
-pt7 = [0, down_limit]
-pt8 = [w, down_limit]
-pts_L4 = np.array([pt7, pt8], np.int32)
-pts_L4 = pts_L4.reshape((-1, 1, 2))
-
-fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows = True)
-
-kernelOp = np.ones((3, 3), np.uint8)
-kernelOp2 = np.ones((5, 5), np.uint8)
-kernelCl = np.ones((11, 11), np.uint8)
-
-font = cv2.FONT_HERSHEY_SIMPLEX
-persons = []
-max_p_age = 5
-pid = 1
-
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        print('EOF')
-        print('UP:', cnt_up)
-        print('DOWN:', cnt_down)
-        break
-
-    for i in persons:
-        i.age_one()
-
-    fgmask2 = fgbg.apply(frame)
-
-    try:
+class Mog2LineCounter:
+    """
+    MOG2 background subtraction + MyPerson line counter, one frame at a time.
+
+    The geometry (lines, limits, minimum blob area) is taken from the first
+    frame. replay_benchmark.py drives the same object as the script below.
+    """
+
+    def __init__(self, max_p_age=5):
+        self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows = True)
+        self.kernelOp = np.ones((3, 3), np.uint8)
+        self.kernelOp2 = np.ones((5, 5), np.uint8)
+        self.kernelCl = np.ones((11, 11), np.uint8)
+        self.persons = []
+        self.max_p_age = max_p_age
+        self.pid = 1
+        self.cnt_up = 0
+        self.cnt_down = 0
+        self.areaTH = None
+
+    def set_geometry(self, w, h):
+        frameArea = h*w
+        self.areaTH = frameArea/500
+        self.line_up = int((h/2)-50)
+        self.line_down = int((h/2)+50)
+        self.up_limit = int(1*(h/5))
+        self.down_limit = int(4*(h/5))
+
+    def process(self, frame):
+        """Update the counts with one frame; returns (mask, blobs) with blobs = [(cx, cy, x, y, w, h)]."""
+        if self.areaTH is None:
+            self.set_geometry(frame.shape[1], frame.shape[0])
+
+        for i in self.persons:
+            i.age_one()
+
+        fgmask2 = self.fgbg.apply(frame)
+
         ret, imBin2 = cv2.threshold(fgmask2, 200, 255, cv2.THRESH_BINARY)
-        mask2 = cv2.morphologyEx(imBin2, cv2.MORPH_OPEN, kernelOp)
-        mask2 = cv2.morphologyEx(mask2, cv2.MORPH_CLOSE, kernelCl)
-    except:
-        print('EOF')
-        print('UP:', cnt_up)
-        print('DOWN:', cnt_down)
-        break
-
-    contours0, hierarchy = cv2.findContours(mask2, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    for cnt in contours0:
-        area = cv2.contourArea(cnt)
-        if area > areaTH:
-            M = cv2.moments(cnt)
-            cx = int(M['m10']/M['m00'])
-            cy = int(M['m01']/M['m00'])
-            x, y, w, h = cv2.boundingRect(cnt)
-            new = True
-            if cy in range(up_limit, down_limit):
-                for i in persons:
-                    if abs(cx-i.getX()) <= w and abs(cy-i.getY()) <= h:
-                        new = False
-                        i.updateCoords(cx, cy)
-                        if i.going_UP(line_down, line_up) == True:
-                            cnt_up += 1;
-                            print("ID:", i.getId(), 'crossed, going out at', time.strftime("%c"))
-                        elif i.going_DOWN(line_down,line_up) == True:
-                            cnt_down += 1;
-                            print("ID:", i.getId(), 'crossed, coming in at', time.strftime("%c"))
-                        break
-                    if i.getState() == '1':
-                        if i.getDir() == 'down' and i.getY() > down_limit:
-                            i.setDone()
-                        elif i.getDir() == 'up' and i.getY() < up_limit:
-                            i.setDone()
-                    if i.timedOut():
-                        index = persons.index(i)
-                        persons.pop(index)
-                        del i
-                if new == True:
-                    p = MyPerson(pid, cx, cy, max_p_age)
-                    persons.append(p)
-                    pid += 1
+        mask2 = cv2.morphologyEx(imBin2, cv2.MORPH_OPEN, self.kernelOp)
+        mask2 = cv2.morphologyEx(mask2, cv2.MORPH_CLOSE, self.kernelCl)
+
+        blobs = []
+        contours0, hierarchy = cv2.findContours(mask2, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for cnt in contours0:
+            area = cv2.contourArea(cnt)
+            if area > self.areaTH:
+                M = cv2.moments(cnt)
+                cx = int(M['m10']/M['m00'])
+                cy = int(M['m01']/M['m00'])
+                x, y, w, h = cv2.boundingRect(cnt)
+                new = True
+                if cy in range(self.up_limit, self.down_limit):
+                    for i in self.persons:
+                        if abs(cx-i.getX()) <= w and abs(cy-i.getY()) <= h:
+                            new = False
+                            i.updateCoords(cx, cy)
+                            if i.going_UP(self.line_down, self.line_up) == True:
+                                self.cnt_up += 1
+                                print("ID:", i.getId(), 'crossed, going out at', time.strftime("%c"))
+                            elif i.going_DOWN(self.line_down, self.line_up) == True:
+                                self.cnt_down += 1
+                                print("ID:", i.getId(), 'crossed, coming in at', time.strftime("%c"))
+                            break
+                        if i.getState() == '1':
+                            if i.getDir() == 'down' and i.getY() > self.down_limit:
+                                i.setDone()
+                            elif i.getDir() == 'up' and i.getY() < self.up_limit:
+                                i.setDone()
+                        if i.timedOut():
+                            index = self.persons.index(i)
+                            self.persons.pop(index)
+                            del i
+                    if new == True:
+                        p = MyPerson(self.pid, cx, cy, self.max_p_age)
+                        self.persons.append(p)
+                        self.pid += 1
+                blobs.append((cx, cy, x, y, w, h))
+        return mask2, blobs
+
+
+def main():
+    # argument parsing
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--video", default="video.mp4", help="path to the video file")
+    ap.add_argument("-a", "--min-area", type=int, default=500, help="minimum area size")
+    ap.add_argument("-t", "--status", type=str, help="tracking status(True/False)")
+    args = vars(ap.parse_args())
+
+    print("Tracking Status=", args["status"])
+
+    if args.get("video", None) is None:
+        cap = cv2.VideoCapture(0)
+    else:
+        cap = cv2.VideoCapture(args["video"])
+
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    print('Height: ', h)
+    print('Width: ', w)
+    print('Frame per Seconds: ', fps)
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out_original = cv2.VideoWriter('output_original.mp4', fourcc, fps, (w, h))
+    out_masked = cv2.VideoWriter('output_masked.mp4', fourcc, fps, (w, h))
+
+    counter = Mog2LineCounter()
+    counter.set_geometry(w, h)
+
+    line_down_color = (255, 0, 0)
+    line_up_color = (0, 0, 255)
+
+    pt1 = [0, counter.line_down]
+    pt2 = [w, counter.line_down]
+    pts_L1 = np.array([pt1, pt2], np.int32)
+    pts_L1 = pts_L1.reshape((-1, 1, 2))
+
+    pt3 = [0, counter.line_up]
+    pt4 = [w, counter.line_up]
+    pts_L2 = np.array([pt3, pt4], np.int32)
+    pts_L2 = pts_L2.reshape((-1, 1, 2))
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            print('EOF')
+            print('UP:', counter.cnt_up)
+            print('DOWN:', counter.cnt_down)
+            break
+
+        try:
+            mask2, blobs = counter.process(frame)
+        except cv2.error:
+            print('EOF')
+            print('UP:', counter.cnt_up)
+            print('DOWN:', counter.cnt_down)
+            break
+
+        for cx, cy, x, y, bw, bh in blobs:
             cv2.circle(frame, (cx, cy), 5, (0, 0, 255), -1)
-            img = cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-
-    for i in persons:
-        if args["status"] == 'True':
-            if len(i.getTracks()) >= 2:
-                pts = np.array(i.getTracks(), np.int32)
-                pts = pts.reshape((-1, 1, 2))
-                frame = cv2.polylines(frame, [pts], False, i.getRGB())
-        if i.getId() == 9:
-            print(str(i.getX()), ',', str(i.getY()))
-
-    str_up = 'Outgoing: ' + str(cnt_up)
-    cv2.line(frame, (10, 10), (10, 30), (255, 0, 0), 2)
-    cv2.line(frame, (10, 10), (5, 20), (255, 0, 0), 2)
-    cv2.line(frame, (10, 10), (15, 20), (255, 0, 0), 2)
-
-    str_down = 'Incoming: ' + str(cnt_down)
-    cv2.line(frame, (10, 35), (10, 55), (0, 0, 255), 2)
-    cv2.line(frame, (10, 55), (5, 45), (0, 0, 255), 2)
-    cv2.line(frame, (10, 55), (15, 45), (0, 0, 255), 2)
-
-    str_diff = 'Difference: ' + str(int(cnt_down)-int(cnt_up))
-
-    frame = cv2.polylines(frame, [pts_L1], False, line_down_color, thickness=1)
-    frame = cv2.polylines(frame, [pts_L2], False, line_up_color, thickness=1)
-
-    cv2.putText(frame, str_up, (20, 20), font, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-    cv2.putText(frame, str_down, (20, 40), font, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-    cv2.putText(frame, datetime.datetime.now().strftime("%A %d %B %Y %I:%M:%S%p"),
-                (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 255, 255), 1)
-
-    out_original.write(frame)
-    out_masked.write(cv2.cvtColor(mask2, cv2.COLOR_GRAY2BGR))
-
-    cv2.imshow('Original Video', frame)
-    cv2.imshow('Masked Video', mask2)
-    
-    k = cv2.waitKey(30) & 0xff
-    if k == 27:
-        break
-
-cap.release()
-cv2.destroyAllWindows()
-
-out_original.release()
-out_masked.release()
\ No newline at end of file
+            cv2.rectangle(frame, (x, y), (x+bw, y+bh), (0, 255, 0), 2)
+
+        for i in counter.persons:
+            if args["status"] == 'True':
+                if len(i.getTracks()) >= 2:
+                    pts = np.array(i.getTracks(), np.int32)
+                    pts = pts.reshape((-1, 1, 2))
+                    frame = cv2.polylines(frame, [pts], False, i.getRGB())
+            if i.getId() == 9:
+                print(str(i.getX()), ',', str(i.getY()))
+
+        str_up = 'Outgoing: ' + str(counter.cnt_up)
+        cv2.line(frame, (10, 10), (10, 30), (255, 0, 0), 2)
+        cv2.line(frame, (10, 10), (5, 20), (255, 0, 0), 2)
+        cv2.line(frame, (10, 10), (15, 20), (255, 0, 0), 2)
+
+        str_down = 'Incoming: ' + str(counter.cnt_down)
+        cv2.line(frame, (10, 35), (10, 55), (0, 0, 255), 2)
+        cv2.line(frame, (10, 55), (5, 45), (0, 0, 255), 2)
+        cv2.line(frame, (10, 55), (15, 45), (0, 0, 255), 2)
+
+        frame = cv2.polylines(frame, [pts_L1], False, line_down_color, thickness=1)
+        frame = cv2.polylines(frame, [pts_L2], False, line_up_color, thickness=1)
+
+        cv2.putText(frame, str_up, (20, 20), font, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        cv2.putText(frame, str_down, (20, 40), font, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        cv2.putText(frame, datetime.datetime.now().strftime("%A %d %B %Y %I:%M:%S%p"),
+                    (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 255, 255), 1)
+
+        out_original.write(frame)
+        out_masked.write(cv2.cvtColor(mask2, cv2.COLOR_GRAY2BGR))
+
+        cv2.imshow('Original Video', frame)
+        cv2.imshow('Masked Video', mask2)
+        
+        k = cv2.waitKey(30) & 0xff
+        if k == 27:
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+
+    out_original.release()
+    out_masked.release()
+
+
+if __name__ == "__main__":
+    main()
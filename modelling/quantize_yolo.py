@@ -0,0 +1,261 @@
+"""
+INT8 quantization pipeline for the crowd-counting YOLO detector.
+
+1. Export best_tj_crowd_model.pt to FP32 ONNX (detector_backend cache).
+2. Calibrate static INT8 (ONNX Runtime, QDQ) on a sample of tj_crowd_dataset images.
+3. Gate: compare person-class mAP, line-crossing counts on reference clips and
+   CPU latency against FP32. Only a candidate that passes every check is
+   promoted to <weights>_int8.onnx, which detector_backend then picks up.
+
+Contoh:
+    python quantize_yolo.py --weights best_tj_crowd_model.pt --data tj_crowd_dataset/data.yaml --clips reference_clips
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+from camera_sessions import CameraSession
+from clips import clip_ground_truth, list_clips
+from detector_backend import Detector, PERSON_CLASS_ID, export_weights, int8_path
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def letterbox(frame, imgsz):
+    """Resize keeping aspect ratio and pad to imgsz x imgsz (same as Ultralytics, pad value 114)."""
+    h, w = frame.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+def to_input_tensor(frame, imgsz):
+    """BGR frame -> NCHW float32 RGB in [0, 1]."""
+    image = letterbox(frame, imgsz)[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(image, dtype=np.float32)[None] / 255.0
+
+
+def calibration_images(data_yaml, sample_size, seed=0):
+    """Sample training images listed in the dataset's data.yaml."""
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+    root = data.get("path") or os.path.dirname(os.path.abspath(data_yaml))
+    if not os.path.isabs(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root)
+    sources = data.get("train")
+    sources = sources if isinstance(sources, list) else [sources]
+
+    images = []
+    for source in sources:
+        source = source if os.path.isabs(source) else os.path.join(root, source)
+        if os.path.isdir(source):
+            images += [p for p in glob.glob(os.path.join(source, "**", "*"), recursive=True)
+                       if p.lower().endswith(IMAGE_EXTENSIONS)]
+        elif os.path.isfile(source):  # file .txt berisi daftar path
+            with open(source) as f:
+                images += [line.strip() for line in f if line.strip()]
+    if not images:
+        raise FileNotFoundError(f"No calibration images found from {data_yaml}")
+    random.Random(seed).shuffle(images)
+    return images[:sample_size]
+
+
+def quantize_int8(fp32_onnx, output_path, images, imgsz):
+    """Static INT8 (QDQ) quantization with MinMax calibration on `images`."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quant_pre_process, quantize_static)
+
+    input_name = ort.InferenceSession(fp32_onnx, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            for path in self._paths:
+                frame = cv2.imread(path)
+                if frame is not None:
+                    return {input_name: to_input_tensor(frame, imgsz)}
+            return None
+
+    prepared = output_path + ".prep.onnx"
+    try:
+        quant_pre_process(fp32_onnx, prepared)
+    except Exception as e:
+        print(f"⚠️ quant_pre_process skipped: {e}")
+        prepared = fp32_onnx
+
+    quantize_static(
+        prepared, output_path, ImageReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    if prepared != fp32_onnx and os.path.exists(prepared):
+        os.remove(prepared)
+    return output_path
+
+
+def person_map(model_path, data_yaml, imgsz):
+    """mAP50-95 and mAP50 of the person class on the dataset's val split."""
+    metrics = YOLO(model_path, task="detect").val(data=data_yaml, imgsz=imgsz, batch=1, plots=False)
+    box = metrics.box
+    ap_classes = list(getattr(box, "ap_class_index", []))
+    map50 = float(box.ap50[ap_classes.index(PERSON_CLASS_ID)]) if PERSON_CLASS_ID in ap_classes else 0.0
+    return {"map50_95": float(box.maps[PERSON_CLASS_ID]), "map50": map50}
+
+
+def count_clip(detector, clip_path, line_position=0.5, imgsz=None):
+    """Replay a clip through detector + ByteTrack + PersonTracker; returns (in, out)."""
+    session = CameraSession(os.path.basename(clip_path))
+    cap = cv2.VideoCapture(clip_path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        line_y = int(frame.shape[0] * line_position)
+        detections = detector.detect(frame, imgsz=imgsz) if imgsz else detector.detect(frame)
+        detections = session.byte_tracker.update_with_detections(detections)
+        session.update_line_crossing(detections, line_y)
+    cap.release()
+    return session.cnt_down, session.cnt_up
+
+
+def count_error(fp32_detector, int8_detector, clips_dir, imgsz):
+    """
+    Relative line-crossing count error of FP32 and INT8 vs ground truth (or
+    FP32 counts if no ground truth); the gate uses the INT8 - FP32 difference.
+    """
+    clips = list_clips(clips_dir)
+    per_clip = []
+    fp32_abs_error = int8_abs_error = 0
+    total = 0
+    for clip in clips:
+        fp32_in, fp32_out = count_clip(fp32_detector, clip, imgsz=imgsz)
+        int8_in, int8_out = count_clip(int8_detector, clip, imgsz=imgsz)
+        reference = clip_ground_truth(clip) or (fp32_in, fp32_out)
+        fp32_error = abs(fp32_in - reference[0]) + abs(fp32_out - reference[1])
+        int8_error = abs(int8_in - reference[0]) + abs(int8_out - reference[1])
+        fp32_abs_error += fp32_error
+        int8_abs_error += int8_error
+        total += sum(reference)
+        per_clip.append({
+            "clip": os.path.basename(clip),
+            "reference": {"in": reference[0], "out": reference[1]},
+            "fp32": {"in": fp32_in, "out": fp32_out, "abs_error": fp32_error},
+            "int8": {"in": int8_in, "out": int8_out, "abs_error": int8_error},
+        })
+    fp32_relative = (fp32_abs_error / total) if total else 0.0
+    int8_relative = (int8_abs_error / total) if total else 0.0
+    return {
+        "clips": per_clip,
+        "fp32": {"abs_error": fp32_abs_error, "relative_error": fp32_relative},
+        "int8": {"abs_error": int8_abs_error, "relative_error": int8_relative},
+        "relative_error_increase": int8_relative - fp32_relative,
+    }
+
+
+def cpu_latency_ms(model_path, imgsz, runs=50, warmup=5):
+    """Median single-frame latency of a model on CPU."""
+    model = YOLO(model_path, task="detect")
+    frame = np.random.randint(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(warmup):
+        model(frame, imgsz=imgsz, verbose=False)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        model(frame, imgsz=imgsz, verbose=False)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return {"p50": float(np.percentile(timings, 50)), "p95": float(np.percentile(timings, 95))}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="INT8 quantization with accuracy/latency gate")
+    ap.add_argument("--weights", default="best_tj_crowd_model.pt", help="trained FP32 weights")
+    ap.add_argument("--data", default="tj_crowd_dataset/data.yaml", help="dataset yaml (calibration + val)")
+    ap.add_argument("--clips", default="reference_clips", help="folder of reference door clips (+ optional <clip>.json)")
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--calib-size", type=int, default=200, help="number of calibration images")
+    ap.add_argument("--max-map-drop", type=float, default=0.01, help="max absolute person mAP50-95 drop")
+    ap.add_argument("--max-count-error", type=float, default=0.02, help="max increase of the relative crossing-count error vs FP32")
+    ap.add_argument("--min-speedup", type=float, default=1.3, help="min FP32/INT8 p50 latency ratio")
+    args = ap.parse_args()
+
+    fp32_onnx = export_weights(args.weights, "onnx", imgsz=args.imgsz)
+    promoted = int8_path(args.weights)
+    candidate = os.path.splitext(promoted)[0] + ".candidate.onnx"
+    report_path = os.path.splitext(promoted)[0] + "_report.json"
+
+    print(f"🔧 Calibrating INT8 on {args.calib_size} images from {args.data}...")
+    images = calibration_images(args.data, args.calib_size)
+    quantize_int8(fp32_onnx, candidate, images, args.imgsz)
+
+    print("📏 Evaluating person mAP...")
+    fp32_map = person_map(fp32_onnx, args.data, args.imgsz)
+    int8_map = person_map(candidate, args.data, args.imgsz)
+
+    print("🚶 Replaying reference clips...")
+    fp32_detector = Detector(YOLO(fp32_onnx, task="detect"), "onnx", args.weights, fp32_onnx)
+    int8_detector = Detector(YOLO(candidate, task="detect"), "onnx", args.weights, candidate)
+    counts = count_error(fp32_detector, int8_detector, args.clips, args.imgsz) if os.path.isdir(args.clips) else None
+
+    print("⏱️  Measuring CPU latency...")
+    fp32_latency = cpu_latency_ms(fp32_onnx, args.imgsz)
+    int8_latency = cpu_latency_ms(candidate, args.imgsz)
+    speedup = fp32_latency["p50"] / int8_latency["p50"] if int8_latency["p50"] else 0.0
+
+    checks = {
+        "map": fp32_map["map50_95"] - int8_map["map50_95"] <= args.max_map_drop,
+        # tanpa klip referensi gate tidak bisa membuktikan akurasi hitung -> gagal
+        "count_error": counts is not None and bool(counts["clips"]) and counts["relative_error_increase"] <= args.max_count_error,
+        "latency": speedup >= args.min_speedup,
+    }
+    passed = all(checks.values())
+
+    report = {
+        "weights": args.weights,
+        "fp32_model": fp32_onnx,
+        "int8_candidate": candidate,
+        "timestamp": time.time(),
+        "thresholds": {
+            "max_map_drop": args.max_map_drop,
+            "max_count_error": args.max_count_error,
+            "min_speedup": args.min_speedup,
+        },
+        "map": {"fp32": fp32_map, "int8": int8_map},
+        "count": counts,
+        "latency_ms": {"fp32": fp32_latency, "int8": int8_latency, "speedup": speedup},
+        "checks": checks,
+        "promoted": passed,
+    }
+
+    if passed:
+        os.replace(candidate, promoted)
+        report["int8_model"] = promoted
+        print(f"✅ INT8 model promoted: {promoted} (speedup {speedup:.2f}x)")
+    else:
+        failed = [name for name, ok in checks.items() if not ok]
+        print(f"❌ INT8 candidate rejected ({', '.join(failed)}); kept at {candidate}")
+
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
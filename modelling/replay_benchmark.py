@@ -0,0 +1,232 @@
+"""
+Offline replay benchmark for the counting pipelines.
+
+Replays recorded bus-door clips (+ optional <clip>.json ground truth
+{"in": n, "out": m}) through:
+  app           CameraSession.detect_and_count, the per-frame work of
+                app.run_frame_pipeline (motion gate, door ROI and tiling from the
+                same env settings) without Flask and the batching scheduler
+  flask_server  iPhoneCrowdCounter.process_frame from flask_server.py
+                (people per frame only, no line counter -> no count error)
+  mog2          Mog2LineCounter from process_and_save_video.py
+
+Each pipeline runs in its own process so peak RSS is per pipeline. Results
+(FPS, per-frame p50/p95/p99 latency, peak RSS, count error) go to a JSON
+file that can be diffed across commits with --baseline.
+
+Contoh:
+    python replay_benchmark.py --clips reference_clips --output bench_results.json
+    python replay_benchmark.py --clips reference_clips --baseline bench_main.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import cv2
+import numpy as np
+
+from camera_sessions import CameraSession
+from clips import clip_ground_truth, list_clips
+from detector_backend import load_detector
+from flask_server import iPhoneCrowdCounter
+from process_and_save_video import Mog2LineCounter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PIPELINES = ("app", "flask_server", "mog2")
+
+
+class AppPipeline:
+    """app.run_frame_pipeline's CameraSession work, with the detector called directly."""
+
+    def __init__(self, detector, line_position):
+        self.detector = detector
+        self.line_position = line_position
+        self.session = CameraSession("replay")
+
+    def process(self, frame):
+        line_y = int(frame.shape[0] * self.line_position)
+        self.session.detect_and_count(frame, line_y, self.detector.predict)
+
+    def counts(self):
+        return self.session.cnt_down, self.session.cnt_up
+
+
+class FlaskServerPipeline:
+    """flask_server.iPhoneCrowdCounter.process_frame (its display window is never started)."""
+
+    def __init__(self, detector, line_position):
+        self.counter = iPhoneCrowdCounter(detector)
+        self.people_counts = []
+
+    def process(self, frame):
+        people_count, _ = self.counter.process_frame(frame)
+        self.people_counts.append(people_count)
+
+    def counts(self):
+        return None
+
+
+class Mog2Pipeline:
+    """Mog2LineCounter of process_and_save_video.py, without windows and writers."""
+
+    def __init__(self, detector, line_position):
+        self.counter = Mog2LineCounter()
+
+    def process(self, frame):
+        self.counter.process(frame)
+
+    def counts(self):
+        return self.counter.cnt_down, self.counter.cnt_up
+
+
+PIPELINE_CLASSES = {"app": AppPipeline, "flask_server": FlaskServerPipeline, "mog2": Mog2Pipeline}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KB, macOS: byte
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def run_pipeline(name, clips, weights, line_position, max_frames):
+    """Replay every clip through one pipeline (runs in a fresh worker process)."""
+    detector = None
+    if name in ("app", "flask_server"):
+        detector = load_detector(weights)
+        detector.detect(np.zeros((480, 640, 3), dtype=np.uint8))  # warm-up, tidak ikut diukur
+
+    timings = []
+    per_clip = []
+    for clip in clips:
+        pipeline = PIPELINE_CLASSES[name](detector, line_position)
+        cap = cv2.VideoCapture(clip)
+        frames = 0
+        while max_frames is None or frames < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            started = time.perf_counter()
+            pipeline.process(frame)
+            timings.append(time.perf_counter() - started)
+            frames += 1
+        cap.release()
+
+        entry = {"clip": os.path.basename(clip), "frames": frames}
+        counts = pipeline.counts()
+        if counts is not None:
+            entry["predicted"] = {"in": counts[0], "out": counts[1]}
+        if isinstance(pipeline, FlaskServerPipeline) and pipeline.people_counts:
+            entry["mean_people_count"] = float(np.mean(pipeline.people_counts))
+        reference = clip_ground_truth(clip)
+        if reference is not None:
+            entry["reference"] = {"in": reference[0], "out": reference[1]}
+            if counts is not None:
+                entry["abs_error"] = abs(counts[0] - reference[0]) + abs(counts[1] - reference[1])
+        per_clip.append(entry)
+
+    timings_ms = np.array(timings, dtype=float) * 1000.0
+    scored = [c for c in per_clip if "abs_error" in c]
+    abs_error = sum(c["abs_error"] for c in scored)
+    total = sum(c["reference"]["in"] + c["reference"]["out"] for c in scored)
+    return {
+        "model": detector.model_id if detector is not None else None,
+        "frames": int(timings_ms.size),
+        "fps": float(timings_ms.size / (timings_ms.sum() / 1000.0)) if timings_ms.size else 0.0,
+        "latency_ms": {
+            "mean": float(timings_ms.mean()) if timings_ms.size else 0.0,
+            "p50": float(np.percentile(timings_ms, 50)) if timings_ms.size else 0.0,
+            "p95": float(np.percentile(timings_ms, 95)) if timings_ms.size else 0.0,
+            "p99": float(np.percentile(timings_ms, 99)) if timings_ms.size else 0.0,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "count": {
+            "clips_scored": len(scored),
+            "abs_error": abs_error if scored else None,
+            "relative_error": (abs_error / total) if total else None,
+        },
+        "clips": per_clip,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline):
+    print(f"\n📊 vs baseline {baseline.get('commit') or '?'}:")
+    for name, current in results["pipelines"].items():
+        previous = baseline.get("pipelines", {}).get(name)
+        if not previous:
+            continue
+        fps_delta = current["fps"] - previous["fps"]
+        p95_delta = current["latency_ms"]["p95"] - previous["latency_ms"]["p95"]
+        line = f"   {name:13s} fps {current['fps']:7.1f} ({fps_delta:+.1f})  p95 {current['latency_ms']['p95']:7.1f} ms ({p95_delta:+.1f})"
+        err, prev_err = current["count"]["relative_error"], previous["count"]["relative_error"]
+        if err is not None and prev_err is not None:
+            line += f"  count err {err:.3f} ({err - prev_err:+.3f})"
+        print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay benchmark for the counting pipelines")
+    ap.add_argument("--clips", default="reference_clips", help="folder of door clips (+ optional <clip>.json)")
+    ap.add_argument("--pipelines", default=",".join(PIPELINES), help="comma-separated subset of: " + ", ".join(PIPELINES))
+    ap.add_argument("--weights", default="best_tj_crowd_model.pt")
+    ap.add_argument("--line-position", type=float, default=0.5)
+    ap.add_argument("--max-frames", type=int, default=None, help="limit frames per clip")
+    ap.add_argument("--output", default="bench_results.json")
+    ap.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    args = ap.parse_args()
+
+    clips = list_clips(args.clips)
+    if not clips:
+        raise SystemExit(f"❌ No clips found in {args.clips}")
+    names = [n.strip() for n in args.pipelines.split(",") if n.strip()]
+    unknown = [n for n in names if n not in PIPELINES]
+    if unknown:
+        raise SystemExit(f"❌ Unknown pipeline(s): {', '.join(unknown)}")
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "clips": [os.path.basename(c) for c in clips],
+        "config": {"weights": args.weights, "line_position": args.line_position, "max_frames": args.max_frames},
+        "pipelines": {},
+    }
+    for name in names:
+        print(f"▶️  Replaying {len(clips)} clip(s) through {name}...")
+        # proses baru per pipeline supaya peak RSS tidak tercampur
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_pipeline, name, clips, args.weights,
+                                     args.line_position, args.max_frames).result()
+        results["pipelines"][name] = result
+        err = result["count"]["relative_error"]
+        print(f"✅ {name}: {result['fps']:.1f} fps, p95 {result['latency_ms']['p95']:.1f} ms, "
+              f"peak RSS {result['peak_rss_mb'] or 0:.0f} MB, count error {'n/a' if err is None else f'{err:.3f}'}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"📝 Results: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TELEMETRY_FLUSH_S = float(os.environ.get("TELEMETRY_FLUSH_S", "1.0"))          # kirim batch tiap N detik
+TELEMETRY_HEARTBEAT_S = float(os.environ.get("TELEMETRY_HEARTBEAT_S", "30"))   # kirim ulang count terakhir walau tidak berubah
+TELEMETRY_QUEUE = int(os.environ.get("TELEMETRY_QUEUE", "1000"))               # perubahan yang ditahan di memori
+TELEMETRY_TIMEOUT = float(os.environ.get("TELEMETRY_TIMEOUT", "2"))
+TELEMETRY_BATCH_MAX = int(os.environ.get("TELEMETRY_BATCH_MAX", "500"))        # perubahan per POST
+TELEMETRY_SPILL_PATH = os.environ.get("TELEMETRY_SPILL_PATH", "telemetry_spill.jsonl")
+TELEMETRY_SPILL_MAX_BYTES = int(os.environ.get("TELEMETRY_SPILL_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+class TelemetryPublisher:
+    """
+    Sends people counts to the backend without touching the capture loop.
+
+    publish() is called every frame but only records a change of the count
+    (in a bounded deque, oldest dropped when full). A background thread
+    posts the changes collected in each flush interval as one request over
+    a keep-alive session. The payload keeps the old single-reading fields
+    (camera_id, people_count, timestamp = latest change) and adds every
+    change in "changes". Batches that cannot be delivered are appended to
+    a JSONL spill file and replayed, oldest first, once the backend answers
+    again. While the backend is down each flush only retries the oldest
+    spilled batch; malformed spill lines (e.g. cut off by a crash) are
+    skipped and counted.
+    """
+
+    def __init__(self, url, camera_id, flush_every=TELEMETRY_FLUSH_S, heartbeat_every=TELEMETRY_HEARTBEAT_S,
+                 max_queue=TELEMETRY_QUEUE, timeout=TELEMETRY_TIMEOUT, batch_max=TELEMETRY_BATCH_MAX,
+                 spill_path=TELEMETRY_SPILL_PATH, spill_max_bytes=TELEMETRY_SPILL_MAX_BYTES):
+        self.url = url
+        self.camera_id = camera_id
+        self.flush_every = flush_every
+        self.heartbeat_every = heartbeat_every
+        self.timeout = timeout
+        self.batch_max = batch_max
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._pending = deque(maxlen=max_queue)
+        self._lock = threading.Lock()
+        self._last_count = None
+        self._last_sent_at = 0.0
+        self._stop = threading.Event()
+        self.published = 0
+        self.batches_sent = 0
+        self.changes_sent = 0
+        self.failures = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.spill_corrupt = 0
+        self.flush_errors = 0
+        self._thread = threading.Thread(target=self._run, name="telemetry-publisher", daemon=True)
+        self._thread.start()
+
+    def publish(self, people_count, timestamp=None):
+        """Record the current count; cheap and non-blocking, call it every frame."""
+        if people_count == self._last_count:
+            return
+        self._last_count = people_count
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append({"people_count": people_count, "timestamp": timestamp or time.time()})
+            self.published += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_every):
+            self._safe_flush()
+        self._safe_flush()
+
+    def _safe_flush(self):
+        # satu flush yang gagal (mis. file spill rusak / disk penuh) tidak boleh menghentikan thread
+        try:
+            self.flush()
+        except Exception as e:
+            self.flush_errors += 1
+            print(f"⚠️ Telemetry flush failed: {e}")
+
+    def flush(self):
+        """Replay spilled batches, then send the changes of this interval (worker thread)."""
+        with self._lock:
+            changes = list(self._pending)
+            self._pending.clear()
+        heartbeat = False
+        if not changes and self._last_count is not None and time.time() - self._last_sent_at >= self.heartbeat_every:
+            # heartbeat tidak di-spill: nilainya sudah basi saat backend kembali
+            changes = [{"people_count": self._last_count, "timestamp": time.time()}]
+            heartbeat = True
+        if not changes:
+            return
+
+        if not self._replay_spill():
+            if not heartbeat:
+                self._spill(changes)
+            return
+        for start in range(0, len(changes), self.batch_max):
+            batch = changes[start:start + self.batch_max]
+            if not self._send(batch):
+                if not heartbeat:
+                    self._spill(changes[start:])
+                return
+
+    def _send(self, changes):
+        payload = {
+            "camera_id": self.camera_id,
+            "people_count": changes[-1]["people_count"],
+            "timestamp": changes[-1]["timestamp"],
+            "changes": changes,
+        }
+        try:
+            self.session.post(self.url, json=payload, timeout=self.timeout).raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.failures += 1
+            if self.failures == 1 or self.failures % 30 == 0:
+                print(f"Error mengirim data ke backend: {e}")
+            return False
+        self.batches_sent += 1
+        self.changes_sent += len(changes)
+        self._last_sent_at = time.time()
+        return True
+
+    def _spill(self, changes):
+        try:
+            if os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) >= self.spill_max_bytes:
+                self.dropped += len(changes)
+                return
+            with open(self.spill_path, "a") as f:
+                if f.tell() and not self._ends_with_newline():
+                    f.write("\n")  # baris terakhir terpotong (crash saat append): jangan sambung ke situ
+                for change in changes:
+                    f.write(json.dumps(change) + "\n")
+            self.spilled += len(changes)
+        except OSError as e:
+            self.dropped += len(changes)
+            print(f"⚠️ Cannot spill telemetry to {self.spill_path}: {e}")
+
+    def _ends_with_newline(self):
+        with open(self.spill_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _read_batch(self, f):
+        """Up to batch_max valid changes from the current position; malformed lines are skipped."""
+        batch = []
+        while len(batch) < self.batch_max:
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                change = json.loads(line)
+            except ValueError:
+                change = None
+            if not isinstance(change, dict) or "people_count" not in change or "timestamp" not in change:
+                self.spill_corrupt += 1
+                continue
+            batch.append(change)
+        return batch
+
+    def _replay_spill(self):
+        """
+        Send the spill file oldest first; True when it is empty afterwards.
+        Stops at the first failed batch, so a down backend costs one batch
+        read per flush; the file is only rewritten when something was sent.
+        """
+        if not os.path.exists(self.spill_path):
+            return True
+        consumed = 0
+        drained = False
+        with open(self.spill_path, "rb") as f:
+            while True:
+                batch = self._read_batch(f)
+                if batch and not self._send(batch):
+                    break
+                consumed = f.tell()
+                if not batch:
+                    drained = True
+                    break
+        if drained:
+            # dihapus setelah file ditutup: di Windows file yang masih terbuka tidak bisa dihapus
+            os.remove(self.spill_path)
+            return True
+        if consumed:
+            # sisa yang belum terkirim ditulis ulang secara atomik
+            tmp_path = self.spill_path + ".tmp"
+            with open(self.spill_path, "rb") as src, open(tmp_path, "wb") as dst:
+                src.seek(consumed)
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, self.spill_path)
+        return False
+
+    def close(self, timeout=5.0):
+        """Stop the worker after a final flush."""
+        self._stop.set()
+        self._thread.join(timeout)
+        self.session.close()
+
+    def stats(self):
+        with self._lock:
+            queued = len(self._pending)
+        return {"queued": queued, "published": self.published, "batches_sent": self.batches_sent,
+                "changes_sent": self.changes_sent, "failures": self.failures, "dropped": self.dropped,
+                "spilled": self.spilled, "spill_corrupt": self.spill_corrupt, "flush_errors": self.flush_errors}
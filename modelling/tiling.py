@@ -0,0 +1,156 @@
+import math
+import os
+
+import numpy as np
+import supervision as sv
+
+# Default mode tile untuk kamera baru; 0 = nonaktif (bisa dinyalakan per kamera lewat /api/cameras/<id>/config)
+TILED_INFERENCE = os.environ.get("TILED_INFERENCE", "0") == "1"
+# Grid tile "kolom x baris" untuk frame lanskap; tiap tile di-upscale detector ke imgsz penuh
+TILE_GRID = os.environ.get("TILE_GRID", "2x2")
+TILE_OVERLAP = float(os.environ.get("TILE_OVERLAP", "0.2"))
+TILE_MAX = int(os.environ.get("TILE_MAX", "6"))
+TILE_NMS_THRESHOLD = float(os.environ.get("TILE_NMS_THRESHOLD", "0.6"))
+
+
+def parse_grid(value):
+    """'2x2', [2, 2] or (2, 2) -> (cols, rows); raises ValueError."""
+    if isinstance(value, str):
+        value = value.lower().split("x")
+    try:
+        cols, rows = (int(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError("tiling.grid must look like \"2x2\" or [2, 2]")
+    if not (1 <= cols <= 8 and 1 <= rows <= 8) or cols * rows < 2:
+        raise ValueError("tiling.grid needs 1..8 columns and rows and at least 2 tiles")
+    return cols, rows
+
+
+def _axis_spans(length, count, overlap):
+    """count overlapping (start, end) spans covering 0..length."""
+    if count <= 1:
+        return [(0, length)]
+    tile = int(math.ceil(length / (count - (count - 1) * overlap)))
+    step = (length - tile) / (count - 1)
+    return [(int(round(i * step)), min(length, int(round(i * step)) + tile)) for i in range(count)]
+
+
+def nms(xyxy, scores, threshold):
+    """
+    Greedy class-agnostic NMS on intersection-over-smaller-box.
+
+    IoS instead of IoU because a person cut by a tile edge gives a partial
+    box that lies inside the full box of the neighbouring tile; its IoU is
+    low but its IoS is close to 1. Returns the indices to keep.
+    """
+    if len(xyxy) == 0:
+        return np.empty(0, dtype=int)
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(xyxy[i, 2], xyxy[rest, 2]) - np.maximum(xyxy[i, 0], xyxy[rest, 0]), 0, None)
+        h = np.clip(np.minimum(xyxy[i, 3], xyxy[rest, 3]) - np.maximum(xyxy[i, 1], xyxy[rest, 1]), 0, None)
+        ios = (w * h) / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[ios <= threshold]
+    return np.array(keep, dtype=int)
+
+
+class Tiler:
+    """
+    Sliced inference for dense stops.
+
+    The frame (or door ROI crop) is cut into a grid of overlapping tiles,
+    each smaller than the frame, so the detector upscales it to its input
+    size and small, far-away people get more pixels. The grid is cols x rows
+    for a landscape frame; rows (or cols for a portrait frame) are reduced
+    so tiles stay roughly square, e.g. a 640x240 door band gets 2x1. By
+    default the whole frame is added too so large people close to the door
+    are not only seen in pieces. All slices go to the detector as one batch;
+    the detections are shifted back to frame coordinates and merged with
+    cross-tile NMS. The grid shrinks when it would exceed max_tiles.
+    """
+
+    def __init__(self, grid=TILE_GRID, overlap=TILE_OVERLAP, max_tiles=TILE_MAX,
+                 include_full=True, nms_threshold=TILE_NMS_THRESHOLD):
+        self.grid = parse_grid(grid)
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.include_full = include_full
+        self.nms_threshold = nms_threshold
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from the JSON config of /api/cameras/<id>/config; None/false disables tiling."""
+        if not config:
+            return None
+        if config is True:
+            return cls()
+        if not isinstance(config, dict):
+            raise ValueError("tiling must be an object, true or null")
+        grid = parse_grid(config.get("grid", TILE_GRID))
+        try:
+            tiler = cls(
+                grid=grid,
+                overlap=float(config.get("overlap", TILE_OVERLAP)),
+                max_tiles=int(config.get("max_tiles", TILE_MAX)),
+                include_full=bool(config.get("include_full", True)),
+                nms_threshold=float(config.get("nms_threshold", TILE_NMS_THRESHOLD)),
+            )
+        except (TypeError, ValueError):
+            raise ValueError("Invalid tiling config")
+        if not 0.0 <= tiler.overlap < 0.9 or tiler.max_tiles < 2:
+            raise ValueError("tiling needs 0 <= overlap < 0.9 and max_tiles >= 2")
+        return tiler
+
+    def tiles(self, frame_shape):
+        """Tile rectangles (x0, y0, x1, y1) within the tile budget."""
+        h, w = frame_shape[:2]
+        cols, rows = self.grid
+        if w >= h:
+            rows = min(rows, max(1, int(round(cols * h / w))))
+        else:
+            cols = min(cols, max(1, int(round(rows * w / h))))
+        budget = max(1, self.max_tiles - (1 if self.include_full else 0))
+        while cols * rows > budget:
+            if cols >= rows:
+                cols -= 1
+            else:
+                rows -= 1
+        return [(x0, y0, x1, y1) for y0, y1 in _axis_spans(h, rows, self.overlap)
+                for x0, x1 in _axis_spans(w, cols, self.overlap)]
+
+    def detect(self, frame, predict_many):
+        """predict_many(list_of_frames) -> list of sv.Detections, called once with every slice."""
+        tiles = self.tiles(frame.shape)
+        if len(tiles) == 1:
+            return predict_many([frame])[0]
+
+        crops = [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles]
+        offsets = [(x0, y0) for x0, y0, _, _ in tiles]
+        if self.include_full:
+            crops.append(frame)
+            offsets.append((0, 0))
+
+        shifted = []
+        for detections, (x0, y0) in zip(predict_many(crops), offsets):
+            if len(detections):
+                detections.xyxy = detections.xyxy + np.array([x0, y0, x0, y0], dtype=detections.xyxy.dtype)
+                shifted.append(detections)
+        if not shifted:
+            return sv.Detections.empty()
+        merged = sv.Detections.merge(shifted)
+        scores = merged.confidence if merged.confidence is not None else np.ones(len(merged))
+        return merged[nms(merged.xyxy, scores, self.nms_threshold)]
+
+    def to_dict(self):
+        return {
+            "grid": list(self.grid),
+            "overlap": self.overlap,
+            "max_tiles": self.max_tiles,
+            "include_full": self.include_full,
+            "nms_threshold": self.nms_threshold,
+        }
@@ -2,17 +2,20 @@ import cv2
 import numpy as np
 import os
 import argparse
-from ultralytics import YOLO
+from detector_backend import load_detector
+from motion_gate import MotionGate
+from forecast_client import ForecastClient
+from telemetry_publisher import TelemetryPublisher
 import supervision as sv
-import requests # <<< BARIS BARU: Impor pustaka requests
 import time     # <<< BARIS BARU: Impor pustaka time
 
 def main(source_video_path):    
     # 1. SETUP - Inisialisasi Model, Video, dan Tracker
     
     # Inisialisasi model YOLOv8 (akan mengunduh jika belum ada)
-    #model = YOLO("yolov8n.pt") 
-    model = YOLO("best_tj_crowd_model.pt")  # model yang sudah dilatih khusus untuk deteksi orang
+    #detector = load_detector("yolov8n.pt") 
+    # model yang sudah dilatih khusus untuk deteksi orang; diekspor ke ONNX/OpenVINO jika tersedia
+    detector = load_detector("best_tj_crowd_model.pt")
     
     # Menggunakan kamera real-time jika tidak ada path video yang diberikan
     if source_video_path:
@@ -41,9 +44,15 @@ def main(source_video_path):
     byte_tracker = sv.ByteTrack()
     box_annotator = sv.BoxAnnotator(thickness=2)
 
+    # Pre-filter MOG2: YOLO hanya dijalankan jika ada gerakan di tengah frame (atau tiap K frame)
+    motion_gate = MotionGate()
+    people_count = 0
+
     # <<< BARIS BARU: Konfigurasi Backend
     BACKEND_URL = "http://localhost:5000/update_count" # Ganti jika backend Anda di URL lain
     CAMERA_ID = "tj_halte_a" # ID unik untuk kamera ini (misal: nama halte)
+    # Pengiriman di thread terpisah: hanya perubahan count, dikumpulkan per batch; backend lambat tidak menahan video
+    publisher = TelemetryPublisher(BACKEND_URL, CAMERA_ID)
     # >>>
 
     # 2. PROSES - Loop Utama
@@ -52,27 +61,19 @@ def main(source_video_path):
         if not ret:
             break
 
-        results = model(frame)[0]
-        detections = sv.Detections.from_ultralytics(results)
-        detections = detections[detections.class_id == 0] # Filter hanya untuk 'person'
+        motion = motion_gate.should_detect(frame, frame.shape[0] // 2)
+        if motion:
+            detections = detector.detect(frame) # hanya 'person'
+        else:
+            detections = sv.Detections.empty()  # tracker tetap jalan, umur track bertambah
         detections = byte_tracker.update_with_detections(detections)
         
-        # Hitung jumlah orang secara langsung
-        people_count = len(detections)
-
-        # <<< BARIS BARU: Mengirim data ke backend
-        payload = {
-            "camera_id": CAMERA_ID,
-            "people_count": people_count,
-            "timestamp": time.time() # Waktu saat data dikirim
-        }
-        try:
-            # Menggunakan POST request untuk mengirim data JSON
-            # Timeout 1 detik agar tidak memblokir video terlalu lama jika backend lambat
-            requests.post(BACKEND_URL, json=payload, timeout=1)
-        except requests.exceptions.RequestException as e:
-            # Cetak error jika pengiriman gagal (misal: backend belum jalan)
-            print(f"Error mengirim data ke backend: {e}")
+        # Hitung jumlah orang secara langsung (frame tanpa gerakan: pakai hitungan terakhir)
+        if motion:
+            people_count = len(detections)
+
+        # <<< BARIS BARU: Mengirim data ke backend (non-blocking, lihat telemetry_publisher.py)
+        publisher.publish(people_count, time.time())
         # >>>
 
         # Visualisasi
@@ -87,6 +88,7 @@ def main(source_video_path):
             break
 
     # 3. CLEANUP - Akhir Program
+    publisher.close()  # kirim perubahan terakhir
     cap.release()
     out_video.release()
     cv2.destroyAllWindows()
@@ -105,21 +107,20 @@ STOPS_NB = [
 ]
 STOPS_SB = list(reversed(STOPS_NB))
 
-# pakai requests kalau ada; fallback ke urllib
-try:
-    import requests
-    def http_get(url, params, timeout=3):
-        return requests.get(url, params=params, timeout=timeout).json()
-except Exception:
-    import urllib.parse, urllib.request, json as _json
-    def http_get(url, params, timeout=3):
-        full = url + "?" + urllib.parse.urlencode(params)
-        with urllib.request.urlopen(full, timeout=timeout) as r:
-            return _json.loads(r.read().decode("utf-8"))
+# Satu client async untuk semua LoadTracker: commit tidak pernah menunggu jaringan
+_forecast_client = None
+
+def get_forecast_client():
+    global _forecast_client
+    if _forecast_client is None:
+        _forecast_client = ForecastClient(FORECAST_URL)
+    return _forecast_client
 
 class LoadTracker:
-    def __init__(self, cap=80, direction=DEFAULT_DIRECTION):
+    def __init__(self, cap=80, direction=DEFAULT_DIRECTION, bus_id=None, client=None):
         self.cap = cap
+        self.client = client     # ForecastClient; default: client bersama ke FORECAST_URL
+        self.bus_id = bus_id     # kalau di-set, server memakai ulang state forecast bus ini antar halte
         self.direction = direction
         self.order = STOPS_NB if direction == "BlokM→Kota" else STOPS_SB
         self.idx = 0  # index halte saat ini
@@ -137,8 +138,12 @@ class LoadTracker:
         elif dir_str == "up":   # orang keluar bus
             self.buf_alight += 1
 
-    def commit_and_forecast(self):
-        """Panggil saat bus BERANGKAT dari halte (pintu tutup)."""
+    def commit_and_forecast(self, callback=None):
+        """
+        Panggil saat bus BERANGKAT dari halte (pintu tutup).
+        Tidak memblokir: return Future berisi list forecast ([] kalau gagal);
+        callback(forecasts) opsional dipanggil dari thread client.
+        """
         # update load aktual berdasarkan deteksi IoT di halte ini
         self.load = max(0.0, min(self.cap, self.load + self.buf_board - self.buf_alight))
         self.buf_board = 0
@@ -150,13 +155,10 @@ class LoadTracker:
             "current_load": str(self.load),
             "cap": str(self.cap),
         }
-        try:
-            data = http_get(FORECAST_URL, params, timeout=3)
-            forecasts = data.get("forecasts", [])
-        except Exception as e:
-            print("[forecast] error:", e)
-            forecasts = []
-        return forecasts
+        if self.bus_id:
+            params["bus_id"] = self.bus_id
+        client = self.client or get_forecast_client()
+        return client.submit(params, callback)
 
     def next_stop(self):
         self.idx = min(self.idx + 1, len(self.order) - 1)